@@ -0,0 +1,119 @@
+"""
+Module handling alignment of retention times across injections. Over a long run, retention times drift,
+so a peak picked on one injection sits a little earlier or later on the others; the shift of each
+injection relative to a reference injection is estimated by cross-correlating their signals.
+
+Cross-correlations are computed with FFTs for all injections sharing a time axis at once (one injection
+per row of a 2D array), so aligning thousands of injections takes a handful of batched transforms.
+"""
+import numpy as np
+
+# Largest shift (in seconds) looked for in either direction
+MAX_SHIFT_SECONDS = 30
+# Injections that line up with the reference worse than this (correlation coefficient from -1 to 1, at
+# the best lag) are taken not to be shifted, as there's likely no matching feature to align
+MIN_CORRELATION = 0.5
+# Maximum number of injections stacked into one array by `estimate_shifts`
+CHUNK_SIZE = 256
+
+def fft_size(size):
+    """Smallest size of at least `size` that is a product of 2s, 3s and 5s (which FFTs handle fastest)."""
+    best = 1 << max(0, size - 1).bit_length()
+    power_of_5 = 1
+    while power_of_5 < best:
+        odd_part = power_of_5
+        while odd_part < best:
+            candidate = odd_part
+            while candidate < size:
+                candidate *= 2
+            best = min(best, candidate)
+            odd_part *= 3
+        power_of_5 *= 5
+    return best
+
+def cross_correlation_lags(reference, targets, max_lag):
+    """
+    Lag (in samples, possibly fractional) of each row of `targets` relative to the 1D `reference`: the
+    shift within [-`max_lag`, `max_lag`] for which `reference` best lines up with the row. Each row must
+    be 2 * `max_lag` samples longer than `reference`, covering `max_lag` samples before and after it.
+    Rows that don't line up well with the reference at any lag (see `MIN_CORRELATION`) get a lag of 0.
+    """
+    size = fft_size(targets.shape[1])
+    lag_count, reference_size = 2 * max_lag + 1, reference.size
+    # The reference has zero mean, so a constant offset between injections doesn't matter
+    reference = reference - reference.mean()
+    targets = targets - targets.mean(axis=1, keepdims=True)
+    reference_spectrum = np.conj(np.fft.rfft(reference, size))
+    target_spectra = np.fft.rfft(targets, size, axis=1)
+    # Correlation at each lag from -max_lag to max_lag (no wraparound, since the FFT size covers the targets)
+    correlation = np.fft.irfft(target_spectra * reference_spectrum, size, axis=1)[:, :lag_count]
+
+    # Normalized by the variation of the part of the target lined up at each lag, since otherwise lags that
+    # take in more of a peak win even when it lines up worse (sums over each part from cumulative sums)
+    sums = np.cumsum(np.pad(targets, ((0, 0), (1, 0))), axis=1)
+    square_sums = np.cumsum(np.pad(targets ** 2, ((0, 0), (1, 0))), axis=1)
+    window_sums = sums[:, reference_size:reference_size + lag_count] - sums[:, :lag_count]
+    window_square_sums = square_sums[:, reference_size:reference_size + lag_count] - square_sums[:, :lag_count]
+    variation = np.maximum(window_square_sums - window_sums ** 2 / reference_size, 0)
+    norm = np.sqrt(variation * np.sum(reference ** 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.where(norm > 0, correlation / norm, 0)
+
+    best = np.argmax(correlation, axis=1)
+    # Sub-sample refinement: vertex of the parabola through the best lag and its neighbours
+    inner = np.clip(best, 1, max(2 * max_lag - 1, 1))
+    rows = np.arange(correlation.shape[0])
+    if correlation.shape[1] >= 3:
+        before, at, after = (correlation[rows, inner + offset] for offset in (-1, 0, 1))
+        curvature = before - 2 * at + after
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vertex = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0)
+        fraction = np.where(best == inner, np.clip(vertex, -0.5, 0.5), 0)
+    else:
+        fraction = np.zeros(rows.size)
+    matched = correlation[rows, best] >= MIN_CORRELATION
+    return np.where(matched, best + fraction - max_lag, 0.0)
+
+def estimate_shifts(reference, injections_by_key, start_x=None, end_x=None):
+    """
+    Estimate the retention time shift (in seconds; positive when features occur later than on the
+    reference) of every injection (`injections.Injection`s or equivalent) keyed in `injections_by_key`,
+    relative to the injection `reference`. Only the part of the reference between `start_x` and `end_x`
+    (the whole injection if not given) is lined up, so the shift can be estimated locally around a peak.
+
+    Injections are grouped by time axis and each group is aligned in batches of up to `CHUNK_SIZE`.
+
+    Returns a dict of key to shift for every injection.
+    """
+    keys_by_grid = {}
+    for key, injection in injections_by_key.items():
+        grid = injection.grid
+        keys_by_grid.setdefault((grid.start, grid.stop, grid.size), []).append(key)
+
+    reference_grid = reference.grid
+    reference_x, reference_y = reference_grid.values(), np.asarray(reference['y'], dtype=np.float64)
+    start_x = reference_grid.start if start_x is None else start_x
+    end_x = reference_grid.stop if end_x is None else end_x
+
+    shifts = {}
+    for keys in keys_by_grid.values():
+        grid = injections_by_key[keys[0]].grid
+        if grid.size < 2:
+            shifts.update((key, 0.0) for key in keys)
+            continue
+        max_lag = max(1, round(MAX_SHIFT_SECONDS / grid.step))
+        # Reference segment resampled onto this time axis (a no-op when the axes are the same)
+        start, end = (int(index) for index in grid.index_of([start_x, end_x]))
+        segment = np.interp(grid.values_at(np.arange(start, end + 1)), reference_x, reference_y)
+        # Target segments extend `max_lag` past either side, padded by the edge values beyond the injection
+        window_start, window_end = start - max_lag, end + max_lag + 1
+        clipped_start, clipped_end = max(window_start, 0), min(window_end, grid.size)
+        padding = ((0, 0), (clipped_start - window_start, window_end - clipped_end))
+
+        for chunk_start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + CHUNK_SIZE]
+            targets = np.stack([injections_by_key[key]['y'][clipped_start:clipped_end] for key in chunk])
+            targets = np.pad(targets.astype(np.float64, copy=False), padding, mode='edge')
+            lags = cross_correlation_lags(segment, targets, max_lag)
+            shifts.update((key, float(lag * grid.step)) for key, lag in zip(chunk, lags))
+    return shifts
@@ -0,0 +1,236 @@
+"""
+Module handling baselines estimated over a whole injection at once, as opposed to the local baselines of
+`numericintegrate` which are fit around each peak. These suit signals whose baseline drifts over the
+course of a run (as is common on the TCD channel).
+
+Both estimators take time linear in the number of points and work on many injections at once (one per
+row of a 2D array). Since the baseline of an injection doesn't depend on the peak being integrated,
+results are cached per signal, so every peak on a page and every spread reuses them.
+"""
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Asymmetric least squares: the baseline ignores features shorter than roughly this many seconds
+ALS_CUTOFF_SECONDS = 60
+# Weight of points above the baseline (points below get 1 - this), i.e. how strongly peaks are ignored
+ALS_ASYMMETRY = 0.001
+ALS_ITERATIONS = 10
+# The fit is solved on block means of the signal with about this many blocks per cutoff (the baseline
+# can't follow anything shorter anyway), then interpolated back to every point
+ALS_POINTS_PER_CUTOFF = 20
+# Rolling ball: width of the ball (structuring element), which should be wider than any peak
+ROLLING_BALL_SECONDS = 60
+# Most recently used baselines (one per injection signal) are kept until they total this many bytes
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+_baselines = OrderedDict()
+_cached_bytes = 0
+
+def moving_average(y_stack, width):
+    """Moving average of `width` points along each row of `y_stack`, with the edges padded by their values."""
+    if width < 2:
+        return y_stack
+    pad_before = width // 2
+    padded = np.pad(y_stack, ((0, 0), (pad_before, width - 1 - pad_before)), mode='edge')
+    sums = np.cumsum(padded, axis=1)
+    sums = np.concatenate([np.zeros((sums.shape[0], 1)), sums], axis=1)
+    return (sums[:, width:] - sums[:, :-width]) / width
+
+def running_extreme(y_stack, width, ufunc):
+    """
+    Minimum or maximum (`ufunc` is `np.minimum` or `np.maximum`) of the `width` points centered on each
+    point along each row of `y_stack`, with the edges padded by their values.
+
+    Uses the van Herk/Gil-Werman algorithm: cumulative extremes forward and backward within blocks of
+    `width` points, so any window is covered by the end of one block and the start of the next.
+    """
+    rows, size = y_stack.shape
+    pad_before = width // 2
+    padded_size = -(-(size + width - 1) // width) * width
+    padded = np.pad(y_stack, ((0, 0), (pad_before, padded_size - size - pad_before)), mode='edge')
+    blocks = padded.reshape(rows, -1, width)
+    forward = ufunc.accumulate(blocks, axis=2).reshape(rows, -1)
+    backward = ufunc.accumulate(blocks[..., ::-1], axis=2)[..., ::-1].reshape(rows, -1)
+    return ufunc(backward[:, :size], forward[:, width - 1:width - 1 + size])
+
+# 2x2 block arithmetic, with blocks as tuples of their entries (each an array, so that many blocks are
+# processed elementwise at once) and vectors as tuples of their 2 components
+def block_product(x, y):
+    a, b, c, d = x
+    e, f, g, h = y
+    return (a * e + b * g, a * f + b * h, c * e + d * g, c * f + d * h)
+
+def block_inverse(x):
+    a, b, c, d = x
+    determinant = a * d - b * c
+    return (d / determinant, -b / determinant, -c / determinant, a / determinant)
+
+def block_apply(x, v):
+    a, b, c, d = x
+    p, q = v
+    return (a * p + b * q, c * p + d * q)
+
+def solve_block_tridiagonal(lower, diagonal, upper, rhs):
+    """
+    Solve block tridiagonal systems with 2x2 blocks by cyclic reduction. `diagonal` holds the blocks on
+    the diagonal and `lower`/`upper` the blocks left/right of them (zero where outside the matrix), each
+    as a tuple of its 4 entries with shape (systems, block rows); `rhs` is a tuple of 2 such arrays.
+
+    Each level eliminates every other block row at once, so the whole solve is a logarithmic number of
+    vectorized steps taking linear time overall. Stable for symmetric positive definite matrices.
+    """
+    take = lambda parts, start: tuple(part[:, start::2] for part in parts)
+    count = diagonal[0].shape[1]
+    if count == 1:
+        return block_apply(block_inverse(diagonal), rhs)
+
+    even_count, odd_count = (count + 1) // 2, count // 2
+    def neighbours(parts, before, size):
+        """`parts` shifted by one block row (right if `before`), zero where shifted in and cut to `size` rows."""
+        zero = np.zeros((parts[0].shape[0], 1))
+        return tuple(np.concatenate([zero, part] if before else [part, zero], axis=1)[:, :size] for part in parts)
+    pad = lambda parts, before: neighbours(parts, before, even_count)
+
+    odd_inverse = block_inverse(take(diagonal, 1))
+    odd_lower, odd_upper, odd_rhs = take(lower, 1), take(upper, 1), take(rhs, 1)
+    left = block_product(take(lower, 0), pad(odd_inverse, True))
+    right = block_product(take(upper, 0), pad(odd_inverse, False))
+    negate = lambda parts: tuple(-part for part in parts)
+    subtract = lambda x, *ys: tuple(part - sum(y[index] for y in ys) for index, part in enumerate(x))
+    reduced = solve_block_tridiagonal(
+        negate(block_product(left, pad(odd_lower, True))),
+        subtract(take(diagonal, 0), block_product(left, pad(odd_upper, True)), block_product(right, pad(odd_lower, False))),
+        negate(block_product(right, pad(odd_upper, False))),
+        subtract(take(rhs, 0), block_apply(left, pad(odd_rhs, True)), block_apply(right, pad(odd_rhs, False))))
+
+    # Back-substitute the eliminated rows from their (now known) neighbours
+    previous_even = tuple(part[:, :odd_count] for part in reduced)
+    next_even = neighbours(tuple(part[:, 1:] for part in reduced), False, odd_count)
+    odd_solution = block_apply(odd_inverse, subtract(
+        odd_rhs, block_apply(odd_lower, previous_even), block_apply(odd_upper, next_even)))
+
+    solution = tuple(np.empty((part.shape[0], count)) for part in rhs)
+    for part, even_part, odd_part in zip(solution, reduced, odd_solution):
+        part[:, ::2], part[:, 1::2] = even_part, odd_part
+    return solution
+
+def solve_pentadiagonal(main, first, second, rhs):
+    """
+    Solve symmetric positive definite pentadiagonal systems, one per row of `rhs`. `main`, `first` and
+    `second` hold the main diagonal and the first and second diagonals above it (padded with trailing
+    zeros to the same length), with one row per system.
+    """
+    rows, size = rhs.shape
+    if size % 2:
+        # Add a decoupled equation x = 0 so the points pair up into 2x2 blocks
+        pad = lambda array, value: np.concatenate([array, np.full((rows, 1), value)], axis=1)
+        return solve_pentadiagonal(pad(main, 1.0), pad(first, 0.0), pad(second, 0.0), pad(rhs, 0.0))[:, :size]
+
+    # Pairs of points (2j, 2j + 1) form block rows
+    zeros = np.zeros((rows, size // 2))
+    diagonal = (main[:, ::2], first[:, ::2], first[:, ::2], main[:, 1::2])
+    upper = (second[:, ::2], zeros, first[:, 1::2], second[:, 1::2])
+    # Lower blocks are the transposes of the upper blocks of the previous block row
+    previous = lambda part: np.concatenate([zeros[:, :1], part[:, :-1]], axis=1)
+    lower = (previous(upper[0]), previous(upper[2]), previous(upper[1]), previous(upper[3]))
+    even, odd = solve_block_tridiagonal(lower, diagonal, upper, (rhs[:, ::2], rhs[:, 1::2]))
+    solution = np.empty((rows, size))
+    solution[:, ::2], solution[:, 1::2] = even, odd
+    return solution
+
+def block_means(y_stack, factor):
+    """Means of consecutive blocks of `factor` points along each row of `y_stack` (the last block padded by its edge)."""
+    rows, size = y_stack.shape
+    padded = np.pad(y_stack, ((0, 0), (0, -size % factor)), mode='edge')
+    return padded.reshape(rows, -1, factor).mean(axis=2)
+
+def als(y_stack, step):
+    """
+    Asymmetric least squares baseline of each row of `y_stack` (sampled every `step` seconds): a smooth
+    curve fit with much less weight on points above it than below, so it runs along the bottom of peaks.
+    """
+    rows, size = y_stack.shape
+    factor = max(1, int(ALS_CUTOFF_SECONDS / (step * ALS_POINTS_PER_CUTOFF))) if step else 1
+    reduced = block_means(y_stack, factor)
+    reduced_size = reduced.shape[1]
+    if reduced_size < 4:
+        return np.repeat(y_stack.mean(axis=1, keepdims=True), size, axis=1)
+
+    # Penalty on the second differences of the baseline, which is pentadiagonal
+    smoothness = (ALS_CUTOFF_SECONDS / (2 * np.pi * step * factor)) ** 4
+    penalty_main = np.full(reduced_size, 6.0)
+    penalty_main[[0, -1]], penalty_main[[1, -2]] = 1, 5
+    penalty_first = np.full(reduced_size, -4.0)
+    penalty_first[[0, -2]], penalty_first[-1] = -2, 0
+    penalty_second = np.ones(reduced_size)
+    penalty_second[-2:] = 0
+    first = np.broadcast_to(smoothness * penalty_first, (rows, reduced_size))
+    second = np.broadcast_to(smoothness * penalty_second, (rows, reduced_size))
+
+    weights = np.ones((rows, reduced_size))
+    for _ in range(ALS_ITERATIONS):
+        baseline = solve_pentadiagonal(weights + smoothness * penalty_main, first, second, weights * reduced)
+        weights = np.where(reduced > baseline, ALS_ASYMMETRY, 1 - ALS_ASYMMETRY)
+    if factor == 1:
+        return baseline
+
+    # Linear interpolation between block centers (held flat past the first and last)
+    positions = np.clip((np.arange(size) - (factor - 1) / 2) / factor, 0, reduced_size - 1)
+    below = np.minimum(positions.astype(np.intp), reduced_size - 2)
+    fractions = positions - below
+    return baseline[:, below] * (1 - fractions) + baseline[:, below + 1] * fractions
+
+def rolling_ball(y_stack, step):
+    """
+    Rolling ball baseline of each row of `y_stack` (sampled every `step` seconds): the morphological opening
+    of the signal (highest curve a flat ball can reach from below), smoothed by a moving average of the same
+    width so it has no corners.
+    """
+    width = (max(1, round(ROLLING_BALL_SECONDS / step)) if step else 1) | 1 # Odd so windows are centered
+    opened = running_extreme(running_extreme(y_stack, width, np.minimum), width, np.maximum)
+    return moving_average(opened, width)
+
+def cached(method, x_data, y_stack):
+    """
+    Baseline by `method` (key of `METHODS`) of each row of `y_stack`, all sampled at the evenly spaced
+    `x_data`. Only rows whose baseline isn't cached yet are computed, in one batch.
+    """
+    global _cached_bytes
+    x_digest = hashlib.blake2b(np.ascontiguousarray(x_data).tobytes(), digest_size=20).digest()
+    keys = [
+        (method, x_digest, hashlib.blake2b(np.ascontiguousarray(row).tobytes(), digest_size=20).digest())
+        for row in y_stack]
+    result = {key: _baselines[key] for key in keys if key in _baselines}
+    missing = [index for index, key in enumerate(keys) if key not in result]
+    if missing:
+        step = (x_data[-1] - x_data[0]) / (x_data.size - 1) if x_data.size > 1 else 0.0
+        computed = METHODS[method]['func'](np.asarray(y_stack[missing], dtype=np.float64), step)
+        # Copied so that evicting some rows of a batch actually frees them
+        result.update((keys[index], row.copy()) for index, row in zip(missing, computed))
+
+    for key in keys:
+        if key not in _baselines:
+            _cached_bytes += result[key].nbytes
+        _baselines[key] = result[key]
+        _baselines.move_to_end(key)
+    while _cached_bytes > CACHE_MAX_BYTES and _baselines:
+        _, baseline = _baselines.popitem(last=False)
+        _cached_bytes -= baseline.nbytes
+    return np.stack([result[key] for key in keys])
+
+def describe(method):
+    """Parameters of `method` as a dict, used as the pure representation of its baselines."""
+    return {'method': method, **{name: value() for name, value in METHODS[method]['params'].items()}}
+
+METHODS = {
+    'Asymmetric least squares': {
+        'func': als,
+        # Read when describing so that changes to the module constants are reflected
+        'params': {'cutoff_seconds': lambda: ALS_CUTOFF_SECONDS, 'asymmetry': lambda: ALS_ASYMMETRY},
+    },
+    'Rolling ball': {
+        'func': rolling_ball,
+        'params': {'width_seconds': lambda: ROLLING_BALL_SECONDS},
+    },
+}
@@ -0,0 +1,59 @@
+"""
+Module handling level-of-detail decimation of injection signals for display. Long, high-rate injections
+have many more samples than there are pixels across a plot, so most of them would be drawn over each
+other; instead, only the smallest and largest sample of each bucket of consecutive samples is drawn,
+which looks the same (every peak and dip still reaches its true extreme) at a fraction of the cost.
+
+The buckets come in levels of increasing size, each merging `LEVEL_FACTOR` buckets of the level below,
+so that whatever the zoom, a level with about one bucket per pixel is at hand. Drawn points are always
+real samples, and are identified by their index into the full signal.
+"""
+import numpy as np
+
+# Number of buckets of one level merged into each bucket of the next (coarser) level
+LEVEL_FACTOR = 4
+# Minimum number of buckets drawn per pixel of plot width; the finest level is used past this
+BUCKETS_PER_PIXEL = 1
+
+def min_max_levels(y):
+    """
+    Multi-resolution min/max envelope of the 1D signal `y`. Level k (from 1, as item k - 1 of the returned
+    list) has buckets of `LEVEL_FACTOR` ** k consecutive samples and holds the indices of the smallest and
+    largest sample of each bucket, as one sorted array of indices into `y`. Level 0 (every sample) is
+    implied. Levels are added until a level has a single bucket.
+    """
+    levels = []
+    index_dtype = np.int32 if y.size < 2 ** 31 else np.int64
+    argmin = argmax = np.arange(y.size, dtype=index_dtype)
+    while argmin.size > 1:
+        # Extrema of each bucket from those of the buckets it merges (the last bucket may be partial)
+        merged = []
+        for extremes, pick in ((argmin, np.argmin), (argmax, np.argmax)):
+            padding = -extremes.size % LEVEL_FACTOR
+            groups = np.pad(extremes, (0, padding), mode='edge').reshape(-1, LEVEL_FACTOR)
+            merged.append(groups[np.arange(groups.shape[0]), pick(y[groups], axis=1)])
+        argmin, argmax = merged
+        # Min and max of each bucket in time order, then buckets in order
+        level = np.sort(np.stack([argmin, argmax], axis=1), axis=1).ravel()
+        levels.append(level[np.concatenate(([True], level[1:] != level[:-1]))])
+    return levels
+
+def visible_indices(levels, size, start, stop, pixels):
+    """
+    Indices (into the full signal of `size` samples, with envelope `levels` from `min_max_levels`) of the
+    samples to draw so that samples `start` to `stop` (exclusive) look right across `pixels` of plot
+    width: those of the coarsest level with at least `BUCKETS_PER_PIXEL` buckets per pixel, along with a
+    bucket beyond either end so the line runs on past the edges of the plot.
+    """
+    start, stop = max(int(start), 0), min(int(stop), size)
+    samples_per_bucket = max(stop - start, 1) / max(pixels * BUCKETS_PER_PIXEL, 1)
+    level = 0
+    while level < len(levels) and LEVEL_FACTOR ** (level + 1) <= samples_per_bucket:
+        level += 1
+    if level == 0:
+        return np.arange(max(start - 1, 0), min(stop + 1, size))
+    indices, bucket_size = levels[level - 1], LEVEL_FACTOR ** level
+    first_sample, last_sample = max(start - bucket_size, 0), min(stop + bucket_size, size) - 1
+    first, last = np.searchsorted(indices, first_sample, side='right'), np.searchsorted(indices, last_sample)
+    # Ends of the range are kept too, so the line spans all of it (e.g. from the very start of the signal)
+    return np.concatenate(([first_sample], indices[first:last], [last_sample])).astype(indices.dtype)
@@ -10,74 +10,316 @@ binary EC-Lab CA files (*.mpr) as EC-Lab offers built-in "export to text" functi
 from datetime import datetime, timedelta
 import re
 import os
+import warnings
+import itertools
+import tempfile
+import shutil
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from util import filetype
+from algos.injections import UniformGrid, Injection, LazyInjectionList
 
 # Using classes in this module purely as additional namespaces; all methods are static
 # and classes are not meant to be instantiated.
 
 class GC:
     suffix_regex = rf'(\d+)(?:\.)+(?:{filetype.GC})$'
+    meta_regex = re.compile(r'<([A-Za-z ]*)>')
+    # Injection lists shorter than this are always parsed serially by `parse_list`
+    PARALLEL_MIN_FILES = 16
+    # Files each worker process may have parsed ahead of their being consumed by `iter_parsed`
+    PARSE_AHEAD_PER_WORKER = 4
+    # Metadata fields read by `scan_file`, as named by `parse_header`
+    SCAN_FIELDS = ('date_string', 'time_string', 'sample_rate', 'num_readings')
+    # Row layout of the metadata table returned by `scan_list`
+    META_DTYPE = np.dtype([
+        ('index', np.int64), ('start_time', 'datetime64[s]'), ('sample_rate', np.float64), ('num_readings', np.int64)])
 
     @staticmethod
-    # Parse raw data from a single GC injection into a numpy array with metadata fields
-    def parse_file(handle):
-        # Parse relevant information from metadata lines at start of file
-        # Metadata lines begin with <FIELD_NAME> (might contain spaces)
-        meta_count = 0
-        line = handle.readline()
-        while match := re.search(r'<([A-Za-z ]*)>', line):
-            meta_count += 1
-            field_name = match.group(1).lower()
-            val_str = line.partition('=')[2].strip()
-
-            if field_name == 'date':
-                # E.g. '12-02-2020' is represented as '12- 2-2020' for some reason
-                date_string = val_str.replace(' ', '0')
-            elif field_name == 'time':
-                time_string = val_str.replace(' ', '0')
-            elif field_name == 'rate':
-                # Find GC sample rate in readings per second (Hz); can be decimal
-                sample_rate = float(re.search(r'\d+(.\d+)?', line).group())
-            elif field_name == 'size':
-                # Total number of readings collected during the current injection
-                num_readings = int(re.search(r'\d+', line).group())
+    def parse_header(handle):
+        """
+        Parse relevant information from metadata lines at start of file, reading each line exactly once.
 
+        Returns the metadata as a dict along with the first non-metadata line, which has already been
+        consumed from `handle` and therefore belongs to the data block.
+        """
+        meta = {}
+        line = handle.readline()
+        while GC.parse_meta_line(line, meta):
             line = handle.readline()
+        return (meta, line)
+
+    @staticmethod
+    def parse_meta_line(line, meta):
+        """
+        If `line` is a metadata line, store any relevant field it contains in `meta` and return True;
+        otherwise return False. Metadata lines begin with <FIELD_NAME> (might contain spaces).
+        """
+        match = GC.meta_regex.search(line)
+        if not match:
+            return False
 
-        handle.seek(os.SEEK_SET)
-        # Data lines have the form n,n for an integer n (second copy on each line is redundant)
-        potentials = np.genfromtxt(fname=handle, comments=',', skip_header=meta_count)
+        field_name = match.group(1).lower()
+        val_str = line.partition('=')[2].strip()
+        if field_name == 'date':
+            # E.g. '12-02-2020' is represented as '12- 2-2020' for some reason
+            meta['date_string'] = val_str.replace(' ', '0')
+        elif field_name == 'time':
+            meta['time_string'] = val_str.replace(' ', '0')
+        elif field_name == 'rate':
+            # Find GC sample rate in readings per second (Hz); can be decimal
+            meta['sample_rate'] = float(re.search(r'\d+(.\d+)?', line).group())
+        elif field_name == 'size':
+            # Total number of readings collected during the current injection
+            meta['num_readings'] = int(re.search(r'\d+', line).group())
+        return True
 
-        # Build return object with metadata
-        run_duration = num_readings / sample_rate # In seconds
-        time_increments = np.linspace(0, run_duration, potentials.size)
-        warning = potentials.size != num_readings # Indicates file might be truncated prematurely
-        start_time = datetime.strptime(f'{date_string} {time_string}', r'%m-%d-%Y %H:%M:%S')
+    @staticmethod
+    def parse_data(data_text):
+        """
+        Bulk parse the data block of a GC file into a 1D numpy array of raw readings (microvolts).
+
+        Data lines have the form n,n for an integer n (second copy on each line is redundant), so the
+        whole block is parsed in a single pass as a flat list of numbers and every other value is kept.
+        If the block doesn't have exactly this shape, falls back to the (much slower) general-purpose
+        loader, which treats everything after the comma on each line as a comment.
+        """
+        try:
+            with warnings.catch_warnings():
+                # Older numpy versions only warn (rather than raise) on unparseable text
+                warnings.simplefilter('error', DeprecationWarning)
+                values = np.fromstring(data_text.replace(',', ' '), sep=' ')
+        except (ValueError, DeprecationWarning):
+            values = None
+
+        if values is not None and values.size % 2 == 0 and np.array_equal(values[0::2], values[1::2]):
+            return values[0::2].copy() # Copy so the duplicate column can be freed
+        return np.genfromtxt(fname=data_text.splitlines(), comments=',')
+
+    @staticmethod
+    def header_fields(meta):
+        """Convert metadata parsed by `parse_header` into the metadata fields of a parsed injection."""
         return {
-            'warning': warning,
-            'start_time': start_time,
-            'x': time_increments,
-            'y': potentials / 1000 # Convert from microvolts to millivolts to match calibration curves
+            'start_time': datetime.strptime(f"{meta['date_string']} {meta['time_string']}", r'%m-%d-%Y %H:%M:%S'),
+            'sample_rate': meta['sample_rate'],
+            'num_readings': meta['num_readings']
         }
-    
+
     @staticmethod
-    def parse_list(raw_list):
-        parsed_list = {}
-        for index, path in raw_list.items():
-            try:
-                handle = open(path, 'r')
-            except IOError:
-                return index
-            
-            try:
-                parsed_list[index] = GC.parse_file(handle)
-            except Exception: # Fails safely for GA files with improper meta or data format
-                handle.close()
+    # Parse raw data from a single GC injection into an `injections.Injection` with metadata fields.
+    # The signal is stored as `dtype` (float32 halves memory use at the cost of some precision).
+    def parse_file(handle, dtype=np.float64):
+        meta, first_data_line = GC.parse_header(handle)
+        potentials = GC.parse_data(first_data_line + handle.read())
+
+        # Build return object with metadata
+        fields = GC.header_fields(meta)
+        run_duration = fields['num_readings'] / fields['sample_rate'] # In seconds
+        # Readings are evenly spaced over the run, so the time axis is stored as its grid parameters only
+        time_increments = UniformGrid(0, run_duration, potentials.size)
+        warning = potentials.size != fields['num_readings'] # Indicates file might be truncated prematurely
+        # Convert from microvolts to millivolts to match calibration curves
+        millivolts = (potentials / 1000).astype(dtype, copy=False)
+        return Injection(y=millivolts, grid=time_increments, warning=warning, **fields)
+
+    @staticmethod
+    def scan_file(path):
+        """
+        Read only as much of a GC file as needed to find its date, time, rate and size fields, and return
+        them per `header_fields`. Returns None if the file can't be opened or the fields can't be found.
+        """
+        try:
+            handle = open(path, 'r')
+        except IOError:
+            return None
+
+        try:
+            meta = {}
+            # Stop as soon as all fields are found rather than reading until the first data line
+            while len(meta) < len(GC.SCAN_FIELDS) and GC.parse_meta_line(handle.readline(), meta):
+                pass
+            return GC.header_fields(meta)
+        except Exception:
+            return None
+        finally:
+            handle.close()
+
+    @staticmethod
+    def scan_list(raw_list):
+        """
+        Read the metadata of every file in `raw_list` (paths keyed by injection index) without loading any
+        signals. Returns a numpy structured array with one row per injection (in list order) and the fields
+        of `META_DTYPE`, or the index of the first file whose metadata couldn't be read.
+        """
+        table = np.empty(len(raw_list), dtype=GC.META_DTYPE)
+        for row, (index, path) in enumerate(raw_list.items()):
+            fields = GC.scan_file(path)
+            if fields is None:
                 return index
+            table[row] = (index, fields['start_time'], fields['sample_rate'], fields['num_readings'])
+        return table
+
+    @staticmethod
+    def parse_path(path, dtype=np.float64):
+        """Open and parse a single GC file. Returns None if the file can't be opened or parsed."""
+        try:
+            handle = open(path, 'r')
+        except IOError:
+            return None
+
+        try:
+            return GC.parse_file(handle, dtype)
+        except Exception: # Fails safely for GC files with improper meta or data format
+            return None
+        finally:
+            handle.close()
+
+    @staticmethod
+    def parse_list(raw_list, workers=None, cache=None, lazy=False, dtype=np.float64):
+        """
+        Parse all GC files in `raw_list` (paths keyed by injection index, as returned by `find_list`).
+        Returns a dict of parsed injections keyed by the same indices or, if any file can't be opened or
+        parsed, the index of the first such file in list order.
+
+        Files are parsed across `workers` processes (default: one per CPU). Lists with fewer than
+        `PARALLEL_MIN_FILES` entries, or `workers=1`, are parsed serially in the current process since
+        starting worker processes would cost more than it saves.
+
+        If a `parsecache.ParseCache` is supplied, files with a valid cache entry aren't parsed at all,
+        and newly parsed files are added to the cache.
+
+        If `lazy`, an `injections.LazyInjectionList` is returned instead of a dict, which loads (and caches)
+        the signal of each injection when first accessed. Every file is still checked up front (per
+        `scan_list` and `validate_list`, parsing across `workers` as above) so that unreadable files are
+        reported here rather than on access.
+
+        Signals are stored as `dtype` (see `parse_file`).
+        """
+        if lazy:
+            meta_table = GC.scan_list(raw_list)
+            if not isinstance(meta_table, np.ndarray):
+                return meta_table
+            grids_by_index = GC.validate_list(raw_list, workers, cache, dtype)
+            if not isinstance(grids_by_index, dict):
+                return grids_by_index
+            return LazyInjectionList(
+                raw_list, meta_table, load_func=lambda path: GC.load_path(path, cache, dtype), grids_by_index=grids_by_index)
+
+        cached = {}
+        if cache is not None:
+            cached = {index: cache.load(path) for index, path in raw_list.items()}
+            cached = {index: parsed for index, parsed in cached.items() if parsed is not None}
+        uncached = {index: path for index, path in raw_list.items() if index not in cached}
+
+        result = GC.parse_paths(uncached, workers, dtype)
+        if not isinstance(result, dict):
+            return result
+        if cache is not None and result:
+            for index, parsed in result.items():
+                cache.store(uncached[index], parsed)
+            cache.evict()
+        return {index: cached[index].astype(dtype) if index in cached else result[index] for index in raw_list}
+
+    @staticmethod
+    def validate_list(raw_list, workers=None, cache=None, dtype=np.float64):
+        """
+        Check that every file in `raw_list` can be parsed, without keeping any of the parsed signals.
+        Files with a valid entry in `cache` are taken as parseable; the others are parsed across `workers`
+        processes (see `iter_parsed`) and added to `cache`, so that loading them later is cheap. Returns a
+        dict of each index to the time axis (`injections.UniformGrid`) of its injection, or the index of
+        the first file that can't be parsed.
+        """
+        grids_by_index, uncached = {}, {}
+        for index, path in raw_list.items():
+            parsed = cache.load(path) if cache is not None else None
+            if parsed is None:
+                uncached[index] = path
             else:
-                handle.close()
+                grids_by_index[index] = parsed.grid
+
+        # Cached files never fail, so the first failure among the others is the first in the list
+        with closing(GC.iter_parsed(uncached, workers, dtype)) as parsed_files:
+            for index, parsed in parsed_files:
+                if parsed is None:
+                    return index
+                if cache is not None:
+                    cache.store(uncached[index], parsed)
+                grids_by_index[index] = parsed.grid
+        if cache is not None:
+            cache.evict()
+        return {index: grids_by_index[index] for index in raw_list}
+
+    @staticmethod
+    def load_path(path, cache=None, dtype=np.float64):
+        """
+        Parse a single GC file, going through `cache` if supplied. Unlike `parse_path`, raises ValueError
+        if the file can't be opened or parsed, since it is called long after the file was picked.
+        """
+        parsed = cache.load(path) if cache is not None else None
+        if parsed is not None:
+            return parsed.astype(dtype)
+
+        parsed = GC.parse_path(path, dtype)
+        if parsed is None:
+            raise ValueError(f'Unable to read GC file {path}.')
+        if cache is not None:
+            # Not evicting here; the cache is trimmed once per list by `parse_list`
+            cache.store(path, parsed)
+        return parsed
+
+    @staticmethod
+    def parse_paths(paths_by_index, workers=None, dtype=np.float64):
+        """Parse files without consulting any cache; same arguments and return value as `parse_list`."""
+        with closing(GC.iter_parsed(paths_by_index, workers, dtype)) as parsed_files:
+            return GC.collect_parsed(paths_by_index.keys(), (parsed for _, parsed in parsed_files))
+
+    @staticmethod
+    def iter_parsed(paths_by_index, workers=None, dtype=np.float64):
+        """
+        Parse files without consulting any cache, across `workers` processes as described in `parse_list`,
+        yielding each index along with its parsed file (None if it can't be opened or parsed) in order.
+        At most `PARSE_AHEAD_PER_WORKER` files per worker are parsed ahead of the consumer, so any number
+        of files can be parsed and handled one by one in bounded memory. Closing the generator (e.g. on
+        the first failure) drops any files still queued.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(paths_by_index))
+        if workers <= 1 or len(paths_by_index) < GC.PARALLEL_MIN_FILES:
+            for index, path in paths_by_index.items():
+                yield (index, GC.parse_path(path, dtype))
+            return
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            for index, path in paths_by_index.items():
+                pending.append((index, executor.submit(GC.parse_path, path, dtype)))
+                if len(pending) >= workers * GC.PARSE_AHEAD_PER_WORKER:
+                    done_index, done_future = pending.popleft()
+                    yield (done_index, done_future.result())
+            while pending:
+                done_index, done_future = pending.popleft()
+                yield (done_index, done_future.result())
+        finally:
+            # Fail fast: drop any queued files rather than parsing the rest of a list we'll reject
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
+    @staticmethod
+    def collect_parsed(indices, parsed_files):
+        """
+        Pair each index with its parsed file, consuming `parsed_files` in order and stopping at the first
+        failure. Returns the dict of parsed files or the failing index, per `parse_list`.
+        """
+        parsed_list = {}
+        for index, parsed in zip(indices, parsed_files):
+            if parsed is None:
+                return index
+            parsed_list[index] = parsed
         return parsed_list
 
     @staticmethod
@@ -101,9 +343,51 @@ class GC:
         return paths_by_index
 
 class CA:
+    # Files at least this large are parsed by `stream_file` rather than loaded into memory all at once
+    STREAM_MIN_BYTES = 256 * 1024 ** 2
+    # Number of data rows parsed at a time by `stream_file`
+    STREAM_CHUNK_ROWS = 200000
+    # Files at least this large are parsed across multiple processes by `parse_file` by default
+    PARALLEL_MIN_BYTES = 64 * 1024 ** 2
+    # Byte ranges per worker process in a parallel parse, so that uneven ranges balance out
+    RANGES_PER_WORKER = 2
+
     @staticmethod
-    def parse_file(filepath):
-        handle = open(filepath, 'r', encoding='latin-1')
+    def parse_file(filepath, cache=None, stream=None, workers=None):
+        """
+        Parse a CA file, first checking the supplied `parsecache.ParseCache` (if any) for a valid
+        previously parsed copy and adding the result to the cache otherwise.
+
+        If `stream` is True, the file is parsed with `stream_file`; by default, streaming is used only
+        for files of at least `STREAM_MIN_BYTES`. Files are parsed across `workers` processes (by default,
+        one per CPU for files of at least `PARALLEL_MIN_BYTES`, otherwise one), which implies streaming.
+        """
+        if cache is not None:
+            cached = cache.load(filepath)
+            if cached is not None:
+                return cached
+
+        size = os.path.getsize(filepath)
+        if stream is None:
+            stream = size >= CA.STREAM_MIN_BYTES
+        if workers is None:
+            workers = (os.cpu_count() or 1) if size >= CA.PARALLEL_MIN_BYTES else 1
+        if stream or workers > 1:
+            parsed = CA.stream_file(filepath, workers=workers)
+        else:
+            parsed = CA.read_file(filepath)
+        if cache is not None:
+            cache.store(filepath, parsed)
+            cache.evict()
+        return parsed
+
+    @staticmethod
+    def parse_header(handle):
+        """
+        Parse the metadata header of a CA file from the start of `handle`, leaving `handle` positioned
+        at the first data row. Returns the relevant metadata as a dict, including the indices of the data
+        columns used by Chromelectric in the order time, current, trial number (Ns).
+        """
         handle.readline()
         meta_total_str = handle.readline().partition(':')[2].strip() # Total meta count on line 2
         meta_total = int(meta_total_str)
@@ -131,28 +415,174 @@ class CA:
                     total_dur_by_trial.append(total_duration)
 
         # NOTE: 'time/s' field represents offset from acquisition start, NOT technique start.
-        data_fields = ['Ns', 'time/s', '<I>/mA']
+        # Ns (trial number) is loaded last so the first two columns are exactly `current_vs_time`.
+        data_fields = ['time/s', '<I>/mA', 'Ns']
         # Header row for data will always be last line of metadata;
         # this line was just read in final iteration of above loop
         header_row = handle.readline().split('\t')
-        data_cols = [header_row.index(name) for name in data_fields]
-        current_vs_time = np.genfromtxt(fname=handle, usecols=data_cols)
-        handle.close()
-
-        # For quick lookup so we don't have to convert 'Ns' from float to int on every iteration
-        potentials_dict = { float(index): potential for index, potential in enumerate(potentials_by_trial) }
-        current_to_resistance = lambda row: [row[1], potentials_dict[row[0]] / row[2]]
-        resistance_vs_time = np.array([current_to_resistance(row) for row in current_vs_time])
-        # We don't need the trial # field (Ns) anymore, so delete it to free a couple kB
-        current_vs_time = np.delete(current_vs_time, obj=0, axis=1)
+        return {
+            'header_lines': meta_total,
+            'acquisition_start': acquisition_start,
+            'potentials_by_trial': potentials_by_trial,
+            'total_dur_by_trial': total_dur_by_trial,
+            'data_cols': [header_row.index(name) for name in data_fields]
+        }
 
-        technique_start = acquisition_start + timedelta(seconds=current_vs_time[0, 0])
-        end_time_by_trial = [total_dur + technique_start for total_dur in total_dur_by_trial]
+    @staticmethod
+    def build_result(meta, current_vs_time, resistance_vs_time):
+        """Combine parsed metadata and data columns into the final parsed CA object."""
+        technique_start = meta['acquisition_start'] + timedelta(seconds=float(current_vs_time[0, 0]))
+        end_time_by_trial = [total_dur + technique_start for total_dur in meta['total_dur_by_trial']]
 
         return {
-            'acquisition_start': acquisition_start,
+            'acquisition_start': meta['acquisition_start'],
             'current_vs_time': current_vs_time,
             'resistance_vs_time': resistance_vs_time,
             'end_time_by_trial': end_time_by_trial,
-            'potentials_by_trial': potentials_by_trial
+            'potentials_by_trial': meta['potentials_by_trial']
         }
+
+    @staticmethod
+    def read_file(filepath):
+        handle = open(filepath, 'r', encoding='latin-1')
+        meta = CA.parse_header(handle)
+        data = np.genfromtxt(fname=handle, usecols=meta['data_cols'])
+        handle.close()
+
+        current_vs_time, resistance_vs_time = CA.split_columns(data, meta['potentials_by_trial'])
+        return CA.build_result(meta, current_vs_time, resistance_vs_time)
+
+    @staticmethod
+    def stream_file(filepath, out_path=None, chunk_rows=None, workers=1):
+        """
+        Parse a CA file of any size using bounded memory. The data rows are parsed `chunk_rows` at a time;
+        only time, current and (computed from the trial number of each row) resistance are kept and are
+        appended to a growing binary file at `out_path` (by default, a new temporary file), which is then
+        memory-mapped. Returns the same object as `read_file`, with the data arrays being views of the
+        memory-mapped file.
+
+        With multiple `workers`, the data section is split at line boundaries into byte ranges which are
+        streamed by separate processes into their own part files, then joined in order. The metadata
+        header is only parsed once, here, and passed to each worker.
+        """
+        if chunk_rows is None:
+            chunk_rows = CA.STREAM_CHUNK_ROWS
+        if out_path is None:
+            fd, out_path = tempfile.mkstemp(suffix='.bin', prefix='chromelectric-ca-')
+            os.close(fd)
+
+        with open(filepath, 'r', encoding='latin-1') as handle:
+            meta = CA.parse_header(handle)
+        ranges = CA.split_ranges(filepath, meta['header_lines'], workers * CA.RANGES_PER_WORKER if workers > 1 else 1)
+
+        if len(ranges) <= 1:
+            row_count = sum(CA.stream_range(filepath, start, end, meta, out_path, chunk_rows) for start, end in ranges)
+        else:
+            part_paths = [f'{out_path}.{index}' for index in range(len(ranges))]
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(CA.stream_range, filepath, start, end, meta, part_path, chunk_rows)
+                        for (start, end), part_path in zip(ranges, part_paths)
+                    ]
+                    row_count = sum(future.result() for future in futures)
+                with open(out_path, 'wb') as out:
+                    for part_path in part_paths:
+                        with open(part_path, 'rb') as part:
+                            shutil.copyfileobj(part, out)
+            finally:
+                for part_path in part_paths:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+
+        if row_count == 0:
+            raise ValueError('CA file contains no data.')
+        columns = np.memmap(out_path, dtype=np.float64, mode='r', shape=(row_count, 3))
+        try:
+            os.remove(out_path) # The mapping stays valid; not possible on Windows while mapped
+        except OSError:
+            pass
+        return CA.build_result(meta, *CA.stream_views(columns))
+
+    @staticmethod
+    def split_ranges(filepath, header_lines, count):
+        """
+        Split the data section of a CA file (everything after the first `header_lines` lines) into at most
+        `count` contiguous byte ranges of roughly equal size, each starting and ending on a line boundary.
+        Returns a list of (start, end) byte offsets.
+        """
+        with open(filepath, 'rb') as handle:
+            for _ in range(header_lines):
+                handle.readline()
+            data_start = handle.tell()
+            file_end = handle.seek(0, os.SEEK_END)
+
+            bounds = [data_start]
+            for index in range(1, count):
+                handle.seek(data_start + index * (file_end - data_start) // count)
+                handle.readline() # Move to the start of the next full line
+                if bounds[-1] < handle.tell() < file_end:
+                    bounds.append(handle.tell())
+            bounds.append(file_end)
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    @staticmethod
+    def stream_range(filepath, start, end, meta, out_path, chunk_rows):
+        """
+        Stream the CA data rows between byte offsets `start` and `end` (on line boundaries) into a new file
+        at `out_path`, in the layout of `stream_rows`. Returns the number of rows written.
+        """
+        def range_lines(handle, size):
+            for line in handle:
+                yield line.decode('latin-1')
+                size -= len(line)
+                if size <= 0:
+                    return
+
+        row_count = 0
+        with open(filepath, 'rb') as handle, open(out_path, 'wb') as out:
+            handle.seek(start)
+            lines_iter = range_lines(handle, end - start)
+            while lines := list(itertools.islice(lines_iter, chunk_rows)):
+                rows = CA.stream_rows(lines, meta)
+                out.write(rows.tobytes())
+                row_count += rows.shape[0]
+        return row_count
+
+    @staticmethod
+    def stream_rows(lines, meta):
+        """
+        Parse a block of CA data rows into the on-disk layout used by `stream_file`: one row per line
+        with columns current, time, resistance.
+        """
+        data = np.loadtxt(lines, usecols=meta['data_cols'], ndmin=2)
+        current_vs_time, resistance_vs_time = CA.split_columns(data, meta['potentials_by_trial'])
+        return np.column_stack((current_vs_time[:, 1], current_vs_time[:, 0], resistance_vs_time[:, 1]))
+
+    @staticmethod
+    def stream_views(columns):
+        """
+        Given columns current, time, resistance (per `stream_rows`), return current vs. time and resistance
+        vs. time as views without copying. The layout puts time between the other two columns so that
+        both can be expressed as a two-column slice (current vs. time by stepping backwards).
+        """
+        return (columns[:, 1::-1], columns[:, 1:3])
+
+    @staticmethod
+    def split_columns(data, potentials_by_trial):
+        """
+        Given CA data as an array with columns time, current and trial number (Ns), return the current vs.
+        time and resistance vs. time arrays. Resistance is the potential of each row's trial (looked up
+        for all rows at once by using Ns as an index) divided by the current.
+
+        Current vs. time is returned as a view of `data` rather than a copy.
+        """
+        trial_indices = data[:, 2].astype(np.intp)
+        if not np.array_equal(trial_indices, data[:, 2]):
+            raise ValueError('CA trial numbers (Ns) must be integers.')
+        row_potentials = np.asarray(potentials_by_trial, dtype=np.float64)[trial_indices]
+
+        resistance_vs_time = np.empty((data.shape[0], 2))
+        resistance_vs_time[:, 0] = data[:, 0]
+        np.divide(row_potentials, data[:, 1], out=resistance_vs_time[:, 1])
+        return (data[:, :2], resistance_vs_time)
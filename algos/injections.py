@@ -0,0 +1,271 @@
+"""
+Containers for parsed GC injections that avoid holding more in memory than needed.
+
+An `Injection` holds the signal of a single GC injection along with its metadata. Its time axis is
+never stored: GC readings are evenly spaced, so the axis is fully described by a `UniformGrid`, which
+also maps times to sample indices with arithmetic rather than a search.
+
+A `LazyInjectionList` stands in for the dict of parsed injections returned by `fileparse.GC.parse_list`:
+it is keyed by injection index, and each value behaves like a parsed injection dict. Metadata is read
+up front, while the signal arrays of an injection are only loaded when first accessed and may be
+dropped again (to be reloaded on next access) when the list exceeds its memory budget.
+"""
+from collections import OrderedDict
+from collections.abc import Mapping
+from threading import Lock
+import numpy as np
+from algos import envelope
+
+class UniformGrid:
+    """
+    An evenly spaced axis of `size` values from `start` to `stop` (inclusive), with values identical to
+    those of `np.linspace(start, stop, size)` but computed on demand.
+    """
+    def __init__(self, start, stop, size):
+        self.start = float(start)
+        self.stop = float(stop)
+        self.size = int(size)
+        # Same spacing as computed by np.linspace, so that every value matches exactly
+        self.step = (self.stop - self.start) / (self.size - 1) if self.size > 1 else 0.0
+
+    def values(self):
+        return np.linspace(self.start, self.stop, self.size)
+
+    def values_at(self, indices):
+        """Grid values at the given indices (scalar or array)."""
+        indices = np.asarray(indices)
+        values = indices * self.step + self.start
+        # np.linspace sets the final value to exactly `stop` (unless the grid is a single value)
+        if self.size < 2:
+            return values
+        return np.where(indices == self.size - 1, self.stop, values)
+
+    def index_of(self, values):
+        """Indices of the grid values nearest to `values` (scalar or array), clamped to the grid."""
+        if self.step == 0:
+            return np.zeros(np.shape(values), dtype=np.intp)
+        indices = np.rint((np.asarray(values, dtype=np.float64) - self.start) / self.step)
+        return np.clip(indices, 0, self.size - 1).astype(np.intp)
+
+    def index_at_or_after(self, values):
+        """
+        Indices of the first grid values that are at least `values`, i.e. the same as `np.searchsorted`
+        on the full axis (possibly `size` for values past the end of the grid).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.step == 0:
+            return np.where(values <= self.start, 0, self.size).astype(np.intp)
+        indices = np.clip(np.floor((values - self.start) / self.step), 0, self.size - 1).astype(np.intp)
+        # Correct for any rounding in the division by comparing against the exact grid values
+        indices = np.where(self.values_at(indices) < values, indices + 1, indices)
+        previous = np.maximum(indices - 1, 0)
+        indices = np.where((indices > 0) & (self.values_at(previous) >= values), previous, indices)
+        return indices
+
+class Injection(Mapping):
+    """
+    A parsed GC injection: the signal `y`, its time axis as a `UniformGrid` (exposed as the array `x` on
+    access) and metadata. Behaves like the dict of these fields for compatibility with existing callers.
+    """
+    FIELDS = ('warning', 'start_time', 'sample_rate', 'num_readings', 'x', 'y')
+
+    def __init__(self, y, grid, warning, start_time, sample_rate, num_readings):
+        self.y = y
+        self.grid = grid
+        self.warning = warning
+        self.start_time = start_time
+        self.sample_rate = sample_rate
+        self.num_readings = num_readings
+        self._cumulative_area = None
+        self._envelope = None
+
+    @property
+    def x(self):
+        return self.grid.values()
+
+    @property
+    def cumulative_area(self):
+        """
+        Cumulative trapezoidal area under the signal from its first point to each point, so that the area
+        between any two points is one subtraction. Computed on first access and kept with the injection.
+        """
+        if self._cumulative_area is None:
+            cumulative_area = np.zeros(self.y.size)
+            np.cumsum((self.y[1:] + self.y[:-1]) * (self.grid.step / 2), dtype=np.float64, out=cumulative_area[1:])
+            self._cumulative_area = cumulative_area
+        return self._cumulative_area
+
+    @property
+    def envelope(self):
+        """
+        Multi-resolution min/max envelope of the signal for drawing it at screen resolution (see
+        `envelope.min_max_levels`). Computed on first access and kept with the injection.
+        """
+        if self._envelope is None:
+            self._envelope = envelope.min_max_levels(self.y)
+        return self._envelope
+
+    @property
+    def nbytes(self):
+        """Size of the signal along with whichever of the arrays derived from it have been computed."""
+        nbytes = self.y.nbytes
+        if self._cumulative_area is not None:
+            nbytes += self._cumulative_area.nbytes
+        if self._envelope is not None:
+            nbytes += sum(level.nbytes for level in self._envelope)
+        return nbytes
+
+    def __getitem__(self, key):
+        if key not in Injection.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(Injection.FIELDS)
+
+    def __len__(self):
+        return len(Injection.FIELDS)
+
+    def astype(self, dtype):
+        """Return this injection with its signal converted to `dtype` (itself if already of that type)."""
+        if self.y.dtype == dtype:
+            return self
+        return Injection(
+            self.y.astype(dtype), self.grid, self.warning, self.start_time, self.sample_rate, self.num_readings)
+
+class LazyInjection(Mapping):
+    """A single injection of a `LazyInjectionList`; fields other than the metadata are loaded on access."""
+    META_FIELDS = ('start_time', 'sample_rate', 'num_readings')
+    LOADED_FIELDS = ('warning', 'x', 'y')
+
+    def __init__(self, parent, index):
+        self.parent = parent
+        self.index = index
+
+    def __getitem__(self, key):
+        if key in LazyInjection.META_FIELDS:
+            return self.parent.meta_by_index[self.index][key]
+        if key in LazyInjection.LOADED_FIELDS:
+            return self.parent.load(self.index)[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(LazyInjection.META_FIELDS + LazyInjection.LOADED_FIELDS)
+
+    def __len__(self):
+        return len(LazyInjection.META_FIELDS) + len(LazyInjection.LOADED_FIELDS)
+
+    @property
+    def injection(self):
+        """The fully loaded `Injection`."""
+        return self.parent.load(self.index)
+
+    @property
+    def grid(self):
+        grids_by_index = self.parent.grids_by_index
+        return self.injection.grid if grids_by_index is None else grids_by_index[self.index]
+
+    @property
+    def cumulative_area(self):
+        return self.parent.derive(self.index, 'cumulative_area')
+
+    @property
+    def envelope(self):
+        return self.parent.derive(self.index, 'envelope')
+
+    @property
+    def is_loaded(self):
+        return self.index in self.parent.loaded
+
+    def release(self):
+        """Drop the loaded injection (and its derived arrays) ahead of eviction; it's reloaded on next use."""
+        self.parent.release(self.index)
+
+class LazyInjectionList(Mapping):
+    """
+    Mapping of injection index to `LazyInjection`. `meta_table` holds one row of metadata per injection
+    in the same order as `paths_by_index` (as from `fileparse.GC.scan_list`) and is kept available for
+    vectorized use. `load_func` is called with the path of an injection file and must return the parsed
+    `Injection` (as from `fileparse.GC.parse_file`). If the time axis of each injection is known up
+    front, it can be given as `grids_by_index` so that it's available without loading the injection.
+    Loaded injections are kept in least-recently-used order and the oldest are dropped once their arrays
+    total more than `max_bytes` (the most recently loaded injection is always kept). Arrays derived from
+    a loaded injection (its cumulative area and envelope) count towards the budget once computed.
+    Injections may be loaded (and their derived arrays computed) from any thread.
+    """
+    DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+    def __init__(self, paths_by_index, meta_table, load_func, max_bytes=DEFAULT_MAX_BYTES, grids_by_index=None):
+        self.paths_by_index = paths_by_index
+        self.meta_table = meta_table
+        self.meta_by_index = {
+            index: {field: row[field].item() for field in LazyInjection.META_FIELDS}
+            for index, row in zip(paths_by_index, meta_table)
+        }
+        self.load_func = load_func
+        self.grids_by_index = grids_by_index
+        self.max_bytes = max_bytes
+        self.loaded = OrderedDict()
+        self.loaded_bytes = 0
+        # Size of each loaded injection as last counted in `loaded_bytes`
+        self.counted_bytes = {}
+        self.lock = Lock()
+        self.injections = {index: LazyInjection(self, index) for index in paths_by_index}
+
+    def __getitem__(self, index):
+        return self.injections[index]
+
+    def __iter__(self):
+        return iter(self.injections)
+
+    def __len__(self):
+        return len(self.injections)
+
+    def load(self, index):
+        """Return the `Injection` at `index`, loading it if necessary."""
+        with self.lock:
+            if index in self.loaded:
+                self.loaded.move_to_end(index)
+                return self.loaded[index]
+
+            parsed = self.load_func(self.paths_by_index[index])
+            self.loaded[index] = parsed
+            self.counted_bytes[index] = parsed.nbytes
+            self.loaded_bytes += parsed.nbytes
+            self.evict()
+            return parsed
+
+    def derive(self, index, field):
+        """
+        Return the array `field` derived from the injection at `index` (its 'cumulative_area' or 'envelope'),
+        computed under the lock so that it's computed once and counted towards the budget whichever thread
+        uses it first.
+        """
+        injection = self.load(index)
+        with self.lock:
+            derived = getattr(injection, field)
+            self.recount(index)
+            return derived
+
+    def recount(self, index):
+        """
+        Update the size counted for the injection at `index` if it's loaded (e.g. after it grew), evicting
+        others as needed. The lock must be held.
+        """
+        if index not in self.loaded:
+            return
+        nbytes = self.loaded[index].nbytes
+        self.loaded_bytes += nbytes - self.counted_bytes[index]
+        self.counted_bytes[index] = nbytes
+        self.evict()
+
+    def release(self, index):
+        """Drop the injection at `index` if it's loaded, e.g. once a pass over the whole run is done with it."""
+        with self.lock:
+            if self.loaded.pop(index, None) is not None:
+                self.loaded_bytes -= self.counted_bytes.pop(index)
+
+    def evict(self):
+        while self.loaded_bytes > self.max_bytes and len(self.loaded) > 1:
+            index, _ = self.loaded.popitem(last=False)
+            self.loaded_bytes -= self.counted_bytes.pop(index)
@@ -2,16 +2,30 @@
 Module handling analytical functions related to numerical integration, as well as
 a bit of closely related matplotlib canvas drawing functionality.
 """
+import hashlib
+from math import factorial
+from collections import OrderedDict
+from functools import partial
 import numpy as np
-from numpy.polynomial.polynomial import Polynomial
+from numpy.polynomial import polyutils
+from numpy.polynomial.polynomial import Polynomial, polyvander, polyval, polyint, polyder
+from algos import baselines, alignment
 
 BASELINE_COLOR = '#AC53FF'
+# np.trapz was renamed to np.trapezoid in numpy 2.0 (and has since been removed)
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
 
-def index_bounds(data, start_value, end_value):
+def index_bounds(data, start_value, end_value, grid=None):
     """
     Given a 1D numpy array of floats and start and end values (assumed to be contained in the array),
     return as a tuple the indices of the start and end values.
+
+    If the array is evenly spaced and its `injections.UniformGrid` is supplied as `grid`, the indices
+    are computed directly instead of searching the array.
     """
+    if grid is not None:
+        start_index, end_index = grid.index_of([start_value, end_value])
+        return (int(start_index), int(end_index))
     start_index = np.where(np.isclose(data, start_value))[0][0]
     end_index = np.where(np.isclose(data, end_value))[0][0]
     return (start_index, end_index)
@@ -29,21 +43,44 @@ def poly_baseline(x_data, y_data, peak_start_index, peak_end_index):
     within the baseline numeric array where the peak starts and ends, as a 4-tuple.
     """
     peak_size = peak_end_index - peak_start_index + 1 # Peak size, in number of data points contained within
+    baseline_indices, weights, baseline_peak_start, baseline_size = \
+        baseline_window(x_data.size, peak_start_index, peak_end_index)
+    plan = poly_fit_plan(x_data[baseline_indices], weights, baseline_size)
+
+    # Least squares polyfit to the data on either side of the peak to establish a baseline
+    coef = plan['solve'] @ y_data[baseline_indices]
+    poly_pure = Polynomial(coef, domain=plan['domain'], window=plan['window'])
+    # Convert pure representation (coefficients) into graphable version
+    poly_numeric = (plan['x'], plan['evaluate'] @ coef)
+
+    # Get the indices within the baseline array where the peak ends (1 after true end, as in a range)
+    baseline_peak_end = baseline_peak_start + peak_size
+
+    return (poly_numeric, poly_pure, baseline_peak_start, baseline_peak_end)
+
+def baseline_window(size, peak_start_index, peak_end_index):
+    """
+    Given the size of an array and start and end indices of a peak within it, choose the points on
+    either side of the peak used to fit its baseline.
+
+    Returns the indices of these points, the weight of each in the fit, the index within the baseline
+    where the peak starts and the total baseline size (in number of data points), as a 4-tuple.
+    """
+    peak_size = peak_end_index - peak_start_index + 1
     # Include number of points equal to half of peak size on either side for polynomial baseline fit
     prefix_range = np.arange(max(0, peak_start_index - peak_size // 2), peak_start_index)
-    postfix_range = np.arange(peak_end_index + 1, min(x_data.size, peak_end_index + 2 + peak_size // 2))
+    postfix_range = np.arange(peak_end_index + 1, min(size, peak_end_index + 2 + peak_size // 2))
 
     # Edge cases (literally) - we want to have at least one point on either side of the peak
     size_correction_start = size_correction_end = 0
     if peak_start_index == 0:
         prefix_range = np.array([peak_start_index])
         size_correction_start = -1
-    if peak_end_index == x_data.size - 1:
+    if peak_end_index == size - 1:
         postfix_range = np.array([peak_end_index])
         size_correction_end = -1
     baseline_indices = np.concatenate([prefix_range, postfix_range])
 
-    # Now we do a least squares polyfit to the data on either side of the peak to establish a baseline.
     # Numpy allows us to multiply the squared error contribution of each point by a weight factor -
     # we choose this factor to be the ratio of the number of points on the opposite side of the peak to the
     # number of points on this side. This ensures for example that if we have 3 points on the prefix side
@@ -52,18 +89,78 @@ def poly_baseline(x_data, y_data, peak_start_index, peak_end_index):
     prefix_weight = postfix_range.size / prefix_range.size
     postfix_weight = 1 / prefix_weight
     weights = np.concatenate([np.full(prefix_range.size, prefix_weight), np.full(postfix_range.size, postfix_weight)])
-    baseline_x, baseline_y = x_data[baseline_indices], y_data[baseline_indices]
 
-    poly_pure = Polynomial.fit(baseline_x, baseline_y, POLYFIT_DEGREE, w=weights)
     baseline_size = prefix_range.size + postfix_range.size + peak_size + \
         size_correction_start + size_correction_end # Size in number of data points
-    poly_numeric = poly_pure.linspace(baseline_size) # Convert pure representation (coefficients) into graphable version
-
-    # Get the indices within the baseline array where the peak starts and ends
     baseline_peak_start = prefix_range.size + size_correction_start
-    baseline_peak_end = baseline_peak_start + peak_size # 1 after true end (as in a range)
+    return (baseline_indices, weights, baseline_peak_start, baseline_size)
 
-    return (poly_numeric, poly_pure, baseline_peak_start, baseline_peak_end)
+def poly_fit_plan(baseline_x, weights, baseline_size):
+    """
+    Precompute the weighted least squares polynomial fit of degree `POLYFIT_DEGREE` through points at
+    `baseline_x` (mapped onto [-1, 1] exactly as `Polynomial.fit` does), as a dict holding:
+    - 'solve': matrix mapping the y values at `baseline_x` to the polynomial coefficients
+    - 'domain', 'window': the domain and window of the resulting `Polynomial`
+    - 'x', 'evaluate': `baseline_size` evenly spaced x values across the domain (as `Polynomial.linspace`)
+      and the matrix mapping coefficients to the polynomial's values there
+
+    The fit only depends on this geometry, which is usually the same for a peak across all injections
+    of a run, so the last `POLY_FIT_CACHE_SIZE` plans are kept and reused. A fit then costs a single
+    matrix-vector product instead of building and factorizing a Vandermonde matrix every time.
+    """
+    digest = hashlib.blake2b(baseline_x.tobytes(), digest_size=20)
+    digest.update(np.asarray(weights, dtype=np.float64).tobytes())
+    key = (digest.digest(), baseline_x.size, baseline_size)
+    if key in _poly_fit_plans:
+        _poly_fit_plans.move_to_end(key)
+        return _poly_fit_plans[key]
+
+    domain = polyutils.getdomain(baseline_x)
+    window = np.array([-1, 1])
+    offset, scale = polyutils.mapparms(domain, window)
+
+    # Same scaling and singular value cutoff as the lstsq solve in `np.polynomial.polynomial.polyfit`,
+    # but as an explicit pseudo-inverse so it can be reused for any y values
+    lhs = polyvander(offset + scale * baseline_x, POLYFIT_DEGREE) * weights[:, np.newaxis]
+    column_scale = np.sqrt(np.square(lhs).sum(axis=0))
+    column_scale[column_scale == 0] = 1
+    u, singular_values, vt = np.linalg.svd(lhs / column_scale, full_matrices=False)
+    cutoff = baseline_x.size * np.finfo(baseline_x.dtype).eps * singular_values.max(initial=0)
+    inverse_values = np.divide(1, singular_values, out=np.zeros_like(singular_values), where=singular_values > cutoff)
+    solve = (vt.T * inverse_values) @ u.T / column_scale[:, np.newaxis] * weights
+
+    poly_x = np.linspace(domain[0], domain[1], baseline_size)
+    plan = {
+        'solve': solve,
+        'domain': domain,
+        'window': window,
+        'x': poly_x,
+        'evaluate': polyvander(offset + scale * poly_x, POLYFIT_DEGREE),
+    }
+    if POLY_FIT_CACHE_SIZE > 0:
+        _poly_fit_plans[key] = plan
+        while len(_poly_fit_plans) > POLY_FIT_CACHE_SIZE:
+            _poly_fit_plans.popitem(last=False)
+    return plan
+
+def poly_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index):
+    """
+    Batched `poly_baseline`: fits the baselines of the same peak on every row of the 2D array `y_stack`
+    (all sharing `x_data`) with a single least squares solve.
+
+    Returns the shared baseline x values, the baseline y values (one row per row of `y_stack`), a list of
+    pure representations (one per row) and the peak start and end indices within the baseline.
+    """
+    peak_size = peak_end_index - peak_start_index + 1
+    baseline_indices, weights, baseline_peak_start, baseline_size = \
+        baseline_window(x_data.size, peak_start_index, peak_end_index)
+    plan = poly_fit_plan(x_data[baseline_indices], weights, baseline_size)
+
+    # Fit and evaluate every baseline with one matrix product each (one column of `coefs` per row)
+    coefs = plan['solve'] @ y_stack[:, baseline_indices].T
+    poly_y = (plan['evaluate'] @ coefs).T
+    poly_pures = [Polynomial(coef, domain=plan['domain'], window=plan['window']) for coef in coefs.T]
+    return (plan['x'], poly_y, poly_pures, baseline_peak_start, baseline_peak_start + peak_size)
 
 def linear_baseline(x_data, y_data, peak_start_index, peak_end_index):
     peak_size = peak_end_index - peak_start_index + 1
@@ -81,15 +178,225 @@ def linear_baseline(x_data, y_data, peak_start_index, peak_end_index):
     
     return (linear_numeric, linear_pure, 0, peak_size)
 
-def correct_for_baseline(x_data, y_data, peak_start_x, peak_end_x, baseline_type):
+def linear_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index):
+    """Batched `linear_baseline`; same arguments and return value as `poly_baseline_batch`."""
+    peak_size = peak_end_index - peak_start_index + 1
+    start_x, end_x = x_data[peak_start_index], x_data[peak_end_index]
+    start_y, end_y = y_stack[:, peak_start_index], y_stack[:, peak_end_index]
+
+    linear_x = np.linspace(start_x, end_x, num=peak_size)
+    linear_y = np.linspace(start_y, end_y, num=peak_size, axis=1)
+
+    slopes = (end_y - start_y) / (end_x - start_x)
+    y_ints = end_y - slopes * end_x
+    linear_pures = [{'slope': slope, 'y_int': y_int} for slope, y_int in zip(slopes, y_ints)]
+
+    return (linear_x, linear_y, linear_pures, 0, peak_size)
+
+def global_baseline(method, x_data, y_data, peak_start_index, peak_end_index):
+    """
+    Baseline of the whole signal by `method` (see `baselines.METHODS`), cached per signal so that every
+    peak of an injection shares one computation. `x_data` must be evenly spaced.
+
+    Returns the baseline over the peak, a pure version (the method and its parameters) and the indices
+    within the baseline where the peak starts and ends, like `poly_baseline`.
+    """
+    peak_size = peak_end_index - peak_start_index + 1
+    baseline_y = baselines.cached(method, x_data, y_data[np.newaxis])[0]
+    peak_range = slice(peak_start_index, peak_end_index + 1)
+    return ((x_data[peak_range], baseline_y[peak_range]), baselines.describe(method), 0, peak_size)
+
+def global_baseline_batch(method, x_data, y_stack, peak_start_index, peak_end_index):
+    """Batched `global_baseline`; same arguments and return value as `poly_baseline_batch`."""
+    peak_size = peak_end_index - peak_start_index + 1
+    baseline_y = baselines.cached(method, x_data, y_stack)
+    peak_range = slice(peak_start_index, peak_end_index + 1)
+    pure = baselines.describe(method)
+    return (x_data[peak_range], baseline_y[:, peak_range], [pure] * len(y_stack), 0, peak_size)
+
+def sampled_baseline_area(baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end):
+    """
+    Trapezoidal area under each baseline (one per row of `baseline_y`, as returned by the batched baseline
+    functions) over the peak, from its values at every point of the peak.
+    """
+    peak_range = slice(baseline_peak_start, baseline_peak_end)
+    return trapezoid(baseline_y[:, peak_range], baseline_x[peak_range], axis=1)
+
+def linear_baseline_area(baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end):
+    """`sampled_baseline_area` for linear baselines, from the ends of the peak only (exact for a line)."""
+    last = baseline_peak_end - 1
+    width = baseline_x[last] - baseline_x[baseline_peak_start]
+    return (baseline_y[:, baseline_peak_start] + baseline_y[:, last]) / 2 * width
+
+def poly_baseline_area(baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end):
+    """
+    `sampled_baseline_area` for polynomial baselines (all sharing a domain, as from `poly_baseline_batch`),
+    in closed form from their coefficients (see `poly_area_weights`).
+    """
+    count = baseline_peak_end - baseline_peak_start
+    coefs = np.stack([pure.coef for pure in baseline_pures]) # One row per baseline
+    if count < 2 or coefs.shape[1] > 2 * len(BERNOULLI_NUMBERS) + 1:
+        return sampled_baseline_area(baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end)
+    domain, window = baseline_pures[0].domain, baseline_pures[0].window
+    weights = poly_area_weights(
+        coefs.shape[1] - 1, *domain, *window, baseline_x[baseline_peak_start], baseline_x[baseline_peak_end - 1], count)
+    return coefs @ weights
+
+def poly_area_weights(degree, domain_start, domain_end, window_start, window_end, start_x, end_x, count):
+    """
+    Weights which, applied to the coefficients of a polynomial of `degree` with the given domain and
+    window, give the trapezoidal area under its values at `count` evenly spaced points from `start_x` to
+    `end_x`: the integral from its antiderivative plus the Euler-Maclaurin corrections for the trapezoidal
+    rule, which are exact for a polynomial as they end after its degree.
+
+    The area is linear in the coefficients, so the weights are found by applying this to each basis
+    polynomial, once per peak geometry (the last `POLY_FIT_CACHE_SIZE` are kept, as in `poly_fit_plan`).
+    """
+    key = (degree, domain_start, domain_end, window_start, window_end, start_x, end_x, count)
+    if key in _poly_area_weights:
+        _poly_area_weights.move_to_end(key)
+        return _poly_area_weights[key]
+
+    step = (end_x - start_x) / (count - 1)
+    offset, scale = polyutils.mapparms([domain_start, domain_end], [window_start, window_end])
+    # One column per basis polynomial; difference of each between the ends of the peak (in window coordinates)
+    basis = np.eye(degree + 1)
+    change = lambda coefs: polyval(offset + scale * end_x, coefs) - polyval(offset + scale * start_x, coefs)
+
+    weights = change(polyint(basis)) / scale
+    for index, bernoulli in enumerate(BERNOULLI_NUMBERS, start=1):
+        order = 2 * index - 1
+        if order > degree:
+            break
+        weights += bernoulli / factorial(2 * index) * step ** (2 * index) * scale ** order * change(polyder(basis, order))
+    if POLY_FIT_CACHE_SIZE > 0:
+        _poly_area_weights[key] = weights
+        while len(_poly_area_weights) > POLY_FIT_CACHE_SIZE:
+            _poly_area_weights.popitem(last=False)
+    return weights
+
+def linspace_rows(starts, stops, nums):
+    """
+    `np.linspace` from each of `starts` to the matching `stops` with the matching number of points in `nums`,
+    as the rows of a 2D array. Rows with fewer points than the largest are padded on the right with
+    further points at the same spacing, which callers should ignore.
+    """
+    nums = np.asarray(nums)
+    steps = (stops - starts) / np.maximum(nums - 1, 1)
+    rows = np.arange(nums.max(initial=1)) * steps[:, np.newaxis] + starts[:, np.newaxis]
+    ends = np.flatnonzero(nums > 1)
+    rows[ends, nums[ends] - 1] = stops[ends]
+    return rows
+
+def padded_trapezoid(x_rows, y_rows, starts, ends):
+    """
+    Trapezoidal area under each row of `y_rows` (sampled at the matching row of `x_rows`) from its index in
+    `starts` to the one before its index in `ends`, as in `sampled_baseline_area` but with bounds per row.
+    """
+    segments = (y_rows[:, 1:] + y_rows[:, :-1]) / 2 * np.diff(x_rows, axis=1)
+    positions = np.arange(segments.shape[1])
+    inside = (positions >= starts[:, np.newaxis]) & (positions < ends[:, np.newaxis] - 1)
+    return np.where(inside, segments, 0).sum(axis=1)
+
+def poly_baseline_rows(x_data, y_stack, peak_start_indices, peak_end_indices):
+    """
+    `poly_baseline` of a different peak on each row of `y_stack` (all sharing `x_data`), given by its start
+    and end indices in `peak_start_indices` and `peak_end_indices`. The fits differ in geometry so can't share
+    a `poly_fit_plan`; instead the points of each baseline window are padded to the longest (with zero
+    weight, which leaves the fit unchanged) and every fit is solved at once by a stacked SVD.
+
+    Returns a list of baselines in the form returned by `correct_for_baseline` (one per row) and the
+    trapezoidal area under each over its peak.
+    """
+    peak_sizes = peak_end_indices - peak_start_indices + 1
+    windows = [baseline_window(x_data.size, start, end) for start, end in zip(peak_start_indices, peak_end_indices)]
+    counts = np.array([indices.size for indices, _, _, _ in windows])
+    fit_indices = np.zeros((len(windows), counts.max()), dtype=int)
+    fit_weights = np.zeros(fit_indices.shape)
+    for row, (indices, weights, _, _) in enumerate(windows):
+        fit_indices[row, :indices.size] = indices
+        fit_weights[row, :weights.size] = weights
+    baseline_peak_starts = np.array([window[2] for window in windows])
+    baseline_sizes = np.array([window[3] for window in windows])
+
+    # Same mapping onto [-1, 1], scaling and singular value cutoff as `poly_fit_plan`, one fit per row
+    fit_x = x_data[fit_indices]
+    padding = np.arange(counts.max()) >= counts[:, np.newaxis]
+    domain_starts = np.where(padding, np.inf, fit_x).min(axis=1)
+    domain_ends = np.where(padding, -np.inf, fit_x).max(axis=1)
+    window = np.array([-1, 1])
+    offsets, scales = polyutils.mapparms([domain_starts, domain_ends], window)
+    lhs = polyvander(offsets[:, np.newaxis] + scales[:, np.newaxis] * fit_x, POLYFIT_DEGREE) * fit_weights[..., np.newaxis]
+    column_scale = np.sqrt(np.square(lhs).sum(axis=1))
+    column_scale[column_scale == 0] = 1
+    u, singular_values, vt = np.linalg.svd(lhs / column_scale[:, np.newaxis], full_matrices=False)
+    cutoff = counts * np.finfo(fit_x.dtype).eps * singular_values.max(axis=1, initial=0)
+    inverse_values = np.divide(
+        1, singular_values, out=np.zeros_like(singular_values), where=singular_values > cutoff[:, np.newaxis])
+    fit_y = y_stack[np.arange(len(windows))[:, np.newaxis], fit_indices] * fit_weights
+    projected = np.einsum('rji,rj->ri', u, fit_y) * inverse_values
+    coefs = np.einsum('rji,rj->ri', vt, projected) / column_scale
+
+    poly_x = linspace_rows(domain_starts, domain_ends, baseline_sizes)
+    poly_y = np.einsum(
+        'rbi,ri->rb', polyvander(offsets[:, np.newaxis] + scales[:, np.newaxis] * poly_x, POLYFIT_DEGREE), coefs)
+    baselines = [
+        ((row_x[:size], row_y[:size]), Polynomial(coef, domain=[domain_start, domain_end], window=window))
+        for row_x, row_y, size, coef, domain_start, domain_end
+        in zip(poly_x, poly_y, baseline_sizes, coefs, domain_starts, domain_ends)]
+    areas = padded_trapezoid(poly_x, poly_y, baseline_peak_starts, baseline_peak_starts + peak_sizes)
+    return (baselines, areas)
+
+def linear_baseline_rows(x_data, y_stack, peak_start_indices, peak_end_indices):
+    """`linear_baseline` of a different peak on each row of `y_stack`; see `poly_baseline_rows`."""
+    rows = np.arange(len(y_stack))
+    peak_sizes = peak_end_indices - peak_start_indices + 1
+    start_x, end_x = x_data[peak_start_indices], x_data[peak_end_indices]
+    start_y, end_y = y_stack[rows, peak_start_indices], y_stack[rows, peak_end_indices]
+
+    linear_x = linspace_rows(start_x, end_x, peak_sizes)
+    linear_y = linspace_rows(start_y, end_y, peak_sizes)
+    slopes = (end_y - start_y) / (end_x - start_x)
+    y_ints = end_y - slopes * end_x
+    baselines = [
+        ((row_x[:size], row_y[:size]), {'slope': slope, 'y_int': y_int})
+        for row_x, row_y, size, slope, y_int in zip(linear_x, linear_y, peak_sizes, slopes, y_ints)]
+    return (baselines, (start_y + end_y) / 2 * (end_x - start_x))
+
+def global_baseline_rows(method, x_data, y_stack, peak_start_indices, peak_end_indices):
+    """`global_baseline` of a different peak on each row of `y_stack`; see `poly_baseline_rows`."""
+    rows = np.arange(len(y_stack))
+    baseline_y = baselines.cached(method, x_data, y_stack)
+    pure = baselines.describe(method)
+    # The baselines span the whole signal, so the area over each peak is one subtraction as for the signal
+    cumulative = np.zeros(baseline_y.shape)
+    np.cumsum((baseline_y[:, 1:] + baseline_y[:, :-1]) / 2 * np.diff(x_data), axis=1, out=cumulative[:, 1:])
+    peak_baselines = [
+        ((x_data[start:end + 1], row_y[start:end + 1]), pure)
+        for row_y, start, end in zip(baseline_y, peak_start_indices, peak_end_indices)]
+    return (peak_baselines, cumulative[rows, peak_end_indices] - cumulative[rows, peak_start_indices])
+
+def cumulative_peak_area(baseline_type, cumulative_bounds, baseline_x, baseline_y, baseline_pures,
+                         baseline_peak_start, baseline_peak_end):
+    """
+    Trapezoidal areas of peaks above their baselines (as returned by the batched baseline functions), given
+    the cumulative area under each signal at the start and end of the peak (one row of 2 per signal): the
+    area under the signal is their difference, and the area under the baseline is computed in closed form
+    where its type has one (see `BASELINE_AREA_BY_TYPE`).
+    """
+    baseline_area = BASELINE_AREA_BY_TYPE.get(baseline_type, sampled_baseline_area)(
+        baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end)
+    return cumulative_bounds[:, 1] - cumulative_bounds[:, 0] - baseline_area
+
+def correct_for_baseline(x_data, y_data, peak_start_x, peak_end_x, baseline_type, grid=None):
     """
     Given an arbitrary 2D function and start and end x values for a user-identified peak within the function,
     compute a suitable baseline for the peak and correct for the baseline (subtract baseline from peak).
 
     Returns a corrected peak function which can be numerically integrated and both numeric and pure representations
-    of the baseline.
+    of the baseline. `grid` is the optional `UniformGrid` of `x_data` (see `index_bounds`).
     """
-    peak_start_index, peak_end_index = index_bounds(x_data, peak_start_x, peak_end_x)
+    peak_start_index, peak_end_index = index_bounds(x_data, peak_start_x, peak_end_x, grid)
     baseline_numeric, baseline_pure, baseline_peak_start, baseline_peak_end = \
         BASELINES_BY_TYPE[baseline_type](x_data, y_data, peak_start_index, peak_end_index)
     _, baseline_y = baseline_numeric
@@ -104,13 +411,32 @@ def correct_for_baseline(x_data, y_data, peak_start_x, peak_end_x, baseline_type
         'baseline': (baseline_numeric, baseline_pure),
     }
 
+def correct_for_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index, baseline_type):
+    """
+    Batched `correct_for_baseline` for the same peak (given by index) on every row of `y_stack`.
+
+    Returns the peak x values, the corrected peak y values (one row per row of `y_stack`) and a list of
+    baselines in the form returned by `correct_for_baseline`.
+    """
+    baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end = \
+        BATCH_BASELINES_BY_TYPE[baseline_type](x_data, y_stack, peak_start_index, peak_end_index)
+
+    peak_x = x_data[peak_start_index:peak_end_index + 1]
+    corrected_peak_y = y_stack[:, peak_start_index:peak_end_index + 1] - baseline_y[:, baseline_peak_start:baseline_peak_end]
+    baselines = [((baseline_x, row_y), pure) for row_y, pure in zip(baseline_y, baseline_pures)]
+
+    return {
+        'peak': (peak_x, corrected_peak_y),
+        'baselines': baselines,
+    }
+
 def draw_point(coords, axes):
     """Draw a single (x, y) point on the given axes. Meant to draw points relevant in a given integration."""
     return axes.plot(coords[0], coords[1], color=BASELINE_COLOR, marker='o', markersize=6)[0]
 
-def draw_integral(x_data, y_data, integral, axes, display_index, render_func, draw_points=False):
+def draw_integral(x_data, y_data, integral, axes, display_index, render_func, draw_points=False, grid=None):
     """Convenience function to draw an integral and optionally draw the points associated with it."""
-    artists = render_func(x_data, y_data, integral, axes)
+    artists = render_func(x_data, y_data, integral, axes, grid=grid)
 
     if draw_points:
         for point in integral['points']:
@@ -122,28 +448,41 @@ def draw_integral(x_data, y_data, integral, axes, display_index, render_func, dr
 
 def draw_annotation(integral, y_data, axes, display_index):
     """Draw an annotation of the supplied peak including its index number and return the resulting artist."""
-    peak_start, peak_end = integral['points']
+    # Annotate fitted peaks at their extremum so that overlapping peaks are told apart
+    anchor = integral['points'][2] if len(integral['points']) > 2 else integral['points'][1]
     y_range = np.max(y_data) - np.min(y_data)
     return axes.annotate(
-        str(display_index), (peak_end[0], peak_end[1] + y_range // 8), ha="center", va="center", size=9,
+        str(display_index), (anchor[0], anchor[1] + y_range // 8), ha="center", va="center", size=9,
         bbox=dict(boxstyle="round,pad=0.3", facecolor="#ffffff80", edgecolor="#cccccc", linewidth=2))
 
-def trapz(x_data, y_data, points, baseline_type):
+def trapz(x_data, y_data, points, baseline_type, grid=None, cumulative_area=None):
     """
     Integrates a peak trapezoidally, given the full x vs. y graph and a list of points inputted by the user.
     Note that this list of points can be interpretted differently for different integration methods.
 
+    If the cumulative trapezoidal area under `y_data` is supplied as `cumulative_area` (as from
+    `injections.Injection.cumulative_area`), the area is found from it (see `cumulative_peak_area`)
+    instead of integrating the peak point by point.
+
     Returns a dictionary containing the area of the peak, the user-selected start and end x coordinates of the peak,
     and both numeric (many (x, y) pairs) and pure (polynomial coefficients) forms for the baseline.
     """
     peak_start = points[0] if points[0][0] < points[1][0] else points[1]
     peak_end = points[1] if points[0][0] < points[1][0] else points[0]
 
-    corrected = correct_for_baseline(x_data, y_data, peak_start[0], peak_end[0], baseline_type)
-    peak_x, corrected_peak_y = corrected['peak']
-    baseline_numeric, baseline_pure = corrected['baseline']
-
-    area = np.trapz(corrected_peak_y, peak_x)
+    if cumulative_area is None:
+        corrected = correct_for_baseline(x_data, y_data, peak_start[0], peak_end[0], baseline_type, grid)
+        peak_x, corrected_peak_y = corrected['peak']
+        baseline_numeric, baseline_pure = corrected['baseline']
+        area = trapezoid(corrected_peak_y, peak_x)
+    else:
+        peak_start_index, peak_end_index = index_bounds(x_data, peak_start[0], peak_end[0], grid)
+        baseline_numeric, baseline_pure, baseline_peak_start, baseline_peak_end = \
+            BASELINES_BY_TYPE[baseline_type](x_data, y_data, peak_start_index, peak_end_index)
+        baseline_x, baseline_y = baseline_numeric
+        area = cumulative_peak_area(
+            baseline_type, cumulative_area[[peak_start_index, peak_end_index]][np.newaxis], baseline_x,
+            baseline_y[np.newaxis], [baseline_pure], baseline_peak_start, baseline_peak_end)[0]
 
     return {
         'area': area,
@@ -152,7 +491,66 @@ def trapz(x_data, y_data, points, baseline_type):
         'points': (peak_start, peak_end),
     }
 
-def trapz_draw(x_data, y_data, integral, axes):
+def trapz_batch(x_data, y_stack, point_indices, baseline_type, cumulative_areas=None):
+    """
+    Batched `trapz`: integrates the same peak on every row of the 2D array `y_stack` (one injection per row,
+    all sharing `x_data`), given the indices of the user-selected points instead of their coordinates.
+    `cumulative_areas` optionally holds the cumulative area under each row (see `trapz`).
+
+    Returns a list of results in the form returned by `trapz`, one per row.
+    """
+    peak_start_index, peak_end_index = sorted(point_indices[:2])
+
+    if cumulative_areas is None:
+        corrected = correct_for_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index, baseline_type)
+        peak_x, corrected_peak_y = corrected['peak']
+        areas = trapezoid(corrected_peak_y, peak_x, axis=1)
+        baselines = corrected['baselines']
+    else:
+        baseline_x, baseline_y, baseline_pures, baseline_peak_start, baseline_peak_end = \
+            BATCH_BASELINES_BY_TYPE[baseline_type](x_data, y_stack, peak_start_index, peak_end_index)
+        cumulative_bounds = np.array([cumulative[[peak_start_index, peak_end_index]] for cumulative in cumulative_areas])
+        areas = cumulative_peak_area(
+            baseline_type, cumulative_bounds, baseline_x, baseline_y, baseline_pures,
+            baseline_peak_start, baseline_peak_end)
+        baselines = [((baseline_x, row_y), pure) for row_y, pure in zip(baseline_y, baseline_pures)]
+
+    start_x, end_x = x_data[peak_start_index], x_data[peak_end_index]
+    return [{
+        'area': area,
+        'baseline': baseline,
+        'baseline_type': baseline_type,
+        'points': ((start_x, row_y[peak_start_index]), (end_x, row_y[peak_end_index])),
+    } for area, baseline, row_y in zip(areas, baselines, y_stack)]
+
+def trapz_rows(x_data, y_stack, start_indices, end_indices, baseline_type, cumulative_areas):
+    """
+    Like `trapz_batch`, but integrates a different peak on each row of `y_stack`, from its index in
+    `start_indices` to the one in `end_indices`, so that injections whose peaks were found at different
+    points still share one batch. `cumulative_areas` holds the cumulative area under each row (see
+    `trapz`) as a 2D array, from which every area under the signal is found by fancy indexing.
+
+    Returns a list of results in the form returned by `trapz`, one per row.
+    """
+    rows = np.arange(len(y_stack))
+    peak_start_indices = np.minimum(start_indices, end_indices)
+    peak_end_indices = np.maximum(start_indices, end_indices)
+
+    peak_baselines, baseline_areas = ROW_BASELINES_BY_TYPE[baseline_type](
+        x_data, y_stack, peak_start_indices, peak_end_indices)
+    areas = cumulative_areas[rows, peak_end_indices] - cumulative_areas[rows, peak_start_indices] - baseline_areas
+
+    start_x, end_x = x_data[peak_start_indices], x_data[peak_end_indices]
+    start_y, end_y = y_stack[rows, peak_start_indices], y_stack[rows, peak_end_indices]
+    return [{
+        'area': area,
+        'baseline': baseline,
+        'baseline_type': baseline_type,
+        'points': ((row_start_x, row_start_y), (row_end_x, row_end_y)),
+    } for area, baseline, row_start_x, row_start_y, row_end_x, row_end_y
+        in zip(areas, peak_baselines, start_x, start_y, end_x, end_y)]
+
+def trapz_draw(x_data, y_data, integral, axes, grid=None):
     """
     Given a trapezoidal integration result (from `trapz_integrate`) and an `axes` object to draw to,
     draw a representation of the trapezoidal integration. In particular, draw the baseline and fill
@@ -161,28 +559,365 @@ def trapz_draw(x_data, y_data, integral, axes):
     Returns a list of all artists drawn for later cleanup.
     """
     (baseline_x, baseline_y), _ = integral['baseline']
-    graph_fill_start, graph_fill_end = index_bounds(x_data, baseline_x[0], baseline_x[-1])
+    graph_fill_start, graph_fill_end = index_bounds(x_data, baseline_x[0], baseline_x[-1], grid)
     graph_fill_y = y_data[np.arange(graph_fill_start, graph_fill_end + 1)]
     baseline, = axes.plot(baseline_x, baseline_y, color=BASELINE_COLOR)
     pos_fill = axes.fill_between(baseline_x, baseline_y, graph_fill_y, where=(baseline_y < graph_fill_y), color='#38A9FF', interpolate=True)
     neg_fill = axes.fill_between(baseline_x, baseline_y, graph_fill_y, where=(baseline_y > graph_fill_y), color='#FF4A38', interpolate=True)
     return [baseline, pos_fill, neg_fill]
 
-def line2d_point(pick_event):
+def gaussian_curve(x, params):
+    """Gaussian of each row of `params` (amplitude, center, standard deviation) evaluated at `x`."""
+    amplitude, center, width = params.T[..., np.newaxis]
+    return amplitude * np.exp(-0.5 * np.square((x - center) / width))
+
+def gaussian_jacobian(x, params):
+    """Partial derivatives of `gaussian_curve` by each parameter (in turn along the second axis)."""
+    amplitude, center, width = params.T[..., np.newaxis]
+    offset = x - center
+    exp = np.exp(-0.5 * np.square(offset / width))
+    d_center = amplitude * exp * offset / width ** 2
+    return np.stack([exp, d_center, d_center * offset / width], axis=1)
+
+def lorentzian_curve(x, params):
+    """Lorentzian of each row of `params` (amplitude, center, half width at half maximum) evaluated at `x`."""
+    amplitude, center, width = params.T[..., np.newaxis]
+    return amplitude * width ** 2 / (np.square(x - center) + width ** 2)
+
+def lorentzian_jacobian(x, params):
+    """Partial derivatives of `lorentzian_curve` by each parameter (in turn along the second axis)."""
+    amplitude, center, width = params.T[..., np.newaxis]
+    offset = x - center
+    denominator = np.square(offset) + width ** 2
+    shape = width ** 2 / denominator
+    d_center = 2 * amplitude * shape * offset / denominator
+    return np.stack([shape, d_center, d_center * offset / width], axis=1)
+
+def levenberg_marquardt(model, x, y_stack, params):
     """
-    Given a user pick event on a Line2D matplotlib object, return the most likely (x, y) coordinate
-    on the line to which the user was referring.
+    Least squares fit of `model` (from `FIT_MODELS`) to every row of `y_stack` at once, all sampled at `x`,
+    starting from the initial parameters in the corresponding rows of `params`.
+
+    Each iteration solves the damped normal equations (using the model's analytic Jacobian) for every
+    row still being fitted. Steps that reduce the squared error are taken and the damping of that row
+    is reduced; otherwise the damping is increased. A row stops once its error no longer decreases
+    meaningfully (relative decrease below `FIT_TOLERANCE`) or after `FIT_MAX_ITERATIONS`.
+
+    Returns the fitted parameters, one row per row of `y_stack`.
     """
-    points_clicked = pick_event.ind # numpy array containing all points clicked, by index
-    if points_clicked.size <= 5:
-        # Find closest point to actual mouse click
-        actual_click = (pick_event.mouseevent.xdata, pick_event.mouseevent.ydata)
-        pick_index = min(points_clicked, key=lambda pt: abs(np.linalg.norm(pt - actual_click)))
-    else:
-        # Pick middle point; user is too zoomed out to pick at a granular level
-        pick_index = points_clicked[points_clicked.size // 2]
-    line = pick_event.artist
-    return (line.get_xdata()[pick_index], line.get_ydata()[pick_index])
+    params = np.array(params, dtype=np.float64)
+    residuals = model['curve'](x, params) - y_stack
+    costs = np.sum(np.square(residuals), axis=1)
+    damping = np.full(params.shape[0], 1e-3)
+    active = np.arange(params.shape[0])
+    identity = np.eye(params.shape[1])
+
+    for _ in range(FIT_MAX_ITERATIONS):
+        jacobian_t = model['jacobian'](x, params[active]) # Transposed, i.e. one row per parameter
+        jtj = jacobian_t @ jacobian_t.transpose(0, 2, 1)
+        gradient = (jacobian_t @ residuals[active][..., np.newaxis])[..., 0]
+        # Marquardt's scaling of the damping by the curvature of each parameter (kept positive definite)
+        curvature = np.maximum(np.diagonal(jtj, axis1=1, axis2=2), np.finfo(np.float64).tiny)
+        lhs = jtj + damping[active, np.newaxis, np.newaxis] * curvature[:, np.newaxis, :] * identity
+        steps = np.linalg.solve(lhs, -gradient[..., np.newaxis])[..., 0]
+
+        new_params = params[active] + steps
+        new_residuals = model['curve'](x, new_params) - y_stack[active]
+        new_costs = np.sum(np.square(new_residuals), axis=1)
+        improved = new_costs < costs[active]
+
+        improved_rows = active[improved]
+        decrease = costs[improved_rows] - new_costs[improved]
+        params[improved_rows] = new_params[improved]
+        residuals[improved_rows] = new_residuals[improved]
+        converged = np.zeros(active.size, dtype=bool)
+        converged[improved] = decrease <= FIT_TOLERANCE * costs[improved_rows]
+        costs[improved_rows] = new_costs[improved]
+        damping[active] = np.where(improved, damping[active] / 10, damping[active] * 10)
+        converged |= damping[active] > 1e10 # No step in any direction reduces the error
+
+        active = active[~converged]
+        if not active.size:
+            break
+    return params
+
+def fit_peak(mode, x_data, y_data, points, baseline_type, grid=None):
+    """
+    Integrates a peak by fitting a `mode` (key of `FIT_MODELS`) curve to it, given the full x vs. y graph
+    and the start, extremum and end points of the peak selected by the user (in any order).
+
+    The curve is fit to the peak after correcting for the baseline, starting from the picked extremum
+    and the width of the peak at half of its height. The area is that of the whole fitted curve, so
+    noise and the tails of the peak outside the selected points don't affect it.
+
+    Returns a dictionary like that returned by `trapz`, with `points` ordered as the start, end and
+    extremum of the peak and the fitted parameters under `fit`.
+    """
+    peak_start, extremum, peak_end = sorted(points[:3], key=lambda point: point[0])
+    peak_start_index, peak_end_index = index_bounds(x_data, peak_start[0], peak_end[0], grid)
+    extremum_index, _ = index_bounds(x_data, extremum[0], extremum[0], grid)
+    return fit_peak_batch(
+        mode, x_data, y_data[np.newaxis], [peak_start_index, peak_end_index, extremum_index], baseline_type)[0]
+
+def fit_peak_batch(mode, x_data, y_stack, point_indices, baseline_type):
+    """
+    Batched `fit_peak`: fits the same peak on every row of the 2D array `y_stack` (one injection per row,
+    all sharing `x_data`) at once, given the indices of the start, end and extremum of the peak.
+
+    Returns a list of results in the form returned by `fit_peak`, one per row.
+    """
+    model = FIT_MODELS[mode]
+    peak_start_index, peak_end_index = sorted(point_indices[:2])
+    extremum_index = min(max(point_indices[2], peak_start_index), peak_end_index)
+
+    corrected = correct_for_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index, baseline_type)
+    peak_x, corrected_peak_y = corrected['peak']
+
+    # Seed with the picked extremum and the full width at half maximum (from the number of points above it)
+    amplitudes = corrected_peak_y[:, extremum_index - peak_start_index]
+    spacing = (peak_x[-1] - peak_x[0]) / max(peak_x.size - 1, 1)
+    above_half = np.count_nonzero(corrected_peak_y * np.sign(amplitudes)[:, np.newaxis] >= np.abs(amplitudes)[:, np.newaxis] / 2, axis=1)
+    widths = np.maximum(above_half, 1) * spacing * model['width_per_fwhm']
+    seeds = np.column_stack([amplitudes, np.full(amplitudes.size, x_data[extremum_index]), widths])
+
+    fitted = levenberg_marquardt(model, peak_x, corrected_peak_y, seeds)
+    fitted[:, 2] = np.abs(fitted[:, 2]) # Both curves are symmetric in the sign of the width
+    areas = model['area'](fitted)
+
+    start_x, end_x, extremum_x = x_data[[peak_start_index, peak_end_index, extremum_index]]
+    return [{
+        'area': area,
+        'baseline': baseline,
+        'baseline_type': baseline_type,
+        'points': ((start_x, row_y[peak_start_index]), (end_x, row_y[peak_end_index]), (extremum_x, row_y[extremum_index])),
+        'fit': dict(zip(['amplitude', 'center', 'width'], params.tolist())),
+    } for area, baseline, row_y, params in zip(areas, corrected['baselines'], y_stack, fitted)]
+
+def component_model(model, count):
+    """
+    Model (in the form of `FIT_MODELS`) of the sum of `count` curves of `model`, parametrized by the
+    parameters of each curve in turn.
+    """
+    def curve(x, params):
+        rows = params.shape[0]
+        return model['curve'](x, params.reshape(rows * count, -1)).reshape(rows, count, -1).sum(axis=1)
+
+    def jacobian(x, params):
+        rows = params.shape[0]
+        curve_jacobian = model['jacobian'](x, params.reshape(rows * count, -1))
+        return curve_jacobian.reshape(rows, -1, curve_jacobian.shape[-1])
+
+    return {'curve': curve, 'jacobian': jacobian}
+
+def deconvolve(mode, x_data, y_data, points, baseline_type, grid=None):
+    """
+    Integrates several overlapping peaks at once by fitting the sum of one `mode` (key of `FIT_MODELS`)
+    curve per peak to them, given the full x vs. y graph and the points selected by the user: the start
+    of the peaks, the extremum of each peak and the end of the peaks, in that order.
+
+    Returns a list with a result per peak (in the order of the extrema), each in the form returned by
+    `fit_peak` with the area and parameters of that peak's curve only. The `points` of each result
+    are ordered as the start, end and its extremum followed by the extrema of the other peaks.
+    """
+    peak_start, peak_end = sorted([points[0], points[-1]], key=lambda point: point[0])
+    peak_start_index, peak_end_index = index_bounds(x_data, peak_start[0], peak_end[0], grid)
+    extremum_indices = [index_bounds(x_data, point[0], point[0], grid)[0] for point in points[1:-1]]
+    return deconvolve_batch(
+        mode, x_data, y_data[np.newaxis], [peak_start_index, peak_end_index, *extremum_indices], baseline_type)[0]
+
+def deconvolve_batch(mode, x_data, y_stack, point_indices, baseline_type):
+    """
+    Batched `deconvolve`: fits the same overlapping peaks on every row of the 2D array `y_stack` (one
+    injection per row, all sharing `x_data`) at once, given the indices of the start and end of the
+    peaks followed by the index of each extremum.
+
+    Returns a list with a list of results (as returned by `deconvolve`) per row.
+    """
+    model = FIT_MODELS[mode]
+    peak_start_index, peak_end_index = sorted(point_indices[:2])
+    extremum_indices = np.clip(point_indices[2:], peak_start_index, peak_end_index)
+    count = extremum_indices.size
+
+    corrected = correct_for_baseline_batch(x_data, y_stack, peak_start_index, peak_end_index, baseline_type)
+    peak_x, corrected_peak_y = corrected['peak']
+
+    # Seed each curve at its extremum, with a full width at half maximum equal to the distance to the
+    # nearest neighbouring extremum (or end of the peaks), since overlapping peaks can't be measured directly
+    centers = x_data[extremum_indices]
+    order = np.argsort(centers)
+    gaps = np.diff(np.concatenate([[peak_x[0]], centers[order], [peak_x[-1]]]))
+    spacing = (peak_x[-1] - peak_x[0]) / max(peak_x.size - 1, 1)
+    widths = np.empty(count)
+    widths[order] = np.maximum(np.minimum(gaps[:-1], gaps[1:]), spacing) * model['width_per_fwhm']
+    amplitudes = corrected_peak_y[:, extremum_indices - peak_start_index]
+    seeds = np.stack(np.broadcast_arrays(amplitudes, centers, widths), axis=-1).reshape(y_stack.shape[0], -1)
+
+    fitted = levenberg_marquardt(component_model(model, count), peak_x, corrected_peak_y, seeds)
+    fitted = fitted.reshape(-1, count, 3)
+    fitted[..., 2] = np.abs(fitted[..., 2]) # Both curves are symmetric in the sign of the width
+    areas = model['area'](fitted.reshape(-1, 3)).reshape(-1, count)
+
+    start_x, end_x = x_data[peak_start_index], x_data[peak_end_index]
+    results = []
+    for row_areas, baseline, row_y, row_params in zip(areas, corrected['baselines'], y_stack, fitted):
+        extrema = [(x_data[index], row_y[index]) for index in extremum_indices]
+        results.append([{
+            'area': row_areas[component],
+            'baseline': baseline,
+            'baseline_type': baseline_type,
+            'points': ((start_x, row_y[peak_start_index]), (end_x, row_y[peak_end_index]),
+                extrema[component], *extrema[:component], *extrema[component + 1:]),
+            'fit': dict(zip(['amplitude', 'center', 'width'], row_params[component].tolist())),
+        } for component in range(count)])
+    return results
+
+def fit_draw(mode, x_data, y_data, integral, axes, grid=None):
+    """
+    Given a fit integration result (from `fit_peak`) and an `axes` object to draw to, draw the baseline
+    and the fitted curve on top of it, filling the area of the curve.
+
+    Returns a list of all artists drawn for later cleanup.
+    """
+    (baseline_x, baseline_y), _ = integral['baseline']
+    fit = integral['fit']
+    params = np.array([[fit['amplitude'], fit['center'], fit['width']]])
+    curve_y = baseline_y + FIT_MODELS[mode]['curve'](baseline_x, params)[0]
+    color = '#38A9FF' if fit['amplitude'] >= 0 else '#FF4A38'
+    baseline, = axes.plot(baseline_x, baseline_y, color=BASELINE_COLOR)
+    curve, = axes.plot(baseline_x, curve_y, color=color)
+    fill = axes.fill_between(baseline_x, baseline_y, curve_y, color=color, alpha=0.5)
+    return [baseline, curve, fill]
+
+def nearest_sample(mouse_event, grid, y_data, radius=None):
+    """
+    Given a user click (matplotlib `MouseEvent`) on the axes where the signal `y_data` on the time axis
+    `grid` is drawn, return the index of the sample nearest the click on screen, or None if no sample is
+    within `radius` pixels (`PICK_RADIUS` by default).
+
+    Only the samples within `radius` pixels horizontally of the click are compared: their index range
+    comes straight from the time axis (like a binary search, but by arithmetic on the uniform grid), so
+    a click costs the same however long the signal and however it is drawn.
+    """
+    radius = PICK_RADIUS if radius is None else radius
+    axes = mouse_event.inaxes
+    if axes is None or grid.size == 0:
+        return None
+    to_data = axes.transData.inverted()
+    edges_x = to_data.transform([(mouse_event.x - radius, mouse_event.y), (mouse_event.x + radius, mouse_event.y)])[:, 0]
+    start, stop = grid.index_at_or_after([edges_x.min(), edges_x.max()])
+    candidates = np.arange(start, min(stop + 1, grid.size))
+    if candidates.size == 0:
+        return None
+    screen_xy = axes.transData.transform(np.column_stack((grid.values_at(candidates), y_data[candidates])))
+    distances = np.hypot(screen_xy[:, 0] - mouse_event.x, screen_xy[:, 1] - mouse_event.y)
+    nearest = np.argmin(distances)
+    return int(candidates[nearest]) if distances[nearest] <= radius else None
+
+def spread(integral, injections_by_key, chunk_size=None, reference=None):
+    """
+    Integrate the same peak as `integral` (a result of `INTEGRATION_BY_MODE` along with its 'mode') on many
+    injections (`injections.Injection`s or equivalent) at once, as keyed in `injections_by_key`.
+
+    If the injection the peak was picked on is given as `reference`, retention time drift is corrected
+    for: the shift of each injection relative to it around the peak is estimated (see
+    `alignment.estimate_shifts`), the picked points are moved by that shift and each result records it
+    as 'retention_shift' (in seconds).
+
+    Injections are grouped by time axis and each group is integrated in batched passes of at most
+    `chunk_size` injections (to bound memory use), so that every baseline and area in a pass is computed
+    together. Points moved by different shifts are handled within a group by offsetting each injection's
+    signal so that its points line up with those of the others (see `shift_result`); only injections whose
+    points don't keep the same spacing, or whose result depends on more than the samples around the peak
+    (global baselines, and peaks near either end of the signal), are integrated apart. Injections whose
+    time axis doesn't extend as far as the peak are skipped.
+
+    Returns a dict of key to integration result (not yet interpreted) for every integrated injection.
+    """
+    if chunk_size is None:
+        chunk_size = SPREAD_CHUNK_SIZE
+    points_x = np.array([point[0] for point in integral['points']])
+    batch_func = BATCH_INTEGRATION_BY_MODE[integral['mode']]
+    baseline_type = integral['baseline_type']
+    shifts = {}
+    if reference is not None:
+        shifts = alignment.estimate_shifts(reference, injections_by_key, points_x.min(), points_x.max())
+
+    # Injections are keyed by time axis, point indices relative to the first point and, for those that
+    # can't be offset, the index of the first point
+    keys_by_group, anchors = {}, {}
+    for key, injection in injections_by_key.items():
+        grid = injection.grid
+        shifted_x = points_x + shifts.get(key, 0.0)
+        if shifted_x.min() < grid.start or shifted_x.max() > grid.stop:
+            continue
+        # Snap each point to the first sample at or after it, as when integrating by hand
+        point_indices = [int(index) for index in grid.index_at_or_after(shifted_x)]
+        anchor = anchors[key] = min(point_indices)
+        peak_start_index, peak_end_index = sorted(point_indices[:2])
+        movable = baseline_type not in GLOBAL_BASELINE_METHODS and \
+            within_baseline_window(grid.size, peak_start_index, peak_end_index)
+        relative_indices = tuple(index - anchor for index in point_indices)
+        group = ((grid.start, grid.stop, grid.size), relative_indices, None if movable else anchor)
+        keys_by_group.setdefault(group, []).append(key)
+
+    results = {}
+    for (_, relative_indices, _), keys in keys_by_group.items():
+        grid = injections_by_key[keys[0]].grid
+        # Integrated as if every injection's points were at those of the earliest, on as many samples
+        # as all the injections have from there on
+        base = min(anchors[key] for key in keys)
+        length = grid.size - max(anchors[key] for key in keys) + base
+        x_data = grid.values()[:length]
+        point_indices = [base + index for index in relative_indices]
+        for chunk_start in range(0, len(keys), chunk_size):
+            chunk = keys[chunk_start:chunk_start + chunk_size]
+            windows = [slice(anchors[key] - base, anchors[key] - base + length) for key in chunk]
+            y_stack = np.stack([injections_by_key[key]['y'][window] for key, window in zip(chunk, windows)])
+            # Trapezoidal areas come from the cumulative area under each injection's signal
+            cumulative = {'cumulative_areas': [
+                injections_by_key[key].cumulative_area[window] for key, window in zip(chunk, windows)
+            ]} if integral['mode'] == 'Trapezoidal' else {}
+            rows = batch_func(x_data, y_stack, point_indices, baseline_type, **cumulative)
+            for key, row in zip(chunk, rows):
+                # Deconvolution gives a result per overlapping peak, with that of the spread peak listed first
+                result = row[0] if isinstance(row, list) else row
+                results[key] = shift_result(result, grid, anchors[key] - base)
+
+    if reference is not None:
+        results = {key: {**result, 'retention_shift': shifts[key]} for key, result in results.items()}
+    return {key: results[key] for key in injections_by_key if key in results}
+
+def within_baseline_window(size, peak_start_index, peak_end_index):
+    """
+    Whether the points used to fit the baseline of a peak (see `baseline_window`) all lie within an
+    array of `size`, clear of both of its ends, so that moving the peak by a few samples moves them too.
+    """
+    margin = (peak_end_index - peak_start_index + 1) // 2
+    return peak_start_index > 0 and peak_start_index - margin >= 0 and peak_end_index + 2 + margin <= size
+
+def shift_result(result, grid, offset):
+    """
+    A batched integration result (as from `BATCH_INTEGRATION_BY_MODE`) moved `offset` samples later along
+    the time axis `grid`: its points, baseline and fitted curve as they are on an injection whose signal
+    matches the integrated one, only that many samples later. Areas are unaffected.
+    """
+    if offset == 0:
+        return result
+    shift = offset * grid.step
+    (baseline_x, baseline_y), baseline_pure = result['baseline']
+    if isinstance(baseline_pure, Polynomial):
+        baseline_pure = Polynomial(baseline_pure.coef, domain=baseline_pure.domain + shift, window=baseline_pure.window)
+    elif 'slope' in baseline_pure:
+        baseline_pure = {**baseline_pure, 'y_int': baseline_pure['y_int'] - baseline_pure['slope'] * shift}
+    shifted = {
+        **result,
+        'baseline': ((baseline_x + shift, baseline_y), baseline_pure),
+        # Points are at samples, so they're moved exactly
+        'points': tuple((np.float64(grid.values_at(grid.index_of(x) + offset)), y) for x, y in result['points']),
+    }
+    if 'fit' in result:
+        shifted['fit'] = {**result['fit'], 'center': result['fit']['center'] + shift}
+    return shifted
 
 def interpret_integral(integral, total_gas_mol, mol_e, calib_val, reduction_count, avg_current):
     """
@@ -201,20 +936,93 @@ def interpret_integral(integral, total_gas_mol, mol_e, calib_val, reduction_coun
         'partial_current': partial_current
     }
 
-# TODO: Add Gaussian and Lorentzian integration types
+# Curves fit by the Gaussian and Lorentzian integration modes, with the area of the whole curve and the
+# ratio of the curve's width parameter to its full width at half maximum (for the initial guess)
+FIT_MODELS = {
+    'Gaussian': {
+        'curve': gaussian_curve,
+        'jacobian': gaussian_jacobian,
+        'area': lambda params: params[:, 0] * params[:, 2] * np.sqrt(2 * np.pi),
+        'width_per_fwhm': 1 / (2 * np.sqrt(2 * np.log(2))),
+    },
+    'Lorentzian': {
+        'curve': lorentzian_curve,
+        'jacobian': lorentzian_jacobian,
+        'area': lambda params: np.pi * params[:, 0] * params[:, 2],
+        'width_per_fwhm': 1 / 2,
+    },
+}
+FIT_MAX_ITERATIONS = 100
+FIT_TOLERANCE = 1e-10
+
+# Deconvolution modes, fitting one curve per overlapping peak (as curve name and number of peaks)
+DECONVOLUTION_PEAK_COUNTS = (2, 3)
+DECONVOLUTION_MODES = {
+    f'{count}-Peak {name}': (name, count) for name in FIT_MODELS for count in DECONVOLUTION_PEAK_COUNTS
+}
 
 # Function handles to numerically integrate
 INTEGRATION_BY_MODE = {
     'Trapezoidal': trapz,
+    'Gaussian': partial(fit_peak, 'Gaussian'),
+    'Lorentzian': partial(fit_peak, 'Lorentzian'),
+    **{mode: partial(deconvolve, name) for mode, (name, _) in DECONVOLUTION_MODES.items()},
+}
+
+# Function handles to numerically integrate the same peak on many injections at once (see `spread`)
+BATCH_INTEGRATION_BY_MODE = {
+    'Trapezoidal': trapz_batch,
+    'Gaussian': partial(fit_peak_batch, 'Gaussian'),
+    'Lorentzian': partial(fit_peak_batch, 'Lorentzian'),
+    **{mode: partial(deconvolve_batch, name) for mode, (name, _) in DECONVOLUTION_MODES.items()},
 }
 
 # Function handles to draw a graphical representation of the successful numerical integration
 RENDER_BY_MODE = {
     'Trapezoidal': trapz_draw,
+    'Gaussian': partial(fit_draw, 'Gaussian'),
+    'Lorentzian': partial(fit_draw, 'Lorentzian'),
+    # Each overlapping peak is drawn as its own integral
+    **{mode: partial(fit_draw, name) for mode, (name, _) in DECONVOLUTION_MODES.items()},
 }
 
+# Maximum distance (in pixels) from a click to the sample it picks
+PICK_RADIUS = 4
+
 POLYFIT_DEGREE = 7
+# Baselines of the whole injection (see `baselines`), by baseline type
+GLOBAL_BASELINE_METHODS = {
+    'ALS (Global)': 'Asymmetric least squares',
+    'Rolling Ball (Global)': 'Rolling ball',
+}
 BASELINES_BY_TYPE = {
     f'Poly (Deg. {POLYFIT_DEGREE})': poly_baseline,
-    'Linear': linear_baseline
-}
\ No newline at end of file
+    'Linear': linear_baseline,
+    **{name: partial(global_baseline, method) for name, method in GLOBAL_BASELINE_METHODS.items()},
+}
+BATCH_BASELINES_BY_TYPE = {
+    f'Poly (Deg. {POLYFIT_DEGREE})': poly_baseline_batch,
+    'Linear': linear_baseline_batch,
+    **{name: partial(global_baseline_batch, method) for name, method in GLOBAL_BASELINE_METHODS.items()},
+}
+ROW_BASELINES_BY_TYPE = {
+    f'Poly (Deg. {POLYFIT_DEGREE})': poly_baseline_rows,
+    'Linear': linear_baseline_rows,
+    **{name: partial(global_baseline_rows, method) for name, method in GLOBAL_BASELINE_METHODS.items()},
+}
+# Closed forms of the trapezoidal area under a baseline over its peak (others sum every point)
+BASELINE_AREA_BY_TYPE = {
+    f'Poly (Deg. {POLYFIT_DEGREE})': poly_baseline_area,
+    'Linear': linear_baseline_area,
+}
+# B_2, B_4, ... of the Euler-Maclaurin formula, enough for polynomial baselines up to degree 12
+BERNOULLI_NUMBERS = (1 / 6, -1 / 30, 1 / 42, -1 / 30, 5 / 66, -691 / 2730)
+
+# Number of most recently used polynomial fits kept by `poly_fit_plan` (and area weights kept by
+# `poly_area_weights`; 0 disables caching)
+POLY_FIT_CACHE_SIZE = 32
+_poly_fit_plans = OrderedDict()
+_poly_area_weights = OrderedDict()
+
+# Maximum number of injections stacked into one array by `spread`
+SPREAD_CHUNK_SIZE = 256
\ No newline at end of file
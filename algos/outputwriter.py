@@ -14,7 +14,7 @@ from datetime import datetime
 from math import isnan
 import numbers
 import matplotlib
-from algos import fileparse
+from algos import fileparse, numericintegrate, smoothing
 from util import channels
 
 settings_header = """
@@ -51,7 +51,11 @@ recovering a numerical approximation will likely result in numerical instability
 
 Units:
 - area = mV * sec
-- peak_start / peak_end = (sec, mV)
+- peak_start / peak_end / peak_extremum = (sec, mV)
+- fit (Gaussian and Lorentzian peaks only): amplitude = mV, center = sec,
+  width = sec (standard deviation for Gaussian, half width at half maximum for Lorentzian)
+- retention_shift (spread peaks only) = sec, estimated retention time drift relative to
+  the injection the spread peak was picked on (positive when the peak elutes later)
 --------------------------------------------------------------------------------------------
 
 """
@@ -132,8 +136,16 @@ def get_integration_output(integrals_by_page):
                 'integration_mode': integral['mode'],
                 'peak_start': integral['points'][0],
                 'peak_end': integral['points'][1],
-                'baseline_type': integral['baseline_type']
+                'baseline_type': integral['baseline_type'],
+                # Filter applied to the signal before integrating (see `smoothing.FILTERS`)
+                'smoothing': integral.get('smoothing', smoothing.NO_FILTER)
             }
+            if 'fit' in integral:
+                # Fitted curve parameters of Gaussian/Lorentzian integrals
+                curr_integral['peak_extremum'] = integral['points'][2]
+                curr_integral['fit'] = integral['fit']
+            if 'retention_shift' in integral:
+                curr_integral['retention_shift'] = integral['retention_shift']
 
             baseline_type = integral['baseline_type']
             baseline_pure = integral['baseline'][1]
@@ -149,6 +161,9 @@ def get_integration_output(integrals_by_page):
                 }
             elif 'linear' in baseline_type.lower():
                 curr_integral['baseline'] = f"y = {baseline_pure['slope']} * x + {baseline_pure['y_int']}"
+            elif baseline_type in numericintegrate.GLOBAL_BASELINE_METHODS:
+                # Method and parameters of the whole-injection baseline
+                curr_integral['baseline'] = baseline_pure
             
             curr_list.append(curr_integral)
         if curr_list:
@@ -0,0 +1,197 @@
+"""
+Persistent on-disk cache of parsed GC and CA files, so that re-picking the same experiment (or relaunching
+the program) doesn't re-parse every text file from scratch.
+
+Each cached file gets its own entry directory containing one `.npy` file per parsed array (loaded back
+memory-mapped, so a hit costs almost nothing until the data is actually read) and a `meta.json` holding
+every non-array field along with the fingerprint of the source file. An entry is valid only while the
+source file has the same size and modification time; if only the modification time differs (e.g. the
+file was copied or touched), a content hash decides. The total cache size is capped, with the least
+recently used entries evicted first; the total is tracked as entries are written, so the cache directory
+is only scanned once it may be over its cap.
+"""
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+import numpy as np
+from util import get_script_path
+from algos.injections import UniformGrid, Injection
+
+# Bump whenever the layout of any parsed object changes so stale entries are never loaded
+CACHE_VERSION = 3
+DEFAULT_DIR_NAME = 'chromelectric_cache'
+DEFAULT_MAX_BYTES = 1024 ** 3
+META_FILE_NAME = 'meta.json'
+
+def content_hash(path):
+    """Hash of the full contents of the file at `path`, read in fixed-size blocks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as handle:
+        while block := handle.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+def encode(value, arrays):
+    """
+    Convert a parsed value into its JSON form. Numpy arrays are moved into `arrays` (to be written
+    separately) and replaced by a reference to their file; datetimes are stored as ISO strings and
+    injections as their fields (with the time grid as its parameters).
+    """
+    if isinstance(value, np.ndarray):
+        name = f'{len(arrays)}.npy'
+        arrays[name] = value
+        return {'__array__': name}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, Injection):
+        grid = value.grid
+        return {'__injection__': encode({
+            'y': value.y, 'grid': [grid.start, grid.stop, grid.size], 'warning': value.warning,
+            'start_time': value.start_time, 'sample_rate': value.sample_rate, 'num_readings': value.num_readings
+        }, arrays)}
+    if isinstance(value, dict):
+        return {'__dict__': {key: encode(val, arrays) for key, val in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return [encode(val, arrays) for val in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def decode(value, entry_dir):
+    """Inverse of `encode`; arrays are memory-mapped read-only from `entry_dir`."""
+    if isinstance(value, dict):
+        if '__array__' in value:
+            return np.load(os.path.join(entry_dir, value['__array__']), mmap_mode='r')
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__injection__' in value:
+            fields = decode(value['__injection__'], entry_dir)
+            return Injection(**{**fields, 'grid': UniformGrid(*fields['grid'])})
+        return {key: decode(val, entry_dir) for key, val in value['__dict__'].items()}
+    if isinstance(value, list):
+        return [decode(val, entry_dir) for val in value]
+    return value
+
+def entry_size(entry_dir):
+    """Total size of the files of the cache entry at `entry_dir`."""
+    return sum(f.stat().st_size for f in os.scandir(entry_dir))
+
+class ParseCache:
+    """
+    Cache of parsed files keyed by absolute source path. All failures to read or write the cache
+    (e.g. a read-only install directory) are treated as misses, so callers can always fall back to parsing.
+    """
+    def __init__(self, dirpath, max_bytes=DEFAULT_MAX_BYTES):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        # Content hashes already computed, by (absolute path, size, mtime), so a file is hashed at most once
+        self.hashes = {}
+        # Total size of all entries; unknown (None) until `evict` first scans the cache directory
+        self.total_bytes = None
+
+    def entry_dir(self, path):
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.dirpath, key)
+
+    def file_hash(self, path, stat):
+        """Content hash of the file at `path` (with `os.stat` result `stat`), reusing any earlier result."""
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.hashes:
+            self.hashes[key] = content_hash(path)
+        return self.hashes[key]
+
+    def load(self, path):
+        """Return the cached parse of the file at `path`, or None if there is no valid entry."""
+        entry_dir = self.entry_dir(path)
+        meta_path = os.path.join(entry_dir, META_FILE_NAME)
+        try:
+            stat = os.stat(path)
+            with open(meta_path, 'r') as handle:
+                meta = json.load(handle)
+            if meta['version'] != CACHE_VERSION or meta['size'] != stat.st_size:
+                return None
+            if meta['mtime_ns'] != stat.st_mtime_ns:
+                if meta['hash'] != self.file_hash(path, stat):
+                    return None
+                # Same contents under a new timestamp; remember it so we skip hashing next time
+                meta['mtime_ns'] = stat.st_mtime_ns
+                with open(meta_path, 'w') as handle:
+                    json.dump(meta, handle)
+            parsed = decode(meta['parsed'], entry_dir)
+            os.utime(meta_path) # Mark as recently used for LRU eviction
+            return parsed
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, path, parsed):
+        """Write `parsed` (the parse of the file at `path`) to the cache. Returns True on success."""
+        entry_dir = self.entry_dir(path)
+        tmp_dir = f'{entry_dir}.tmp-{os.getpid()}'
+        try:
+            stat = os.stat(path)
+            arrays = {}
+            meta = {
+                'version': CACHE_VERSION,
+                'source': os.path.abspath(path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'hash': self.file_hash(path, stat),
+                'parsed': encode(parsed, arrays)
+            }
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, array in arrays.items():
+                # Non-contiguous arrays are written in buffered blocks, so memory-mapped input is never copied whole
+                np.save(os.path.join(tmp_dir, name), array, allow_pickle=False)
+            # Metadata written last so a partially written entry is never considered valid
+            with open(os.path.join(tmp_dir, META_FILE_NAME), 'w') as handle:
+                json.dump(meta, handle)
+            replaced_size = entry_size(entry_dir) if os.path.isdir(entry_dir) else 0
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+            if self.total_bytes is not None:
+                self.total_bytes += entry_size(entry_dir) - replaced_size
+            return True
+        except (OSError, ValueError, TypeError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache is no larger than `max_bytes`. Cheap unless the
+        cache may be over its cap, so it's best called once after storing a batch of entries.
+        """
+        if self.total_bytes is not None and self.total_bytes <= self.max_bytes:
+            return
+        try:
+            entries = []
+            for entry in os.scandir(self.dirpath):
+                if not entry.is_dir():
+                    continue
+                files = list(os.scandir(entry.path))
+                size = sum(f.stat().st_size for f in files)
+                meta = [f for f in files if f.name == META_FILE_NAME]
+                last_used = meta[0].stat().st_mtime if meta else 0 # Incomplete entries go first
+                entries.append((last_used, size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Can fail on Windows if the entry is still memory-mapped; it'll be retried next time
+            shutil.rmtree(entry_path, ignore_errors=True)
+            if not os.path.exists(entry_path):
+                total -= size
+        self.total_bytes = total
+
+_default_cache = None
+
+def default_cache():
+    """Shared cache stored alongside the program (next to the settings file)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ParseCache(os.path.join(os.path.split(get_script_path())[0], DEFAULT_DIR_NAME))
+    return _default_cache
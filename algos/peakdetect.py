@@ -0,0 +1,124 @@
+"""
+Module handling automatic detection of gas peaks within the retention windows given in the gas list,
+so that a whole run can be pre-integrated for the user to review instead of picking every peak by hand.
+
+Detection works on all injections of a channel sharing a time axis at once: the retention window of
+every injection is stacked into a 2D array (one injection per row) and each step below is a single
+vectorized operation over all rows.
+"""
+import numpy as np
+from algos import numericintegrate, baselines
+
+# Width (in seconds) of the moving average applied before looking for peaks
+SMOOTHING_SECONDS = 0.5
+# Minimum prominence of a detected peak, as a multiple of the noise level of its injection
+MIN_PROMINENCE = 5
+# A peak starts/ends where the signal rises/falls at less than this fraction of its steepest slope
+EDGE_SLOPE_FRACTION = 0.05
+# Retention windows narrower than this many points are ignored
+MIN_WINDOW_SIZE = 5
+
+def noise_level(y_stack):
+    """
+    Robust estimate of the standard deviation of the noise in each row of `y_stack`, from the median
+    absolute deviation of the differences between consecutive points.
+    """
+    differences = np.diff(y_stack, axis=1)
+    deviations = np.abs(differences - np.median(differences, axis=1)[:, np.newaxis])
+    return 1.4826 * np.median(deviations, axis=1) / np.sqrt(2)
+
+def find_peaks(y_stack, smoothing_width):
+    """
+    Find the most prominent peak in each row of `y_stack`.
+
+    Returns arrays of the start and end index of the peak in each row and whether a peak
+    (at least `MIN_PROMINENCE` times as prominent as the noise) was found in that row at all.
+    """
+    size = y_stack.shape[1]
+    smoothed = baselines.moving_average(y_stack, smoothing_width)
+    indices = np.arange(size)
+    apexes = np.argmax(smoothed, axis=1)[:, np.newaxis]
+    apex_values = np.take_along_axis(smoothed, apexes, axis=1)[:, 0]
+
+    # Prominence: height of the apex above the higher of the lowest points on either side of it
+    left_min = np.where(indices <= apexes, smoothed, np.inf).min(axis=1)
+    right_min = np.where(indices >= apexes, smoothed, np.inf).min(axis=1)
+    prominences = apex_values - np.maximum(left_min, right_min)
+    found = prominences >= MIN_PROMINENCE * noise_level(y_stack)
+
+    # Walk out from the steepest rise before the apex (and the steepest fall after it) until the
+    # signal stops rising (or falling)
+    slopes = np.diff(smoothed, axis=1)
+    slope_indices = indices[:-1]
+    rising = np.where(slope_indices < apexes, slopes, -np.inf)
+    falling = np.where(slope_indices >= apexes, -slopes, -np.inf)
+    steepest_rise, steepest_fall = np.argmax(rising, axis=1)[:, np.newaxis], np.argmax(falling, axis=1)[:, np.newaxis]
+    rise = np.take_along_axis(rising, steepest_rise, axis=1)
+    fall = np.take_along_axis(falling, steepest_fall, axis=1)
+    flat_before = (slope_indices < steepest_rise) & (slopes < EDGE_SLOPE_FRACTION * rise)
+    flat_after = (slope_indices > steepest_fall) & (-slopes < EDGE_SLOPE_FRACTION * fall)
+    starts = np.where(flat_before, slope_indices, 0).max(axis=1)
+    ends = np.where(flat_after, slope_indices + 1, size - 1).min(axis=1)
+    return (starts, ends, found & (starts < ends))
+
+def detect(injections_by_key, retention_min=None, retention_max=None):
+    """
+    Find the peak within the retention window (in seconds) of every injection (`injections.Injection`s
+    or equivalent) as keyed in `injections_by_key`. A missing minimum or maximum retention time means
+    the start or end of the injection respectively.
+
+    Injections are grouped by time axis and each group is searched in one batched pass.
+
+    Returns a dict of key to the start and end index of the detected peak, for every injection in which
+    a peak was found.
+    """
+    keys_by_grid = {}
+    for key, injection in injections_by_key.items():
+        grid = injection.grid
+        keys_by_grid.setdefault((grid.start, grid.stop, grid.size), []).append(key)
+
+    peaks = {}
+    for keys in keys_by_grid.values():
+        grid = injections_by_key[keys[0]].grid
+        window_start = 0 if retention_min is None else int(grid.index_at_or_after(retention_min))
+        window_end = grid.size if retention_max is None else int(grid.index_at_or_after(retention_max)) + 1
+        window_end = min(window_end, grid.size)
+        if window_end - window_start < MIN_WINDOW_SIZE:
+            continue
+
+        smoothing_width = max(1, round(SMOOTHING_SECONDS / grid.step)) if grid.step else 1
+        for chunk_start in range(0, len(keys), numericintegrate.SPREAD_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + numericintegrate.SPREAD_CHUNK_SIZE]
+            y_stack = np.stack([injections_by_key[key]['y'][window_start:window_end] for key in chunk])
+            starts, ends, found = find_peaks(y_stack.astype(np.float64, copy=False), smoothing_width)
+            for key, start, end, is_found in zip(chunk, starts, ends, found):
+                if is_found:
+                    peaks[key] = (window_start + int(start), window_start + int(end))
+    return peaks
+
+def integrate_detected(injections_by_key, retention_min, retention_max, baseline_type):
+    """
+    Detect the peak within the retention window of every injection (see `detect`) and integrate it
+    trapezoidally with the given baseline type. Injections sharing a time axis are integrated together
+    whatever bounds their peaks were detected at (see `numericintegrate.trapz_rows`), in batches of at
+    most `numericintegrate.SPREAD_CHUNK_SIZE` injections.
+
+    Returns a dict of key to integration result (not yet interpreted) for every injection with a peak.
+    """
+    peaks = detect(injections_by_key, retention_min, retention_max)
+    keys_by_grid = {}
+    for key in peaks:
+        grid = injections_by_key[key].grid
+        keys_by_grid.setdefault((grid.start, grid.stop, grid.size), []).append(key)
+
+    integrals = {}
+    for keys in keys_by_grid.values():
+        x_data = injections_by_key[keys[0]].grid.values()
+        for chunk_start in range(0, len(keys), numericintegrate.SPREAD_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + numericintegrate.SPREAD_CHUNK_SIZE]
+            y_stack = np.stack([injections_by_key[key]['y'] for key in chunk])
+            cumulative_areas = np.stack([injections_by_key[key].cumulative_area for key in chunk])
+            starts, ends = np.array([peaks[key] for key in chunk]).T
+            integrals.update(zip(chunk, numericintegrate.trapz_rows(
+                x_data, y_stack, starts, ends, baseline_type, cumulative_areas)))
+    return {key: integrals[key] for key in injections_by_key if key in integrals}
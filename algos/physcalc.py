@@ -1,4 +1,7 @@
 """Physical calculation module. Largely responsible for converting peak areas into useful data."""
+from datetime import datetime
+import os
+import tempfile
 import numpy as np
 from math import nan
 
@@ -17,6 +20,156 @@ def average_current(cyclic_amp, end_time, duration):
     start_index, end_index = [np.searchsorted(time_column, target) for target in (target_start, target_end)]
     return np.mean(cyclic_amp['current_vs_time'][start_index:end_index + 1, 1])
 
+class ChargeIndex:
+    """
+    Prefix sums over the current of a CA file (`cyclic_amp`, as parsed by `fileparse.CA`), computed once so
+    that the average current or the charge passed over any window of time is found with two binary searches
+    and a subtraction rather than a reduction over the window. All queries are vectorized, so batch callers
+    can pass arrays of thousands of windows at once. Times are in seconds offset from acquisition start
+    (see `offsets`), current in milliamperes and charge in millicoulombs.
+    """
+    # Inputs at least this large that are memory-mapped get their prefix sums memory-mapped too
+    FILE_BACKED_MIN_BYTES = 64 * 1024 ** 2
+    # Number of samples summed at a time, bounding the temporary memory used while indexing
+    CHUNK_ROWS = 200000
+
+    def __init__(self, cyclic_amp):
+        self.acquisition_start = cyclic_amp['acquisition_start']
+        columns = cyclic_amp['current_vs_time']
+        rows = columns.shape[0]
+        # Current is only ever indexed at a few samples, so the parsed column is used as is
+        self.current = columns[:, 1] if columns.dtype == np.float64 else columns[:, 1].astype(np.float64)
+
+        # Time needs to be contiguous for binary searches. Along with the prefix sums, it's kept in a single
+        # buffer, which for large memory-mapped files is itself a memory-mapped temporary file
+        backed = isinstance(columns, np.memmap) and columns.nbytes >= ChargeIndex.FILE_BACKED_MIN_BYTES
+        buffer = ChargeIndex.allocate(2 * rows + 1 + max(rows, 1), backed)
+        self.time = buffer[:rows]
+        # Sum of all samples before each index (with a leading zero) for per-sample averages
+        self.current_sums = buffer[rows:2 * rows + 1]
+        # Trapezoidal (time-weighted) charge passed from the first sample up to each sample
+        self.charge = buffer[2 * rows + 1:]
+
+        self.current_sums[0] = self.charge[0] = 0.0
+        for start in range(0, rows, ChargeIndex.CHUNK_ROWS):
+            stop = min(start + ChargeIndex.CHUNK_ROWS, rows)
+            # Includes the sample before the chunk for the segment joining it to the previous chunk
+            previous = max(start - 1, 0)
+            chunk = np.array(columns[previous:stop], dtype=np.float64)
+            time, current = chunk[:, 0], chunk[:, 1]
+            self.time[start:stop] = time[start - previous:]
+            # Each sum continues from the last of the previous chunk, adding up in the same order as one cumsum would
+            self.current_sums[start + 1:stop + 1] = \
+                np.cumsum(np.concatenate(([self.current_sums[start]], current[start - previous:])))[1:]
+            segment_charge = np.diff(time) * (current[1:] + current[:-1]) / 2
+            self.charge[previous + 1:stop] = np.cumsum(np.concatenate(([self.charge[previous]], segment_charge)))[1:]
+
+    @staticmethod
+    def allocate(size, backed):
+        """
+        Empty float64 array of `size` values, either in memory or, if `backed`, memory-mapped from a new
+        temporary file (removed right away where possible; the mapping stays valid).
+        """
+        if not backed:
+            return np.empty(size, dtype=np.float64)
+        fd, path = tempfile.mkstemp(suffix='.bin', prefix='chromelectric-charge-')
+        os.close(fd)
+        buffer = np.memmap(path, dtype=np.float64, mode='w+', shape=(size,))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        # Plain array view (keeping the mapping alive) so that results of queries are plain arrays
+        return buffer.view(np.ndarray)
+
+    def offsets(self, times):
+        """
+        Convert a datetime, a sequence of datetimes or a numpy datetime64 array into seconds offset from
+        acquisition start, as a numpy array.
+        """
+        if isinstance(times, np.ndarray) and np.issubdtype(times.dtype, np.datetime64):
+            return (times - np.datetime64(self.acquisition_start)) / np.timedelta64(1, 's')
+        if isinstance(times, datetime):
+            return np.float64((times - self.acquisition_start).total_seconds())
+        return np.array([(time - self.acquisition_start).total_seconds() for time in times], dtype=np.float64)
+
+    def average_current(self, end_offsets, duration):
+        """
+        Vectorized equivalent of `average_current`: the mean of the current samples in the `duration` seconds
+        ending at each of `end_offsets`, or nan for windows that don't overlap the CA data at all.
+        """
+        target_end = np.asarray(end_offsets, dtype=np.float64)
+        target_start = target_end - duration
+        start_index = np.searchsorted(self.time, target_start)
+        end_index = np.minimum(np.searchsorted(self.time, target_end) + 1, self.time.size) # Inclusive end
+
+        misaligned = (target_start > self.time[-1]) | (target_end < self.time[0])
+        count = np.where(misaligned, 1, end_index - start_index)
+        averages = (self.current_sums[end_index] - self.current_sums[start_index]) / count
+        return np.where(misaligned, nan, averages)
+
+    def charge_at(self, offsets):
+        """
+        Charge passed from the first sample up to each of `offsets`, interpolating the current linearly
+        between samples. Offsets outside the CA data are clamped to its first or last sample.
+        """
+        offsets = np.clip(np.asarray(offsets, dtype=np.float64), self.time[0], self.time[-1])
+        if self.time.size < 2:
+            return np.zeros_like(offsets)
+        index = np.clip(np.searchsorted(self.time, offsets, side='right') - 1, 0, self.time.size - 2)
+        elapsed = offsets - self.time[index]
+        spacing = self.time[index + 1] - self.time[index]
+        slope = np.divide(
+            self.current[index + 1] - self.current[index], spacing,
+            out=np.zeros_like(elapsed), where=spacing > 0)
+        current_at_offset = self.current[index] + slope * elapsed
+        return self.charge[index] + elapsed * (self.current[index] + current_at_offset) / 2
+
+    def charge_between(self, start_offsets, end_offsets):
+        """Time-weighted charge passed between each pair of start and end offsets."""
+        return self.charge_at(end_offsets) - self.charge_at(start_offsets)
+
+    def mean_current(self, start_offsets, end_offsets):
+        """Time-weighted average current between each pair of start and end offsets."""
+        start_offsets = np.asarray(start_offsets, dtype=np.float64)
+        end_offsets = np.asarray(end_offsets, dtype=np.float64)
+        return self.charge_between(start_offsets, end_offsets) / (end_offsets - start_offsets)
+
+def align_injections(injection_offsets, trial_end_offsets, potentials_by_trial, charge_index, duration, tolerance, Ru, pH, deviation):
+    """
+    Align a batch of injections to the constant-voltage CA trials they were sampling, in one vectorized pass.
+
+    `injection_offsets` are injection timestamps and `trial_end_offsets` the cumulative trial end times (one
+    more than the number of trials, starting with the technique start), both in seconds offset from CA
+    acquisition start. An injection is aligned to a trial if its timestamp is between the previous trial's end
+    and its own end, both shifted later by `tolerance` seconds; on a shared boundary, the earlier trial wins.
+
+    Returns a dict of arrays with one entry per injection: 'trial_index' (-1 if not aligned), 'avg_current'
+    (per `ChargeIndex.average_current` over `duration` seconds, in mA), and 'uncorrected_voltage' and
+    'corrected_voltage' (per `correct_voltage`; nan if not aligned).
+    """
+    injection_offsets = np.asarray(injection_offsets, dtype=np.float64)
+    range_bounds = np.asarray(trial_end_offsets, dtype=np.float64) + tolerance
+    trial_count = range_bounds.size - 1
+
+    trial_index = np.searchsorted(range_bounds, injection_offsets, side='left') - 1
+    # Timestamps exactly on the first bound belong to the first trial rather than before it
+    trial_index[injection_offsets == range_bounds[0]] = 0
+    is_aligned = (trial_index >= 0) & (trial_index < trial_count)
+    trial_index[~is_aligned] = -1
+
+    avg_current = charge_index.average_current(injection_offsets, duration)
+    potentials = np.append(np.asarray(potentials_by_trial, dtype=np.float64)[:trial_count], nan)
+    uncorrected_voltage = potentials[trial_index] # Index -1 picks the trailing nan
+    corrected_voltage = correct_voltage(V=uncorrected_voltage, I=avg_current / 1000, Ru=Ru, pH=pH, deviation=deviation)
+
+    return {
+        'trial_index': trial_index,
+        'avg_current': avg_current,
+        'uncorrected_voltage': uncorrected_voltage,
+        'corrected_voltage': corrected_voltage
+    }
+
 def electrons_from_amps(A, t):
     """
     Given a current in amperes and a duration of time, return the number of moles of electrons.
@@ -0,0 +1,242 @@
+"""
+Module handling optional smoothing of injection signals before they are displayed and integrated, which
+steadies point picking and baseline fits on noisy traces (FID especially).
+
+Filters are Savitzky-Golay filters (a moving average being the special case of order 0): each smoothed
+point is the value at that point of a polynomial least squares fit to the window around it. The fit
+is linear in the data, so it reduces to fixed coefficients per (window, order) which are computed once,
+then applied to all injections sharing a time axis as one batched convolution.
+
+Within the GUI, injections are smoothed on first use through a `SmoothedInjectionCache` (in batches of the
+pages about to be shown or integrated), which keeps the results only as long as they fit in its memory
+budget.
+"""
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache
+from threading import Lock
+import numpy as np
+from algos.injections import Injection
+
+NO_FILTER = 'None'
+# Window width (in seconds) and polynomial order of each filter, by filter name
+FILTERS = {
+    NO_FILTER: None,
+    'Savitzky-Golay': {'window_seconds': 1.0, 'order': 3},
+    'Moving Average': {'window_seconds': 1.0, 'order': 0},
+}
+# Maximum number of injections stacked into one array by `smooth_injections`
+CHUNK_SIZE = 256
+# Largest total size (in bytes) of the smoothed injections kept by a `SmoothedInjectionCache` by default
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+@lru_cache(maxsize=None)
+def savgol_coefficients(window, order):
+    """
+    Coefficients of the Savitzky-Golay filter of odd `window` points and polynomial `order`, as a dict of
+    'center': the convolution kernel for points with a full window around them, and 'head'/'tail': one row
+    of coefficients (applied to the first/last `window` points) per point within half a window of either
+    edge, where the polynomial fit to the outermost full window is evaluated instead.
+    """
+    half = window // 2
+    # Positions scaled to [-1, 1] so the fit is well conditioned for any window
+    positions = np.arange(-half, half + 1) / max(half, 1)
+    fit = np.linalg.pinv(np.vander(positions, order + 1, increasing=True))
+    evaluate = lambda at: np.vander(at, order + 1, increasing=True) @ fit
+    coefficients = {
+        'center': fit[0],
+        'head': evaluate(positions[:half]),
+        'tail': evaluate(positions[half + 1:]),
+    }
+    # Shared between calls, so never modified in place
+    for array in coefficients.values():
+        array.setflags(write=False)
+    return coefficients
+
+def window_size(filter_name, step, size):
+    """
+    Number of points in the window of `filter_name` on signals of `size` points sampled every `step`
+    seconds: odd, and large enough to fit the polynomial, but no larger than the signal.
+    """
+    params = FILTERS[filter_name]
+    window = (max(1, round(params['window_seconds'] / step)) if step else 1) | 1
+    window = max(window, (params['order'] + 2) | 1)
+    return min(window, size if size % 2 else size - 1)
+
+def savgol(y_stack, window, order):
+    """Savitzky-Golay filter of odd `window` points and polynomial `order` along each row of `y_stack`."""
+    rows, size = y_stack.shape
+    if window <= order or window < 3:
+        return y_stack.astype(np.float64)
+    coefficients = savgol_coefficients(window, order)
+    half = window // 2
+
+    smoothed = np.empty((rows, size))
+    # Convolution as one pass over the whole stack per coefficient (rather than a window per point)
+    center = smoothed[:, half:size - half]
+    center[:] = 0
+    for offset, coefficient in enumerate(coefficients['center']):
+        center += coefficient * y_stack[:, offset:offset + size - window + 1]
+    smoothed[:, :half] = y_stack[:, :window] @ coefficients['head'].T
+    smoothed[:, size - half:] = y_stack[:, size - window:] @ coefficients['tail'].T
+    return smoothed
+
+def smooth_injections(filter_name, injections_by_key):
+    """
+    Smooth every injection (`injections.Injection`s or equivalent) keyed in `injections_by_key` with the
+    filter `filter_name` (key of `FILTERS`). Injections are grouped by time axis and each group is
+    filtered in batches of up to `CHUNK_SIZE` injections.
+
+    Returns a dict of key to `injections.Injection` with the smoothed signal (in the dtype of the original)
+    and the same time axis and metadata.
+    """
+    keys_by_grid = {}
+    for key, injection in injections_by_key.items():
+        grid = injection.grid
+        keys_by_grid.setdefault((grid.start, grid.stop, grid.size), []).append(key)
+
+    params = FILTERS[filter_name]
+    smoothed_by_key = {}
+    for keys in keys_by_grid.values():
+        grid = injections_by_key[keys[0]].grid
+        window = window_size(filter_name, grid.step, grid.size)
+        for chunk_start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + CHUNK_SIZE]
+            y_stack = np.stack([injections_by_key[key]['y'] for key in chunk])
+            smoothed = savgol(y_stack, window, params['order'])
+            for key, y_smoothed in zip(chunk, smoothed):
+                injection = injections_by_key[key]
+                smoothed_by_key[key] = Injection(
+                    y_smoothed.astype(injection['y'].dtype), grid, injection['warning'],
+                    injection['start_time'], injection['sample_rate'], injection['num_readings'])
+    return smoothed_by_key
+
+class SmoothedInjection(Mapping):
+    """
+    An injection (`injections.Injection` or equivalent) as smoothed by a filter, behaving like the smoothed
+    `injections.Injection`. Metadata and the time axis come from the original injection; the smoothed signal
+    (and anything derived from it) is only computed on access, through the `SmoothedInjectionCache` it
+    belongs to.
+    """
+    LOADED_FIELDS = ('warning', 'x', 'y')
+
+    def __init__(self, cache, filter_name, key, source):
+        self.cache = cache
+        self.filter_name = filter_name
+        self.key = key
+        self.source = source
+
+    def __getitem__(self, key):
+        if key in SmoothedInjection.LOADED_FIELDS:
+            return self.injection[key]
+        if key in Injection.FIELDS:
+            return self.source[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(Injection.FIELDS)
+
+    def __len__(self):
+        return len(Injection.FIELDS)
+
+    @property
+    def injection(self):
+        """The smoothed `injections.Injection`."""
+        return self.cache.load(self)
+
+    @property
+    def grid(self):
+        return self.source.grid
+
+    @property
+    def cumulative_area(self):
+        return self.cache.derive(self, 'cumulative_area')
+
+    @property
+    def envelope(self):
+        return self.cache.derive(self, 'envelope')
+
+class SmoothedInjectionCache:
+    """
+    Smoothed versions of injections, each computed when first used (see `view`), or ahead of time together
+    with others (see `prepare`), and kept in least-recently-used order until they total more than
+    `max_bytes` (the most recently smoothed is always kept). Dropped injections are smoothed again on next
+    use. Injections may be smoothed (and their derived arrays computed) from any thread.
+    """
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.loaded = OrderedDict()
+        self.loaded_bytes = 0
+        # Size of each smoothed injection as last counted in `loaded_bytes`
+        self.counted_bytes = {}
+        self.lock = Lock()
+
+    def view(self, filter_name, key, injection):
+        """
+        `injection` as smoothed by `filter_name` (key of `FILTERS`), as a `SmoothedInjection`; `key` must
+        identify the injection among all those given to this cache.
+        """
+        return SmoothedInjection(self, filter_name, key, injection)
+
+    def prepare(self, views):
+        """
+        Smooth the injections of all `views` (`SmoothedInjection`s) that aren't smoothed yet, together in
+        batches of up to `CHUNK_SIZE` (see `smooth_injections`), e.g. ahead of showing or integrating them.
+        """
+        with self.lock:
+            self.smooth([view for view in views if (view.filter_name, view.key) not in self.loaded])
+
+    def load(self, view):
+        """The smoothed `injections.Injection` of the `SmoothedInjection` `view`, smoothing it if needed."""
+        with self.lock:
+            return self.load_locked(view)
+
+    def load_locked(self, view):
+        """`load` with the lock already held."""
+        cache_key = (view.filter_name, view.key)
+        if cache_key in self.loaded:
+            self.loaded.move_to_end(cache_key)
+            return self.loaded[cache_key]
+        self.smooth([view])
+        return self.loaded[cache_key]
+
+    def smooth(self, views):
+        """Smooth and keep the injections of `views`, evicting others as needed; the lock must be held."""
+        views_by_filter = {}
+        for view in views:
+            views_by_filter.setdefault(view.filter_name, {})[view.key] = view.source
+        for filter_name, sources_by_key in views_by_filter.items():
+            for key, smoothed in smooth_injections(filter_name, sources_by_key).items():
+                cache_key = (filter_name, key)
+                self.loaded[cache_key] = smoothed
+                self.counted_bytes[cache_key] = smoothed.nbytes
+                self.loaded_bytes += smoothed.nbytes
+        self.evict()
+
+    def derive(self, view, field):
+        """
+        Return the array `field` derived from the smoothed injection of `view`, computed under the lock as in
+        `injections.LazyInjectionList.derive`.
+        """
+        with self.lock:
+            derived = getattr(self.load_locked(view), field)
+            self.recount(view)
+            return derived
+
+    def recount(self, view):
+        """
+        Update the size counted for the injection of `view` if smoothed (e.g. after it grew), evicting others
+        as needed. The lock must be held.
+        """
+        cache_key = (view.filter_name, view.key)
+        if cache_key not in self.loaded:
+            return
+        nbytes = self.loaded[cache_key].nbytes
+        self.loaded_bytes += nbytes - self.counted_bytes[cache_key]
+        self.counted_bytes[cache_key] = nbytes
+        self.evict()
+
+    def evict(self):
+        while self.loaded_bytes > self.max_bytes and len(self.loaded) > 1:
+            cache_key, _ = self.loaded.popitem(last=False)
+            self.loaded_bytes -= self.counted_bytes.pop(cache_key)
@@ -0,0 +1,4 @@
+"""
+Standalone benchmarks comparing Chromelectric's data paths against their previous implementations.
+Run any of them from the repository root, e.g. `python -m benchmarks.gc_parse`.
+"""
@@ -0,0 +1,51 @@
+"""
+Benchmark of the resistance computation in `fileparse.CA` against the original per-row implementation,
+on the data of a synthetic multi-million-row EC-Lab file. Only the post-load computation is timed, since
+both implementations share the same loader. Checks that both produce identical output before timing them.
+
+Usage: python -m benchmarks.ca_resistance [row count]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from algos.fileparse import CA
+from benchmarks.synthetic import CA_COLUMNS, write_ca_file
+
+def legacy_split_columns(data, potentials_by_trial):
+    """Original per-row computation, for data with columns Ns, time, current (the original load order)."""
+    potentials_dict = { float(index): potential for index, potential in enumerate(potentials_by_trial) }
+    current_to_resistance = lambda row: [row[1], potentials_dict[row[0]] / row[2]]
+    resistance_vs_time = np.array([current_to_resistance(row) for row in data])
+    current_vs_time = np.delete(data, obj=0, axis=1)
+    return (current_vs_time, resistance_vs_time)
+
+def main(num_rows=2_000_000):
+    potentials = [-0.5, -0.6, -0.7, -0.8]
+    with tempfile.TemporaryDirectory() as dirpath:
+        path = os.path.join(dirpath, 'synthetic.mpt')
+        write_ca_file(path, num_rows, potentials)
+        cols = [CA_COLUMNS.index(name) for name in ['time/s', '<I>/mA', 'Ns']]
+        # Header line count is on line 2; header row of the data is the last header line
+        with open(path, 'r', encoding='latin-1') as handle:
+            handle.readline()
+            skip = int(handle.readline().partition(':')[2])
+        data = np.loadtxt(path, skiprows=skip, usecols=cols, encoding='latin-1')
+    legacy_data = data[:, [2, 0, 1]].copy()
+
+    start = time.perf_counter()
+    legacy_current, legacy_resistance = legacy_split_columns(legacy_data, potentials)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    current, resistance = CA.split_columns(data, potentials)
+    fast_time = time.perf_counter() - start
+
+    assert np.array_equal(legacy_current, current) and np.array_equal(legacy_resistance, resistance)
+    print(f'{data.shape[0]} rows')
+    print(f'per-row computation:    {legacy_time:8.3f} s')
+    print(f'vectorized computation: {fast_time:8.3f} s  ({legacy_time / fast_time:.0f}x)')
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,68 @@
+"""
+Benchmark of `fileparse.GC.parse_file` against the original `np.genfromtxt`-based implementation.
+Checks that both produce identical output before timing them.
+
+Usage: python -m benchmarks.gc_parse [injection count] [readings per injection]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from algos.fileparse import GC
+from benchmarks.synthetic import write_gc_run
+
+def legacy_parse_file(handle):
+    """Verbatim copy of the original parser, kept here as the reference implementation."""
+    meta_count = 0
+    line = handle.readline()
+    while match := re.search(r'<([A-Za-z ]*)>', line):
+        meta_count += 1
+        field_name = match.group(1).lower()
+        val_str = line.partition('=')[2].strip()
+        if field_name == 'date':
+            date_string = val_str.replace(' ', '0')
+        elif field_name == 'time':
+            time_string = val_str.replace(' ', '0')
+        elif field_name == 'rate':
+            sample_rate = float(re.search(r'\d+(.\d+)?', line).group())
+        elif field_name == 'size':
+            num_readings = int(re.search(r'\d+', line).group())
+        line = handle.readline()
+
+    handle.seek(os.SEEK_SET)
+    potentials = np.genfromtxt(fname=handle, comments=',', skip_header=meta_count)
+
+    run_duration = num_readings / sample_rate
+    time_increments = np.linspace(0, run_duration, potentials.size)
+    warning = potentials.size != num_readings
+    start_time = datetime.strptime(f'{date_string} {time_string}', r'%m-%d-%Y %H:%M:%S')
+    return {'warning': warning, 'start_time': start_time, 'x': time_increments, 'y': potentials / 1000}
+
+def time_parser(parse_func, paths):
+    results = {}
+    start = time.perf_counter()
+    for index, path in paths.items():
+        with open(path, 'r') as handle:
+            results[index] = parse_func(handle)
+    return time.perf_counter() - start, results
+
+def main(count=200, num_readings=60000):
+    with tempfile.TemporaryDirectory() as dirpath:
+        paths = write_gc_run(dirpath, count, num_readings)
+        legacy_time, legacy_results = time_parser(legacy_parse_file, paths)
+        fast_time, fast_results = time_parser(GC.parse_file, paths)
+
+    for index in paths:
+        expected, actual = legacy_results[index], fast_results[index]
+        assert expected['warning'] == actual['warning'] and expected['start_time'] == actual['start_time']
+        assert np.array_equal(expected['x'], actual['x']) and np.array_equal(expected['y'], actual['y'])
+
+    print(f'{count} injections x {num_readings} readings')
+    print(f'genfromtxt parser: {legacy_time:8.3f} s')
+    print(f'fast parser:       {fast_time:8.3f} s  ({legacy_time / fast_time:.1f}x)')
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
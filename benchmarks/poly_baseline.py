@@ -0,0 +1,66 @@
+"""
+Benchmark of polynomial baseline fitting with and without the fit cache of `numericintegrate.poly_fit_plan`,
+spreading a few peaks across a run of synthetic injections repeatedly (as when the same peaks are spread
+again after tweaking them), and integrating each injection one by one (as when integrating by hand).
+
+Usage: python -m benchmarks.poly_baseline [injection count] [readings per injection] [repeats]
+"""
+import sys
+import time
+import numpy as np
+from algos import numericintegrate
+from algos.injections import UniformGrid, Injection
+
+SAMPLE_RATE = 10.0
+PEAK_TIMES = [(110.0, 130.0), (260.0, 300.0), (400.0, 455.0)] # Start and end of each spread peak, in seconds
+BASELINE_TYPE = f'Poly (Deg. {numericintegrate.POLYFIT_DEGREE})'
+
+def synthetic_injections(count, num_readings, seed=0):
+    """Injections sharing one time grid, with a few Gaussian peaks of varying height on a drifting baseline."""
+    rng = np.random.default_rng(seed)
+    grid = UniformGrid(0, num_readings / SAMPLE_RATE, num_readings)
+    x = grid.values()
+    injections = {}
+    for index in range(1, count + 1):
+        y = 5 + 0.2 * x / x[-1] + rng.normal(0, 0.05, num_readings)
+        for start, end in PEAK_TIMES:
+            center, width = (start + end) / 2, (end - start) / 8
+            y += rng.uniform(50, 400) * np.exp(-0.5 * ((x - center) / width) ** 2)
+        injections[index] = Injection(y, grid, False, None, SAMPLE_RATE, num_readings)
+    return injections
+
+def spread_all(injections, repeats):
+    for _ in range(repeats):
+        for start, end in PEAK_TIMES:
+            integral = {'points': [(start, 0), (end, 0)], 'mode': 'Trapezoidal', 'baseline_type': BASELINE_TYPE}
+            numericintegrate.spread(integral, injections)
+
+def integrate_each(injections):
+    for injection in injections.values():
+        x, y, grid = injection['x'], injection['y'], injection.grid
+        for start, end in PEAK_TIMES:
+            points = [(x[index], y[index]) for index in grid.index_at_or_after([start, end])]
+            numericintegrate.trapz(x, y, points, BASELINE_TYPE, grid)
+
+def timed(func, *args, cache_size):
+    numericintegrate.POLY_FIT_CACHE_SIZE = cache_size
+    numericintegrate._poly_fit_plans.clear()
+    numericintegrate._poly_area_weights.clear()
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main(count=500, num_readings=6000, repeats=5):
+    injections = synthetic_injections(count, num_readings)
+    default_size = numericintegrate.POLY_FIT_CACHE_SIZE
+    print(f'{count} injections of {num_readings} readings, {len(PEAK_TIMES)} peaks')
+    for label, func, args in [
+        (f'spread x{repeats}', spread_all, (injections, repeats)),
+        ('integrate each', integrate_each, (injections,)),
+    ]:
+        uncached = timed(func, *args, cache_size=0)
+        cached = timed(func, *args, cache_size=default_size)
+        print(f'{label:>16}: no cache {uncached:7.3f} s, cache {cached:7.3f} s  ({uncached / cached:.1f}x)')
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
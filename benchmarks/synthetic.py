@@ -0,0 +1,81 @@
+"""Writers for synthetic GC (*.asc) files shaped like real SRI/PeakSimple exports."""
+import os
+from datetime import datetime, timedelta
+import numpy as np
+
+def gc_text(num_readings, sample_rate=10.0, start_time=datetime(2020, 12, 2, 9, 5, 0), seed=0):
+    """Return the full text of a single GC injection file with a few Gaussian peaks on a drifting baseline."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_readings) / sample_rate
+    duration = num_readings / sample_rate
+    signal = 5000 + 200 * t / duration + rng.normal(0, 50, num_readings)
+    for center, width, height in [(0.2, 0.01, 4e5), (0.45, 0.02, 1e5), (0.7, 0.015, 2.5e5)]:
+        signal += height * np.exp(-0.5 * ((t - center * duration) / (width * duration)) ** 2)
+    readings = np.round(signal).astype(np.int64)
+
+    # PeakSimple pads single-digit date and time fields with spaces rather than zeros
+    date_str = f'{start_time.month:2d}-{start_time.day:2d}-{start_time.year}'
+    time_str = f'{start_time.hour:2d}:{start_time.minute:2d}:{start_time.second:2d}'
+    header = (
+        '<SAMPLE NAME> = Synthetic\n'
+        f'<DATE> = {date_str}\n'
+        f'<TIME> = {time_str}\n'
+        f'<RATE> = {sample_rate:.2f}\n'
+        f'<SIZE> = {num_readings}\n'
+        '<CHANNEL> = FID\n')
+    return header + ''.join(f'{n},{n}\n' for n in readings.tolist())
+
+def write_gc_run(dirpath, count, num_readings, sample_rate=10.0, name='Synthetic fid'):
+    """Write `count` injections named `<name><#>.asc` (one per 20 min) and return their paths by index."""
+    start = datetime(2020, 12, 2, 9, 5, 0)
+    paths_by_index = {}
+    for index in range(1, count + 1):
+        path = os.path.join(dirpath, f'{name}{index}.asc')
+        with open(path, 'w') as handle:
+            handle.write(gc_text(
+                num_readings, sample_rate, start + timedelta(minutes=20 * (index - 1)), seed=index))
+        paths_by_index[index] = path
+    return paths_by_index
+
+CA_COLUMNS = [
+    'mode', 'ox/red', 'error', 'control changes', 'Ns changes', 'counter inc.', 'Ns', 'time/s',
+    'control/V', 'Ewe/V', '<I>/mA', 'dQ/C', '(Q-Qo)/C', 'I Range', 'P/W']
+
+def write_ca_file(path, num_rows, potentials=(-0.5, -0.6, -0.7, -0.8), start_time=datetime(2020, 12, 2, 9, 0, 0)):
+    """
+    Write an EC-Lab chronoamperometry export (*.mpt) with one constant-potential trial per entry of
+    `potentials`, splitting `num_rows` evenly across trials at one reading per second.
+    """
+    trial_rows = num_rows // len(potentials)
+    trial_duration = timedelta(seconds=trial_rows)
+    hours, remainder = divmod(int(trial_duration.total_seconds()), 3600)
+    duration_str = f'{hours}:{remainder // 60:02d}:{remainder % 60:02d}.0000'
+    meta_lines = [
+        'EC-Lab ASCII FILE',
+        None, # Header line count, filled in below
+        '',
+        'Chronoamperometry / Chronocoulometry',
+        '',
+        'Run on channel : 1',
+        f"Acquisition started on : {start_time.strftime('%m/%d/%Y %H:%M:%S')}",
+        'Ei (V)              ' + ''.join(f'{p:<20.3f}' for p in potentials),
+        'vs.                 ' + 'Ref                 ' * len(potentials),
+        'ti (h:m:s)          ' + ''.join(f'{duration_str:<20}' for _ in potentials),
+        'Imax                pass                ',
+        '\t'.join(CA_COLUMNS) + '\t',
+    ]
+    meta_lines[1] = f'Nb header lines : {len(meta_lines)}'
+
+    rng = np.random.default_rng(0)
+    num_rows = trial_rows * len(potentials)
+    trial = np.arange(num_rows) // trial_rows
+    data = np.zeros((num_rows, len(CA_COLUMNS)))
+    data[:, CA_COLUMNS.index('mode')] = 2
+    data[:, CA_COLUMNS.index('Ns')] = trial
+    data[:, CA_COLUMNS.index('time/s')] = 12.5 + np.arange(num_rows)
+    data[:, CA_COLUMNS.index('control/V')] = np.asarray(potentials)[trial]
+    data[:, CA_COLUMNS.index('Ewe/V')] = np.asarray(potentials)[trial] + rng.normal(0, 1e-4, num_rows)
+    data[:, CA_COLUMNS.index('<I>/mA')] = -5 * (trial + 1) + rng.normal(0, 0.05, num_rows)
+    with open(path, 'w', encoding='latin-1') as handle:
+        handle.write('\n'.join(meta_lines) + '\n')
+        np.savetxt(handle, data, fmt='%.6g', delimiter='\t')
@@ -10,7 +10,7 @@ from PySide2.QtGui import QFont, QIntValidator
 import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
-from gui.graphshared import Pagination, IntAction, GraphPushButton
+from gui.graphshared import Pagination, IntAction, GraphPushButton, DecimatedLine
 matplotlib.use('Qt5Agg')
 
 def launch_window(graph_list, window_title, index_title, multiple_title, legend_title, xlabel, ylabel):
@@ -51,6 +51,8 @@ class CarouselWindow(QMainWindow):
 
         self.axes = self.canvas.figure.add_subplot()
         self.curr_plot = None
+        # `DecimatedLine` drawing each visible page, in the same order as `visible_pages`
+        self.traces = []
         self.graph_page(page=init_page)
 
     def graph_page(self, _=None, page=0):
@@ -59,7 +61,8 @@ class CarouselWindow(QMainWindow):
         self.visible_pages = [page]
 
         self.axes.clear()
-        self.axes.plot(self.graph_list[page]['x'], self.graph_list[page]['y'], label=self.legend_title.format(page))
+        self.traces = []
+        self.plot_page(page)
         self.axes.set_title(self.index_title.format(page))
         self.axes.set_xlabel(self.xlabel)
         self.axes.set_ylabel(self.ylabel)
@@ -69,7 +72,7 @@ class CarouselWindow(QMainWindow):
 
     def add_page(self, page):
         self.visible_pages.append(page)
-        self.axes.plot(self.graph_list[page]['x'], self.graph_list[page]['y'], label=self.legend_title.format(page))
+        self.plot_page(page)
 
         self.axes.legend()
         self.axes.set_title(self.multiple_title)
@@ -77,9 +80,16 @@ class CarouselWindow(QMainWindow):
         self.toolbar.update()
         self.canvas.draw()
 
+    def plot_page(self, page):
+        """Plot the injection of `page` (at screen resolution) on top of any others already plotted."""
+        trace = DecimatedLine(self.axes, label=self.legend_title.format(page))
+        trace.set_injection(self.graph_list[page])
+        self.axes.relim()
+        self.traces.append(trace)
+
     def remove_page(self, page):
         line_index = self.visible_pages.index(page)
-        self.axes.get_lines()[line_index].remove()
+        self.traces.pop(line_index).line.remove()
         self.visible_pages.pop(line_index)
 
         # Always refresh legend to reflect removed page; if only one page left, no need for legend
@@ -17,6 +17,8 @@ from util import (
     filetype, find_sequences, duration_to_str, sequences_to_str,
     is_windows, atomic_window, channels)
 import algos.fileparse as fileparse
+import algos.parsecache as parsecache
+import algos.physcalc as physcalc
 import gui
 from gui import Label, platform_messagebox, retry_cancel
 import gui.carousel as carousel
@@ -108,6 +110,7 @@ class CAFilePicker(FilePicker):
     def __init__(self, file_label, file_type, label_text, button_text, msg_detail, resize_handler):
         super().__init__(file_label, file_type, label_text, button_text, msg_detail)
         self.parsed_data = None
+        self.charge_index = None
         self.resize_handler = resize_handler
 
         self.parsed_container = QHBoxLayout()
@@ -145,6 +148,8 @@ class CAFilePicker(FilePicker):
             self.set_filepath_label(filepath)
             self.filepath = filepath
             self.parsed_data = parsed_data
+            # Built once here so every later current average is a constant-time lookup
+            self.charge_index = physcalc.ChargeIndex(parsed_data)
 
             time_diff = parsed_data['current_vs_time'][-1][0] - parsed_data['current_vs_time'][0][0]
             potentials = parsed_data['potentials_by_trial']
@@ -164,7 +169,7 @@ class CAFilePicker(FilePicker):
                 return (None, None)
             
             try:
-                parsed_data = fileparse.CA.parse_file(filepath)
+                parsed_data = fileparse.CA.parse_file(filepath, cache=parsecache.default_cache())
                 valid_file_picked = True
             except Exception: # Fails safely for CA files with improper meta or data format
                 should_retry = retry_cancel(
@@ -178,6 +183,7 @@ class CAFilePicker(FilePicker):
     def get_parsed_input(self):
         return {
             'data': self.parsed_data,
+            'charge_index': self.charge_index,
             'path': self.filepath
         }
 
@@ -213,7 +219,9 @@ class GCFilePicker(FilePicker):
             self.parsed_list = parsed_list
 
             self.set_filepath_label(filepath)
-            mean_duration = np.mean([injection['x'][-1] for _, injection in parsed_list.items()])
+            # Computed from metadata alone so that no injection signals need to be loaded
+            mean_duration = np.mean([
+                injection['num_readings'] / injection['sample_rate'] for _, injection in parsed_list.items()])
             self.parsed_label.setText(textwrap.dedent((f"\
                 Found {len(parsed_list)} total injections with indices {sequences_to_str(sequences)} "
                 f"and mean duration {duration_to_str(mean_duration)}.")))
@@ -284,8 +292,8 @@ class GCFilePicker(FilePicker):
         else:
             error_text = error_detailed = None
         
-        parsed_list = fileparse.GC.parse_list(raw_list)
-        if not isinstance(parsed_list, dict):
+        parsed_list = fileparse.GC.parse_list(raw_list, cache=parsecache.default_cache(), lazy=True)
+        if isinstance(parsed_list, int):
             io_fail_index = parsed_list
             return {'error_text': f'File read failed for injection {io_fail_index}.'}
         
@@ -1,8 +1,11 @@
 """
 GUI components shared between the "carousel" graph view and the "integration" graph view.
-These include pagination functionality and some small utility classes.
+These include pagination functionality, decimated and blitted rendering and some small utility classes.
 """
-from math import ceil
+from math import ceil, floor
+import numpy as np
+from matplotlib.transforms import Bbox
+from algos import envelope
 from PySide2.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit
 from PySide2.QtCore import Signal, Slot, Qt
 from PySide2.QtGui import QFont, QIntValidator
@@ -165,3 +168,139 @@ class IntAction:
         did_succeed = self.on_click(self.input_field.text())
         if did_succeed:
             self.input_field.setText('')
+
+class BlitManager:
+    """
+    Renders the frequently changing artists of a canvas (added with `add`) by blitting: the rest of the
+    figure is rasterized by a full draw and kept as a background, and `update` restores the background
+    only where those artists are (or were) and redraws just them on top. The background is refreshed on
+    every full draw, i.e. after resizing, zooming or panning, or an explicit `canvas.draw()`.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.background = None
+        self.background_bounds = None
+        self.background_axes = []
+        self.artists_by_axes = {}
+        # Region (in display coordinates) last drawn over for each axes, which must be restored next time
+        self.regions_by_axes = {}
+        self.canvas.mpl_connect('draw_event', self.handle_draw)
+
+    def add(self, artists):
+        """Render `artists` (all drawn on axes of this canvas) by blitting from now on."""
+        for artist in artists:
+            artist.set_animated(True)
+            self.artists_by_axes.setdefault(artist.axes, []).append(artist)
+
+    def remove(self, artists):
+        """Remove `artists` (previously added) from their axes; call `update` to show the change."""
+        for artist in artists:
+            axes_artists = self.artists_by_axes.get(artist.axes, [])
+            if artist in axes_artists:
+                axes_artists.remove(artist)
+            artist.remove()
+
+    def invalidate(self):
+        """
+        Drop the background when the rest of the figure is about to change, so that `update` does nothing
+        until the full draw that must follow (which renders the blitted artists too).
+        """
+        self.background = None
+
+    def show_background(self, background):
+        """
+        Show `background` in place of a full draw, with the blitted artists on top. It must be a rendering
+        (from `copy_from_bbox`) of exactly what a full draw would render of the figure as it is now, e.g.
+        made ahead of time on an identical figure.
+        """
+        figure = self.canvas.figure
+        self.canvas.restore_region(background)
+        self.background = background
+        self.background_bounds = figure.bbox.bounds
+        self.background_axes = list(figure.axes)
+        self.artists_by_axes = {axes: self.artists_by_axes.get(axes, []) for axes in figure.axes}
+        self.regions_by_axes = {axes: self.draw_artists(axes) for axes in figure.axes}
+        self.canvas.blit(figure.bbox)
+
+    def handle_draw(self, event):
+        # Full draws skip animated artists, so keep the result as the background and draw them on top
+        figure = self.canvas.figure
+        self.background = self.canvas.copy_from_bbox(figure.bbox)
+        self.background_bounds = figure.bbox.bounds
+        self.background_axes = list(figure.axes)
+        self.artists_by_axes = {axes: self.artists_by_axes.get(axes, []) for axes in figure.axes}
+        self.regions_by_axes = {axes: self.draw_artists(axes) for axes in figure.axes}
+
+    def draw_artists(self, axes):
+        """Draw the blitted artists of `axes`, returning the region they cover (along with the axes itself)."""
+        renderer = self.canvas.get_renderer()
+        extents = [axes.bbox]
+        for artist in self.artists_by_axes.get(axes, []):
+            axes.draw_artist(artist)
+            extent = artist.get_window_extent(renderer)
+            if np.all(np.isfinite(extent.extents)):
+                extents.append(extent)
+        return Bbox.union(extents)
+
+    def update(self):
+        """Show any changes to the blitted artists without redrawing the rest of the figure."""
+        figure = self.canvas.figure
+        if self.background is None:
+            return
+        # Background is stale until the next full draw if the figure has been resized or its axes replaced
+        if self.background_bounds != figure.bbox.bounds or self.background_axes != figure.axes:
+            self.canvas.draw_idle()
+            return
+
+        height = figure.bbox.height
+        for axes in figure.axes:
+            previous = self.regions_by_axes.get(axes, axes.bbox)
+            # Restored region is given in the background's pixel coordinates, from the top left corner
+            x0, y0, x1, y1 = previous.extents
+            left, top = max(floor(x0) - 1, 0), max(floor(height - y1) - 1, 0)
+            right, bottom = ceil(x1) + 1, ceil(height - y0) + 1
+            self.canvas.restore_region(self.background, bbox=(left, top, right, bottom), xy=(0, 0))
+            region = self.draw_artists(axes)
+            self.regions_by_axes[axes] = region
+            self.canvas.blit(Bbox.union([previous, region]).padded(2))
+        self.canvas.flush_events()
+
+class DecimatedLine:
+    """
+    A Line2D on `axes` (created with `line_kwargs`) drawing an injection (`injections.Injection` or equivalent)
+    at screen resolution: only the samples picked out by the injection's min/max envelope for the current
+    x limits and plot width are drawn, and finer levels are swapped in as the user zooms in. `indices`
+    maps each drawn point to its sample in the full-resolution injection.
+    """
+    def __init__(self, axes, **line_kwargs):
+        self.axes = axes
+        self.line = axes.plot([], [], **line_kwargs)[0]
+        self.injection = None
+        self.indices = np.arange(0)
+        self.axes.callbacks.connect('xlim_changed', self.handle_xlim_change)
+        # Bound methods are only weakly referenced by callback registries, so lines that are done with go away
+        self.axes.figure.canvas.mpl_connect('resize_event', self.handle_resize)
+
+    def set_injection(self, injection):
+        """Draw `injection`, at first over its whole time axis (so that its data limits cover all of it)."""
+        self.injection = injection
+        self.draw_samples(0, injection.grid.size)
+
+    def handle_xlim_change(self, axes):
+        if self.injection is None:
+            return
+        start, stop = self.injection.grid.index_of(sorted(axes.get_xlim()))
+        self.draw_samples(start, stop + 1)
+
+    def handle_resize(self, event):
+        self.handle_xlim_change(self.axes)
+
+    def draw_samples(self, start, stop):
+        grid = self.injection.grid
+        self.indices = envelope.visible_indices(
+            self.injection.envelope, grid.size, start, stop, self.axes.bbox.width)
+        self.line.set_data(grid.values_at(self.indices), self.injection['y'][self.indices])
+
+    def full_data(self):
+        """Full-resolution (x, y) data of the injection."""
+        return self.injection.grid.values(), self.injection['y']
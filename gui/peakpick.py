@@ -6,18 +6,17 @@ from PySide2.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QComboBox, QSizePolicy, QFrame, QSpacerItem,
     QPushButton, QLabel, QGridLayout, QLayout, QScrollArea, QMessageBox, QHBoxLayout)
 from PySide2.QtCore import Qt, QCoreApplication
-import numpy as np
 import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
-from datetime import timedelta
 from math import nan, isnan
 from functools import reduce
 from util import channels
 import gui
 from gui import HLine, ComboBox, Label, platform_messagebox, get_scrollbar_thickness
-from gui.graphshared import Pagination, GraphPushButton
-from algos import physcalc, numericintegrate, outputwriter
+from gui.graphshared import Pagination, GraphPushButton, BlitManager, DecimatedLine
+from gui.prefetch import PagePrefetcher, PREFETCH_RADIUS, figure_layout
+from algos import physcalc, numericintegrate, peakdetect, outputwriter, smoothing
 matplotlib.use('Qt5Agg')
 
 def launch_window(all_inputs, window_title, ch_index_title, xlabel, ylabel):
@@ -170,16 +169,23 @@ class IntegrateControls(QGridLayout):
             'Select the extremum of the peak (highest or lowest point).',
             'Select the end of the peak (rightmost point).'
         ],
+        # Each overlapping peak is assigned to the gas selected when picking its extremum
+        **{mode: [
+            'Select the start of the overlapping peaks (leftmost point).',
+            *[f'Select the gas of peak #{number}, then the extremum of that peak.' for number in range(1, count + 1)],
+            'Select the end of the overlapping peaks (rightmost point).'
+        ] for mode, (_, count) in numericintegrate.DECONVOLUTION_MODES.items()},
     }
 
-    def __init__(self, canvas, experiment_params, gases_by_channel, on_apply_all):
+    def __init__(self, canvas, experiment_params, gases_by_channel, on_apply_all, on_smoothing_change):
         super().__init__()
         self.experiment_params = experiment_params
         self.gases_by_channel = gases_by_channel
         self.on_apply_all = on_apply_all
+        self.on_smoothing_change = on_smoothing_change
         self.setSizeConstraint(QLayout.SetMaximumSize)
         self.canvas = canvas
-        self.disconnect_id = self.canvas.mpl_connect('pick_event', self.handle_pick)
+        self.disconnect_id = self.canvas.mpl_connect('button_press_event', self.handle_pick)
 
         # Channel and gas selection
         self.channel_selector = ComboBox()
@@ -203,6 +209,13 @@ class IntegrateControls(QGridLayout):
         self.addWidget(Label('Baseline Type'), 2, 1, alignment=Qt.AlignHCenter)
         self.addWidget(self.baseline_type, 3, 1, alignment=Qt.AlignHCenter)
 
+        # Smoothing of the displayed (and integrated) signals
+        self.smoothing = QComboBox()
+        self.smoothing.addItems(smoothing.FILTERS.keys())
+        self.smoothing.currentTextChanged.connect(self.on_smoothing_change)
+        self.addWidget(Label('Smoothing'), 4, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(self.smoothing, 5, 0, 1, 2, alignment=Qt.AlignHCenter)
+
         # Integration start/stop and information
         self.integrate_button = GraphPushButton(text='Start Integration')
         self.integrate_button.clicked.connect(self.handle_click_integrate)
@@ -215,17 +228,17 @@ class IntegrateControls(QGridLayout):
         self.integrate_instruction.setWordWrap(True)
         self.integrate_label.setAlignment(Qt.AlignHCenter)
         self.integrate_instruction.setAlignment(Qt.AlignHCenter)
-        self.addWidget(self.integrate_button, 4, 0, 1, 2, alignment=Qt.AlignHCenter)
-        self.addWidget(self.integrate_label, 5, 0, 1, 2, alignment=Qt.AlignHCenter)
-        self.addWidget(self.integrate_instruction, 6, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(self.integrate_button, 6, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(self.integrate_label, 7, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(self.integrate_instruction, 8, 0, 1, 2, alignment=Qt.AlignHCenter)
 
-        self.addItem(QSpacerItem(1, gui.PADDING), 6, 0, 1, 2)
+        self.addItem(QSpacerItem(1, gui.PADDING), 8, 0, 1, 2)
         # List of peak information cards for current injection (plus overall Faradaic efficiency)
         self.fe_label = Label('Total Faradaic efficiency: 0%')
         self.fe_label.setAlignment(Qt.AlignHCenter)
         self.fe_label.setWordWrap(True)
         self.fe_label.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Maximum)
-        self.addWidget(self.fe_label, 7, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(self.fe_label, 9, 0, 1, 2, alignment=Qt.AlignHCenter)
         peak_list_scroll = VerticalScrollArea()
         peak_list_frame = QFrame(peak_list_scroll)
         peak_list_container = QVBoxLayout()
@@ -242,17 +255,23 @@ class IntegrateControls(QGridLayout):
         self.peak_list_frame = peak_list_frame
         peak_list_scroll.setAlignment(Qt.AlignHCenter)
         peak_list_scroll.hide()
-        self.addWidget(peak_list_scroll, 8, 0, 1, 2, alignment=Qt.AlignHCenter)
+        self.addWidget(peak_list_scroll, 10, 0, 1, 2, alignment=Qt.AlignHCenter)
         self.peak_list_scroll = peak_list_scroll
         self.peak_list_items = []
-        self.setRowStretch(8, 1)
+        self.setRowStretch(10, 1)
 
         # Integration state variables container
         self.curr_integral = { 'is_active': False }
-        # Holds reference to artist for each Line2D object per channel
-        self.lines_by_channel = {}
+        # Holds reference to the `DecimatedLine` (and so the Line2D artist) drawing each channel
+        self.traces_by_channel = {}
+        # Time axis (`injections.UniformGrid`) of the line drawn for each channel
+        self.grids_by_channel = {}
         # List of all integral-related artists
         self.integral_artists = []
+        # Point key (see `point_keys`) of each drawn point artist, as points may be shared between integrals
+        self.point_keys_by_artist = {}
+        # Integral-related artists change with every pick, so they're blitted over the (static) injection traces
+        self.blit = BlitManager(canvas)
         # Lists of successfully completed peak integrations
         self.integrals = []
         
@@ -282,15 +301,16 @@ class IntegrateControls(QGridLayout):
         if isnan(self.mol_e) or isnan(self.avg_current):
             self.fe_label.setText('Warning: This injection could not be\naligned to the supplied CA file.')
 
-    def set_active_channels(self, active_channels, lines_by_channel):
+    def set_active_channels(self, active_channels, traces_by_channel, grids_by_channel):
         """
-        Update the list of currently displayed channels and the artist for each Line2D object.
+        Update the list of currently displayed channels and the `DecimatedLine` and time axis for each channel.
         Called by client of this class when switching injection numbers.
         
         For example, if the FID channel was available but is missing when switching to
         injection #5, it might be removed from the list of active channels.
         """
-        self.lines_by_channel = lines_by_channel
+        self.traces_by_channel = traces_by_channel
+        self.grids_by_channel = grids_by_channel
 
         # Keep track of most recent user selections
         self.prev_gas = self.gas_selector.currentText()
@@ -302,54 +322,75 @@ class IntegrateControls(QGridLayout):
         if self.prev_channel in active_channels:
             self.channel_selector.setCurrentText(self.prev_channel)
 
-    def do_integral(self, line_xy, axes):
+    def do_integral(self, x_data, y_data, axes, grid=None):
         """
         Numerically compute an integral of the current type on the supplied line, store the
         resulting information and draw a graphical representation of the successul integral.
 
         Called when user has requested to perform an integration and has picked all required points.
+        Deconvolution modes result in a separate integral for each of the overlapping peaks.
         """
-        mode, gas = self.curr_integral['mode'], self.curr_integral['gas']
-        x_data, y_data = line_xy[:, 0], line_xy[:, 1]
+        mode = self.curr_integral['mode']
         integral_result = numericintegrate.INTEGRATION_BY_MODE[mode](
             x_data=x_data, y_data=y_data, points=self.curr_integral['points'],
-            baseline_type=self.curr_integral['baseline_type'])
+            baseline_type=self.curr_integral['baseline_type'], grid=grid)
+        if mode in numericintegrate.DECONVOLUTION_MODES:
+            # Gases selected when picking the extremum of each peak
+            integral_results, gases = integral_result, self.curr_integral['gases'][1:-1]
+        else:
+            integral_results, gases = [integral_result], [self.curr_integral['gas']]
 
         render_func = numericintegrate.RENDER_BY_MODE[mode]
         curr_artists = []
         curr_artists.extend(self.curr_integral['point_artists'])
-        curr_artists.extend(numericintegrate.draw_integral(
-            x_data, y_data, integral_result, axes, len(self.integrals) + 1, render_func))
-        
-        self.integral_artists.append(curr_artists)
-
-        gas_attrs = self.experiment_params['attributes_by_gas_name'][gas]
-        calib_val, reduction_count = [gas_attrs.get(attr) for attr in ['calibration_value', 'reduction_count']]
-        final_integral = numericintegrate.interpret_integral(
-            integral=integral_result, total_gas_mol=self.experiment_params['mol_gas'],
-            mol_e=self.mol_e, calib_val=calib_val, reduction_count=reduction_count,
-            avg_current=self.avg_current)
-        self.integrals.append({
-            **final_integral,
-            'mode': mode,
-            'gas': gas
-        })
+        for artist, point in zip(self.curr_integral['point_artists'], self.curr_integral['points']):
+            self.point_keys_by_artist[artist] = (self.curr_integral['channel'], float(point[0]), float(point[1]))
+        for integral_result, gas in zip(integral_results, gases):
+            integral_artists = numericintegrate.draw_integral(
+                x_data, y_data, integral_result, axes, len(self.integrals) + 1, render_func, grid=grid)
+            self.blit.add(integral_artists)
+            curr_artists.extend(integral_artists)
+            self.integral_artists.append(curr_artists)
+            curr_artists = []
+
+            gas_attrs = self.experiment_params['attributes_by_gas_name'][gas]
+            calib_val, reduction_count = [gas_attrs.get(attr) for attr in ['calibration_value', 'reduction_count']]
+            final_integral = numericintegrate.interpret_integral(
+                integral=integral_result, total_gas_mol=self.experiment_params['mol_gas'],
+                mol_e=self.mol_e, calib_val=calib_val, reduction_count=reduction_count,
+                avg_current=self.avg_current)
+            self.integrals.append({
+                **final_integral,
+                'mode': mode,
+                'gas': gas,
+                'smoothing': self.curr_integral['smoothing']
+            })
         self.update_integral_list()
 
     def handle_pick(self, event):
-        """Handler for any attempted user selection of a point on any currently rendered Line2D object."""
-        # First, validate the pick
-        target_artist = self.lines_by_channel.get(self.curr_integral.get('channel'))
-        if not self.curr_integral['is_active'] or event.artist is not target_artist:
+        """Handler for any mouse click on the canvas, i.e. any attempted user selection of a point on a line."""
+        # First, validate the pick: a left click on the axes of the channel being integrated, while the
+        # toolbar isn't zooming or panning
+        target_trace = self.traces_by_channel.get(self.curr_integral.get('channel'))
+        toolbar = self.canvas.toolbar
+        if (not self.curr_integral['is_active'] or target_trace is None or event.inaxes is not target_trace.axes
+                or event.button != 1 or (toolbar is not None and toolbar.mode)):
             return
-        
-        # If pick is valid, get coordinates, add to pick list, and draw selected point to screen
-        coords = numericintegrate.line2d_point(event)
+        grid, y_data = target_trace.injection.grid, target_trace.injection['y']
+        sample_index = numericintegrate.nearest_sample(event, grid, y_data)
+        if sample_index is None:
+            return
+
+        # If pick is valid, get coordinates of the (full-resolution) sample, add to pick list, and draw
+        # selected point to screen
+        coords = (grid.values_at([sample_index])[0], y_data[sample_index])
         if coords not in self.curr_integral['points']:
             self.curr_integral['points'].append(coords)
-            pt = numericintegrate.draw_point(coords, target_artist.axes)
+            self.curr_integral['gases'].append(self.gas_selector.currentText())
+            pt = numericintegrate.draw_point(coords, target_trace.axes)
             self.curr_integral['point_artists'].append(pt)
-            self.canvas.draw()
+            self.blit.add([pt])
+            self.blit.update()
 
         # If user has picked all the points needed, then process and integrate them.
         # Otherwise, show instructions to pick next point.
@@ -357,7 +398,10 @@ class IntegrateControls(QGridLayout):
         # 1 user-facing instruction per point needed
         points_needed = len(IntegrateControls.INSTRUCTIONS_BY_MODE[self.curr_integral['mode']])
         if picked_count >= points_needed:
-            self.do_integral(line_xy=event.artist.get_xydata(), axes=event.artist.axes)
+            x_data, y_data = target_trace.full_data()
+            self.do_integral(
+                x_data=x_data, y_data=y_data, axes=target_trace.axes,
+                grid=self.grids_by_channel.get(self.curr_integral.get('channel')))
             self.stop_integration(did_succeed=True)
         else:
             self.integrate_instruction.setText(self.curr_integral['instructions'][picked_count])
@@ -374,9 +418,11 @@ class IntegrateControls(QGridLayout):
         self.curr_integral['gas'] = self.gas_selector.currentText()
         self.curr_integral['channel'] = self.channel_selector.currentText()
         self.curr_integral['points'] = []
+        self.curr_integral['gases'] = []
         self.curr_integral['point_artists'] = []
         self.curr_integral['instructions'] = IntegrateControls.INSTRUCTIONS_BY_MODE[self.curr_integral['mode']]
         self.curr_integral['baseline_type'] = self.baseline_type.currentText()
+        self.curr_integral['smoothing'] = self.smoothing.currentText()
 
         self.integrate_button.setText('Cancel Integration')
         self.integrate_label.setText(
@@ -393,10 +439,9 @@ class IntegrateControls(QGridLayout):
 
         if not did_succeed:
             artists = self.curr_integral.get('point_artists') if self.curr_integral.get('point_artists') else []
-            for point in artists:
-                point.remove()
+            self.blit.remove(artists)
         self.curr_integral['point_artists'] = []
-        self.canvas.draw()
+        self.blit.update()
 
     def get_integrals_and_clear(self):
         """
@@ -404,9 +449,9 @@ class IntegrateControls(QGridLayout):
         page is returned, which can be stored by the client and loaded when the user revisits this page later.
         """
         for artist_list in self.integral_artists:
-            for artist in artist_list:
-                artist.remove()
+            self.blit.remove(artist_list)
         self.integral_artists = []
+        self.point_keys_by_artist = {}
 
         result = self.integrals
         self.integrals = []
@@ -420,16 +465,32 @@ class IntegrateControls(QGridLayout):
         """
         gas_list = self.experiment_params['attributes_by_gas_name']
         self.integrals = integrals
+        # Points shared between integrals (e.g. by the overlapping peaks of a deconvolution) are only drawn
+        # once, with the first integral they belong to, as when the integrals were first made
+        drawn_points = set()
         for index, integral in enumerate(self.integrals):
             channel = gas_list[integral['gas']]['channel']
-            line = self.lines_by_channel[channel]
-            xy_data = line.get_xydata()
-            x_data, y_data = xy_data[:, 0], xy_data[:, 1]
+            trace = self.traces_by_channel[channel]
+            x_data, y_data = trace.full_data()
             render_func = numericintegrate.RENDER_BY_MODE[integral['mode']]
-            artists = numericintegrate.draw_integral(x_data, y_data, integral, line.axes, index + 1, render_func, draw_points=True)
+            point_artists = []
+            for point, key in zip(integral['points'], self.point_keys(integral)):
+                if key not in drawn_points:
+                    artist = numericintegrate.draw_point(point, trace.axes)
+                    self.point_keys_by_artist[artist] = key
+                    point_artists.append(artist)
+                    drawn_points.add(key)
+            artists = point_artists + numericintegrate.draw_integral(
+                x_data, y_data, integral, trace.axes, index + 1, render_func, grid=self.grids_by_channel.get(channel))
+            self.blit.add(artists)
             self.integral_artists.append(artists)
         self.update_integral_list()
 
+    def point_keys(self, integral):
+        """Keys (channel and coordinates) of the points of `integral`, equal for points shared with others."""
+        channel = self.experiment_params['attributes_by_gas_name'][integral['gas']]['channel']
+        return [(channel, float(x), float(y)) for x, y in integral['points']]
+
     def update_integral_list(self):
         n_labels, n_integrals = len(self.peak_list_items), len(self.integrals)
         size_diff = n_integrals - n_labels
@@ -456,7 +517,7 @@ class IntegrateControls(QGridLayout):
             # Update index readings of peak annotations for each integral, as indices may have changed
             # Annotation artist is always last in list
             self.integral_artists[index][-1].set_text(display_index)
-        self.canvas.draw()
+        self.blit.update()
 
         self.peak_list_scroll.adjustWidth()
         if n_integrals == 0:
@@ -465,11 +526,20 @@ class IntegrateControls(QGridLayout):
             self.peak_list_scroll.show()
 
     def delete_integral(self, index):
-        for artist in self.integral_artists[index]:
-            artist.remove()
-        self.integral_artists.pop(index)
-        self.canvas.draw()
+        artists = self.integral_artists.pop(index)
         self.integrals.pop(index)
+        # Shared points are only drawn with one of their integrals, so hand them over to the first remaining
+        # integral that has them rather than removing them (in front, as the annotation must stay last)
+        for artist in [artist for artist in artists if artist in self.point_keys_by_artist]:
+            key = self.point_keys_by_artist[artist]
+            owners = [
+                other_index for other_index, integral in enumerate(self.integrals) if key in self.point_keys(integral)]
+            if owners:
+                artists.remove(artist)
+                self.integral_artists[owners[0]].insert(0, artist)
+            else:
+                del self.point_keys_by_artist[artist]
+        self.blit.remove(artists)
         self.update_integral_list()
 
     def apply_to_all(self, index):
@@ -482,49 +552,44 @@ class IntegrateWindow(QMainWindow):
     # In seconds; allow injections that occur this many seconds later than a CA
     # constant-voltage trial to still be aligned to that trial
     MISALIGNMENT_TOLERANCE = 10
+    # Style of the line drawing each injection
+    LINE_STYLE = {'color': '#000000', 'marker': '.', 'markersize': 4}
 
-    def ca_init(self, ca_data, experiment_params):
+    def ca_init(self, ca_input, experiment_params):
         # Compute values that vary for each injection, namely: voltage, average current (i.e.
         # averaged over the relevant timescale immediately preceding the injection) and moles
         # of electrons (this average current times the "flow-seconds" of gas collected)
 
+        ca_data = ca_input['data']
         if not ca_data:
             for _, combined_graph in self.combined_graphs.items():
                 for attr in ['avg_current', 'mol_e', 'uncorrected_voltage', 'corrected_voltage']:
                     combined_graph[attr] = nan
             return
 
-        for _, combined_graph in self.combined_graphs.items():
+        # Align all injections at once, using the charge index built on CA file load for average currents
+        charge_index = ca_input['charge_index']
+        injection_times = [
             # Assume that all channels for the current injection have the same timestamp
-            any_channel = [ch for ch in combined_graph.values() if ch is not None][0]
+            [ch for ch in combined_graph.values() if ch is not None][0]['start_time']
+            for combined_graph in self.combined_graphs.values()
+        ]
+        alignment = physcalc.align_injections(
+            injection_offsets=charge_index.offsets(injection_times),
+            trial_end_offsets=charge_index.offsets(ca_data['end_time_by_trial']),
+            potentials_by_trial=ca_data['potentials_by_trial'], charge_index=charge_index,
+            duration=IntegrateWindow.CURRENT_AVG_DURATION, tolerance=IntegrateWindow.MISALIGNMENT_TOLERANCE,
+            Ru=experiment_params['solution_resistance'], pH=experiment_params['pH'],
+            deviation=experiment_params['ref_potential'])
+
+        for index, combined_graph in enumerate(self.combined_graphs.values()):
             # In milliamperes
-            combined_graph['avg_current'] = physcalc.average_current(
-                cyclic_amp=ca_data, end_time=any_channel['start_time'], duration=IntegrateWindow.CURRENT_AVG_DURATION)
+            combined_graph['avg_current'] = float(alignment['avg_current'][index])
             combined_graph['mol_e'] = physcalc.electrons_from_amps(
                 A=combined_graph['avg_current'] / 1000, t=experiment_params['flow_seconds'])
-
-            # Find uncorrected voltage of CA trial which the current injection was measuring
-            tolerance = timedelta(seconds=IntegrateWindow.MISALIGNMENT_TOLERANCE)
-            # Start and end CA trial timestamps such that, if an injection has a timestamp
-            # in this range, it will be aligned to that trial.
-            end_times = ca_data['end_time_by_trial']
-            trial_end_ranges = [
-                ((end_times[index - 1] + tolerance).timestamp(), (end_times[index] + tolerance).timestamp()) \
-                for index in range(1, len(end_times))
-            ]
-            injection_timestamp = any_channel['start_time'].timestamp()
-            matching_trials = [
-                index for index, trial_range in enumerate(trial_end_ranges) \
-                if trial_range[0] <= injection_timestamp <= trial_range[1]
-            ]
-            if matching_trials:
-                combined_graph['uncorrected_voltage'] = ca_data['potentials_by_trial'][matching_trials[0]]
-                combined_graph['corrected_voltage'] = physcalc.correct_voltage(
-                    V=combined_graph['uncorrected_voltage'], I=combined_graph['avg_current'] / 1000,
-                    Ru=experiment_params['solution_resistance'], pH=experiment_params['pH'],
-                    deviation=experiment_params['ref_potential'])
-            else:
-                combined_graph['uncorrected_voltage'] = combined_graph['corrected_voltage'] = nan
+            # Voltages of the CA trial which the current injection was measuring (nan if there was none)
+            combined_graph['uncorrected_voltage'] = float(alignment['uncorrected_voltage'][index])
+            combined_graph['corrected_voltage'] = float(alignment['corrected_voltage'][index])
 
     def __init__(self, all_inputs, window_title, ch_index_title, xlabel, ylabel):
         super().__init__()
@@ -545,6 +610,10 @@ class IntegrateWindow(QMainWindow):
             lambda accum, curr: accum | curr.keys(),
             [parsed_files[ch]['data'] for ch in active_channels], set())
         self.combined_graphs = {index: {ch: parsed_files[ch]['data'].get(index) for ch in active_channels} for index in all_indices}
+        # Same as `combined_graphs` but with smoothed injections, by filter name (see `smoothed_graphs`)
+        self.graphs_by_smoothing = {smoothing.NO_FILTER: self.combined_graphs}
+        self.smoothed_injections = smoothing.SmoothedInjectionCache()
+        self.smoothing = smoothing.NO_FILTER
 
         experiment_params = all_inputs['experiment_params']
         # Number of seconds of flow that are collected by the GC during an injection
@@ -554,7 +623,7 @@ class IntegrateWindow(QMainWindow):
         # sample loop volume
         experiment_params['mol_gas'] = physcalc.ideal_gas_moles(V=experiment_params['sample_vol'] / 1000)
 
-        self.ca_init(parsed_files['CA']['data'], experiment_params)
+        self.ca_init(parsed_files['CA'], experiment_params)
           
         self.main = QWidget()
         self.setCentralWidget(self.main)
@@ -571,12 +640,13 @@ class IntegrateWindow(QMainWindow):
 
         self.controls = IntegrateControls(
             self.canvas, all_inputs['experiment_params'], all_inputs['gases_by_channel'],
-            on_apply_all=self.apply_to_all)
+            on_apply_all=self.apply_to_all, on_smoothing_change=self.handle_smoothing_change)
         self.layout.addLayout(self.controls, 0, 1)
 
         self.pages = sorted([int(page) for page in self.combined_graphs])
         # Dict of lists: keyed by page/injection #, value = list of integrals for current page
         self.integrals_by_page = {page: [] for page in self.pages}
+        self.integrate_detected_peaks()
         pagination = Pagination(self.pages, handle_page_change=self.handle_page_change)
         self.layout.addLayout(pagination, 1, 0)
 
@@ -584,7 +654,12 @@ class IntegrateWindow(QMainWindow):
         done_button.clicked.connect(self.handle_done)
         self.layout.addWidget(done_button, 1, 1, alignment=Qt.AlignCenter)
 
+        # Axes and lines are kept between pages (and updated in place) until the set of channels changes
         self.axes = []
+        self.graphed_channels = []
+        self.traces_by_channel = {}
+        # Pages next to the current one are loaded and drawn ahead of time, keyed by (page, smoothing filter)
+        self.prefetcher = PagePrefetcher()
         self.graph_page(page=self.pages[0])
 
         # Canvas should take up all extra space, but should also have suitable min dimensions
@@ -600,47 +675,175 @@ class IntegrateWindow(QMainWindow):
         self.ungraph_page(old_page)
         self.graph_page(new_page)
 
+    def handle_smoothing_change(self, filter_name):
+        self.smoothing = filter_name
+        self.ungraph_page(self.curr_page)
+        self.graph_page(self.curr_page)
+
+    def smoothed_graphs(self, filter_name):
+        """
+        `combined_graphs` with every injection smoothed by `filter_name` (key of `smoothing.FILTERS`). Each
+        injection is only smoothed once its signal is first used (or ahead of time by `smooth_pages`), and
+        is kept in `smoothed_injections` for as long as its memory budget allows.
+        """
+        if filter_name not in self.graphs_by_smoothing:
+            self.graphs_by_smoothing[filter_name] = {
+                page: {**combined_graph, **{
+                    channel: self.smoothed_injections.view(filter_name, (page, channel), combined_graph[channel])
+                    for channel in channels if combined_graph.get(channel)
+                }} for page, combined_graph in self.combined_graphs.items()
+            }
+        return self.graphs_by_smoothing[filter_name]
+
+    def smooth_pages(self, filter_name, pages, page_channels=channels):
+        """Smooth the injections of `page_channels` on all of `pages` by `filter_name` together, ahead of use."""
+        if filter_name == smoothing.NO_FILTER:
+            return
+        graphs = self.smoothed_graphs(filter_name)
+        self.smoothed_injections.prepare([
+            graphs[page][channel] for page in pages for channel in page_channels if graphs[page].get(channel)
+        ])
+
     def ungraph_page(self, page):
         """
         After finishing with current page and before graphing next page, do necessary cleanup
         and saving of integration-related information.
         """
+        # The whole figure is redrawn for the next page, so skip blitting the removal of this page's artists
+        self.controls.blit.invalidate()
         self.integrals_by_page[page] = self.controls.get_integrals_and_clear()
         self.controls.stop_integration(did_succeed=False)
+
+    def layout_axes(self, active_channels):
+        """Replace the current axes with one (holding an empty `DecimatedLine`) per channel in `active_channels`."""
         for ax in self.axes:
             ax.remove()
+        self.axes = [self.canvas.figure.add_subplot(len(active_channels), 1, i) for i in range(1, len(active_channels) + 1)]
+        self.traces_by_channel = {}
+        for channel, ax in zip(active_channels, self.axes):
+            ax.set_xlabel(self.xlabel)
+            ax.set_ylabel(self.ylabel)
+            self.traces_by_channel[channel] = DecimatedLine(ax, **IntegrateWindow.LINE_STYLE)
+        self.graphed_channels = active_channels
 
     def graph_page(self, page):
         self.curr_page = page
-        curr_graph = self.combined_graphs[page]
+        # The page and those about to be prefetched around it are smoothed in one batch
+        self.smooth_pages(self.smoothing, [page] + self.neighbour_pages(page))
+        curr_graph = self.smoothed_graphs(self.smoothing)[page]
         active_channels = [ch for ch in channels if curr_graph.get(ch)]
-        self.axes = [self.canvas.figure.add_subplot(len(active_channels), 1, i) for i in range(1, len(active_channels) + 1)]
+        # Layout only needs recomputing when the channels (and so the axes) change
+        relayout = active_channels != self.graphed_channels
+        if relayout:
+            self.layout_axes(active_channels)
+        # Page as drawn ahead of time by the prefetcher, if it was (and still fits the figure)
+        prepared = None if relayout else self.prefetcher.take((page, self.smoothing), figure_layout(self.canvas.figure))
+
+        grids_by_channel = {}
+        for index, (channel, ax) in enumerate(zip(active_channels, self.axes)):
+            ax.set_title(self.ch_index_title.format(channel, page))
+            self.traces_by_channel[channel].set_injection(curr_graph[channel])
+            grids_by_channel[channel] = curr_graph[channel].grid
+            # Fit the view to the new data; autoscaling then stays off so we can draw integration related
+            # objects without worrying about disorienting rescaling
+            if prepared is None:
+                ax.relim()
+                ax.autoscale(True)
+                ax.autoscale_view()
+                ax.autoscale(False)
+            else:
+                xlim, ylim = prepared['limits'][index]
+                ax.set_xlim(xlim)
+                ax.set_ylim(ylim)
 
-        lines_by_channel = {}
-        for index, ax in enumerate(self.axes):
-            curr_channel = active_channels[index]
-            ax.set_title(self.ch_index_title.format(curr_channel, page))
-            ax.set_xlabel(self.xlabel)
-            ax.set_ylabel(self.ylabel)
-            lines = ax.plot(
-                curr_graph[curr_channel]['x'], curr_graph[curr_channel]['y'],
-                color='#000000', marker='.', markersize=4, pickradius=4, picker=True)
-            lines_by_channel[curr_channel] = lines[0]
-        
         self.controls.set_injection_params(curr_graph['mol_e'], curr_graph['avg_current'])
-        self.controls.set_active_channels(active_channels, lines_by_channel)
+        self.controls.set_active_channels(active_channels, dict(self.traces_by_channel), grids_by_channel)
         self.controls.set_integrals(self.integrals_by_page[page])
-        
+
+        # Navigation history (and home view) starts over on each page
         self.toolbar.update()
-        self.canvas.figure.tight_layout()
+        if relayout:
+            self.canvas.figure.tight_layout()
+        if prepared is None:
+            self.canvas.draw()
+        else:
+            self.controls.blit.show_background(prepared['background'])
+        self.prefetch_neighbours(page)
 
-        # Disable autoscaling after initial draw so we can draw integration related objects
-        # without worrying about disorienting rescaling
-        for ax in self.axes:
-            ax.autoscale(True)
-        self.canvas.draw()
-        for ax in self.axes:
-            ax.autoscale(False)
+    def neighbour_pages(self, page):
+        """
+        Pages within `PREFETCH_RADIUS` of `page`, nearest and following pages first (as paging forward is
+        most common).
+        """
+        page_index = self.pages.index(page)
+        return [
+            self.pages[neighbour_index]
+            for distance in range(1, PREFETCH_RADIUS + 1)
+            for neighbour_index in (page_index + distance, page_index - distance)
+            if 0 <= neighbour_index < len(self.pages)
+        ]
+
+    def prefetch_neighbours(self, page):
+        """Start preparing the neighbouring pages of `page` that have the same channels as the current one."""
+        self.prefetcher.collect()
+        self.prefetcher.cancel()
+        layout = figure_layout(self.canvas.figure)
+        graphs = self.smoothed_graphs(self.smoothing)
+        for neighbour in self.neighbour_pages(page):
+            graph = graphs[neighbour]
+            if [ch for ch in channels if graph.get(ch)] != self.graphed_channels:
+                continue
+            titles = [self.ch_index_title.format(channel, neighbour) for channel in self.graphed_channels]
+            self.prefetcher.prefetch(
+                (neighbour, self.smoothing), layout, titles, self.xlabel, self.ylabel,
+                [graph[channel] for channel in self.graphed_channels], IntegrateWindow.LINE_STYLE)
+
+    def closeEvent(self, event):
+        self.prefetcher.shutdown()
+        super().closeEvent(event)
+
+    def integrate_detected_peaks(self):
+        """
+        Pre-integrate the peak of each gas with a retention window on every page, so that the user only needs
+        to review (and adjust or delete) these integrals. Gases with neither a minimum nor a maximum retention
+        time are left for the user to integrate by hand.
+        """
+        experiment_params = self.all_inputs['experiment_params']
+        baseline_type = self.controls.baseline_type.currentText()
+        for gas, gas_attrs in experiment_params['attributes_by_gas_name'].items():
+            retention_min, retention_max = gas_attrs.get('retention_min'), gas_attrs.get('retention_max')
+            if retention_min is None and retention_max is None:
+                continue
+            channel = gas_attrs['channel']
+            pages = [page for page in self.pages if self.combined_graphs[page].get(channel)]
+            # The whole run is integrated in chunks; injections loaded lazily just for this are dropped after
+            # each chunk so that they don't push the ones being viewed out of memory
+            integrals_by_page = {}
+            for chunk_start in range(0, len(pages), numericintegrate.SPREAD_CHUNK_SIZE):
+                injections_by_page = {
+                    page: self.combined_graphs[page][channel]
+                    for page in pages[chunk_start:chunk_start + numericintegrate.SPREAD_CHUNK_SIZE]
+                }
+                unloaded = [
+                    injection for injection in injections_by_page.values()
+                    if not getattr(injection, 'is_loaded', True)
+                ]
+                integrals_by_page.update(peakdetect.integrate_detected(
+                    injections_by_page, retention_min, retention_max, baseline_type))
+                for injection in unloaded:
+                    injection.release()
+            for page, curr_integral in integrals_by_page.items():
+                curr_graph = self.combined_graphs[page]
+                final_integral = numericintegrate.interpret_integral(
+                    integral=curr_integral, total_gas_mol=experiment_params['mol_gas'],
+                    mol_e=curr_graph['mol_e'], calib_val=gas_attrs['calibration_value'],
+                    reduction_count=gas_attrs['reduction_count'], avg_current=curr_graph['avg_current'])
+                self.integrals_by_page[page].append({
+                    **final_integral,
+                    'mode': 'Trapezoidal',
+                    'gas': gas,
+                    'smoothing': smoothing.NO_FILTER,
+                })
 
     def apply_to_all(self, integral, display_index):
         experiment_params = self.all_inputs['experiment_params']
@@ -658,22 +861,21 @@ class IntegrateWindow(QMainWindow):
             return
         
         
-        for page in target_pages:
+        # Integrate every target page in batches; pages whose graphs don't extend as far as this peak are skipped
+        # Spread over signals smoothed the same way as those of the original integral, a chunk of pages at a
+        # time so that each chunk is smoothed in one batch and stays within the smoothing cache's budget
+        filter_name = integral.get('smoothing', smoothing.NO_FILTER)
+        graphs = self.smoothed_graphs(filter_name)
+        reference = graphs[self.curr_page][channel]
+        integrals_by_page = {}
+        for chunk_start in range(0, len(target_pages), smoothing.CHUNK_SIZE):
+            chunk = target_pages[chunk_start:chunk_start + smoothing.CHUNK_SIZE]
+            self.smooth_pages(filter_name, chunk, [channel])
+            # Points are moved by each injection's retention time drift relative to the current one
+            integrals_by_page.update(numericintegrate.spread(
+                integral, {page: graphs[page][channel] for page in chunk}, reference=reference))
+        for page, curr_integral in integrals_by_page.items():
             curr_graph = self.combined_graphs[page]
-
-            x, y = [curr_graph[channel][axis] for axis in ['x', 'y']]
-            # Recalculate point positions
-            new_points = []
-            for point in integral['points']:
-                if point[0] < x[0] or point[0] > x[-1]:
-                    return # Ignore graphs that don't extend as far as this peak
-                new_index = np.searchsorted(x, point[0])
-                new_x, new_y = x[new_index], y[new_index]
-                new_points.append((new_x, new_y))
-
-            curr_integral = numericintegrate.INTEGRATION_BY_MODE[integral['mode']](
-                x, y, new_points, integral['baseline_type'])
-            
             final_integral = numericintegrate.interpret_integral(
                 integral=curr_integral, total_gas_mol=experiment_params['mol_gas'],
                 mol_e=curr_graph['mol_e'], calib_val=gas_attrs['calibration_value'],
@@ -683,6 +885,7 @@ class IntegrateWindow(QMainWindow):
                 **final_integral,
                 'mode': integral['mode'],
                 'gas': integral['gas'],
+                'smoothing': integral.get('smoothing', smoothing.NO_FILTER),
             })
 
     def handle_done(self):
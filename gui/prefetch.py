@@ -0,0 +1,115 @@
+"""
+Background preparation of the pages next to the one being viewed, so that paging through injections
+doesn't wait on loading, decimating and drawing each one. Pages are prepared on a worker thread and kept
+in a least-recently-used cache bounded in bytes.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from gui.graphshared import DecimatedLine
+
+# Number of pages prepared on either side of the current page
+PREFETCH_RADIUS = 1
+# Largest total size (in bytes) of the rendered backgrounds kept at once
+CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+def figure_layout(figure):
+    """
+    Everything about `figure` that a prepared page must match to be shown on it: its size in pixels and
+    resolution, and the position of each of its axes.
+    """
+    return (figure.bbox.bounds, figure.dpi, tuple(ax.get_position().bounds for ax in figure.axes))
+
+def render_page(layout, titles, xlabel, ylabel, injections, line_kwargs):
+    """
+    Draw the page of `injections` (one per axes, titled by `titles`) offscreen, on a figure matching
+    `layout` (see `figure_layout`) with each injection drawn by a `DecimatedLine` with `line_kwargs`,
+    the axes limits fitted to the data, and nothing else.
+
+    Returns a dict of 'background': the rendered figure (from `copy_from_bbox`), 'limits': the
+    (xlim, ylim) of each axes and 'nbytes': the size of the rendering.
+    """
+    (_, _, width, height), dpi, positions = layout
+    figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(figure)
+    limits, traces = [], []
+    for position, title, injection in zip(positions, titles, injections):
+        ax = figure.add_axes(position)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        # Computes the injection's envelope too, which is kept with it for when the page is shown
+        trace = DecimatedLine(ax, **line_kwargs)
+        trace.set_injection(injection)
+        # Kept until drawn, as axes only hold weak references to the lines' xlim callbacks
+        traces.append(trace)
+        ax.relim()
+        ax.autoscale_view()
+        limits.append((ax.get_xlim(), ax.get_ylim()))
+    canvas.draw()
+    return {
+        'background': canvas.copy_from_bbox(figure.bbox),
+        'limits': limits,
+        'nbytes': int(width * height * 4),
+    }
+
+class PagePrefetcher:
+    """
+    Prepares pages (with `render_page`) on a worker thread ahead of their being shown, keyed by any
+    hashable key (e.g. the page number along with anything else the rendering depends on).
+    """
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.max_bytes = max_bytes
+        self.pending = {}
+        self.prepared = OrderedDict()
+        self.prepared_bytes = 0
+
+    def prefetch(self, key, layout, *render_args):
+        """Start preparing the page for `key` on `layout` (see `render_page`) unless it already is."""
+        previous = self.prepared.get(key)
+        if key in self.pending or (previous is not None and previous['layout'] == layout):
+            return
+        self.pending[key] = (layout, self.executor.submit(render_page, layout, *render_args))
+
+    def take(self, key, layout):
+        """
+        The page prepared for `key`, if any, as from `render_page` (waiting for it if it's being prepared
+        right now, but not if it hasn't been started), or None if there is none prepared for `layout`.
+        """
+        if key in self.pending:
+            pending_layout, future = self.pending.pop(key)
+            if future.cancel() or future.exception() is not None:
+                # Page will be drawn as usual instead
+                return None
+            self.store(key, {**future.result(), 'layout': pending_layout})
+        prepared = self.prepared.get(key)
+        if prepared is None or prepared['layout'] != layout:
+            return None
+        self.prepared.move_to_end(key)
+        return prepared
+
+    def store(self, key, prepared):
+        if key in self.prepared:
+            self.prepared_bytes -= self.prepared.pop(key)['nbytes']
+        self.prepared[key] = prepared
+        self.prepared_bytes += prepared['nbytes']
+        while self.prepared_bytes > self.max_bytes and len(self.prepared) > 1:
+            _, evicted = self.prepared.popitem(last=False)
+            self.prepared_bytes -= evicted['nbytes']
+
+    def collect(self):
+        """Move every page finished preparing into the cache."""
+        for key in [key for key, (_, future) in self.pending.items() if future.done()]:
+            layout, future = self.pending.pop(key)
+            if not future.cancelled() and future.exception() is None:
+                self.store(key, {**future.result(), 'layout': layout})
+
+    def cancel(self):
+        """Drop every page not yet started, e.g. when the user has moved on from the pages around them."""
+        for key in [key for key, (_, future) in self.pending.items() if future.cancel()]:
+            del self.pending[key]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,6 @@
 from itertools import chain
 import json
+import multiprocessing
 import sys
 import os
 from PySide2.QtWidgets import (
@@ -246,4 +247,6 @@ def main():
     qapp.exec_()
 
 if __name__ == '__main__':
+    # Required for file parsing worker processes to start correctly in frozen executables
+    multiprocessing.freeze_support()
     main()